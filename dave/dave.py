@@ -27,6 +27,7 @@ from PyQt4 import QtCore, QtGui
 import sc_library.hdebug as hdebug
 
 # General
+import daveActions
 import notifications
 import sequenceGenerator
 import sequenceViewer
@@ -43,12 +44,16 @@ import sc_library.parameters as params
 
 ## CommandEngine
 #
-# This class handles the execution of commands that can be given to Dave
+# This class handles the execution of commands that can be given to Dave.
+# More than one command can be in progress at the same time (up to
+# max_in_flight), the commands can complete in any order. During a
+# run only commands in different HAL dispatch queues can be in progress
+# at the same time (see canOverlap()).
 #
 class CommandEngine(QtCore.QObject):
-    done = QtCore.pyqtSignal()
+    done = QtCore.pyqtSignal(object)
     paused = QtCore.pyqtSignal()
-    problem = QtCore.pyqtSignal(object)
+    problem = QtCore.pyqtSignal(object, object)
     
     ## __init__
     #
@@ -58,7 +63,9 @@ class CommandEngine(QtCore.QObject):
         QtCore.QObject.__init__(self, parent)
 
         # Set defaults
-        self.command = None
+        self.aborting = False
+        self.commands = []
+        self.max_in_flight = 1
         
         self.test_mode = False
         
@@ -74,11 +81,70 @@ class CommandEngine(QtCore.QObject):
     
     ## abort
     #
-    # Aborts the current action (if any).
+    # Aborts the current action(s) (if any). The done signal is only
+    # emitted once, when the last action has been aborted.
     #
     @hdebug.debug
     def abort(self):
-        self.command.abort()
+        self.aborting = True
+        for command in self.commands[:]:
+            command.abort()
+        self.aborting = False
+
+    ## canOverlap
+    #
+    # A command can be started while other commands are in progress if it
+    # and all the commands in progress have a queue, and the queues are all
+    # different, e.g. a stage move while the directory is being set. Nothing
+    # is started while a command that pauses the run (see shouldPause()) is
+    # in progress.
+    #
+    # @param command The command (DaveAction) to start.
+    #
+    # @return True/False the command can be started without waiting for the current command(s).
+    #
+    def canOverlap(self, command):
+        if not self.canStartCommand() or (command.getQueue() is None):
+            return False
+        for a_command in self.commands:
+            if a_command.shouldPause():
+                return False
+            if (a_command.getQueue() is None) or (a_command.getQueue() == command.getQueue()):
+                return False
+        return True
+
+    ## canStartCommand
+    #
+    # @return True/False another command can be started without waiting for the current command(s).
+    #
+    def canStartCommand(self):
+        return (len(self.commands) < self.max_in_flight)
+
+    ## findCommand
+    #
+    # @param message A TCP message object.
+    #
+    # @return The command (DaveAction) in progress that the message belongs to.
+    #
+    def findCommand(self, message):
+        for command in self.commands:
+            if command.message is not None and (command.message.getID() == message.getID()):
+                return command
+        raise Exception("No command in progress for message " + str(message.getID()))
+
+    ## isBusy
+    #
+    # @return True/False there are commands in progress.
+    #
+    def isBusy(self):
+        return (len(self.commands) > 0)
+
+    ## setMaxInFlight
+    #
+    # @param max_in_flight The maximum number of commands that can be in progress at the same time.
+    #
+    def setMaxInFlight(self, max_in_flight):
+        self.max_in_flight = max(1, max_in_flight)
 
     ## startCommand
     #
@@ -88,45 +154,52 @@ class CommandEngine(QtCore.QObject):
     # @param test_mode (Optional) Run the command in test mode.
     #
     def startCommand(self, command, test_mode = False):
-        self.command = command
+        self.commands.append(command)
 
         # Connect signals.
-        self.command.complete_signal.connect(self.handleActionComplete)
-        self.command.error_signal.connect(self.handleErrorSignal)
+        command.complete_signal.connect(self.handleActionComplete)
+        command.error_signal.connect(self.handleErrorSignal)
             
         # Start command.
-        if (self.command.getActionType() == "hal"):
-            self.command.start(self.HALClient, test_mode)
-        elif (self.command.getActionType() == "kilroy"):
-            self.command.start(self.kilroyClient, test_mode)
-        elif (self.command.getActionType() == "NA"):
-            self.command.start(False, test_mode)
+        if (command.getActionType() == "hal"):
+            command.start(self.HALClient, test_mode)
+        elif (command.getActionType() == "kilroy"):
+            command.start(self.kilroyClient, test_mode)
+        elif (command.getActionType() == "NA"):
+            command.start(False, test_mode)
         else:
-            raise Exception("No TCPClient for " + self.command.getActionType())
+            raise Exception("No TCPClient for " + command.getActionType())
 
     ## handleActionComplete
     #
-    # Handle the completion of the previous action
+    # Handle the completion of an action
     #
     def handleActionComplete(self, message):
-        self.command.cleanUp()
-        self.command.complete_signal.disconnect()
-        self.command.error_signal.disconnect()
+        command = self.findCommand(message)
+        self.commands.remove(command)
+        command.cleanUp()
+        command.complete_signal.disconnect()
+        command.error_signal.disconnect()
 
         # Configure the command engine to pause after completion of the command sequence
-        if self.command.shouldPause() and not message.isTest():
+        if command.shouldPause() and not message.isTest():
             self.should_pause = True
             self.paused.emit()
-        
-        self.done.emit()
+
+        if not (self.aborting and self.isBusy()):
+            self.done.emit(command)
 
     ## handleErrorSignal
     #
     # Handle an error signal
     #
+    # During a run the other commands in progress (if any) are aborted.
+    #
     def handleErrorSignal(self, message):
-        self.problem.emit(message)
+        self.problem.emit(self.findCommand(message), message)
         self.handleActionComplete(message)
+        if not message.isTest():
+            self.abort()
 
 ## Dave
 #
@@ -356,15 +429,30 @@ class Dave(QtGui.QMainWindow):
     #
     # Handles completion of the current command engine.  
     #
+    # @param command (Optional) The command (DaveAction) that was completed.
+    #
     @hdebug.debug
-    def handleDone(self):
+    def handleDone(self, command = None):
         # Handle updating usage information if in test mode
         if self.test_mode:
-            self.ui.commandSequenceTreeView.updateEstimates()
+            self.ui.commandSequenceTreeView.updateEstimates(command)
+
+        # During a run, start the commands that can run at the same time as
+        # the command(s) in progress, otherwise wait for them to finish.
+        if not self.test_mode:
+            if self.startRunCommands():
+                self.updateRunStatusDisplay()
+                return
+            if self.command_engine.isBusy():
+                return
 
         # Increment command to the next valid command / action.
         next_command = self.ui.commandSequenceTreeView.getNextItem()
 
+        # Wait for the commands that are still in progress.
+        if (next_command is None) and self.command_engine.isBusy():
+            return
+
         # Handle last command in list.
         if next_command is None:
             self.ui.runButton.setText("Start")
@@ -397,6 +485,9 @@ class Dave(QtGui.QMainWindow):
             if self.running: 
                 self.command_engine.startCommand(next_command.getDaveAction(), 
                                                  self.test_mode)
+                self.prepareNextMovie(next_command.getDaveAction())
+                self.startRunCommands()
+                self.startTestCommands()
             else: 
                 self.handlePause()
 
@@ -502,12 +593,12 @@ class Dave(QtGui.QMainWindow):
     # Handles the problem signal from the movie engine. Notifies the operator by e-mail if requested.
     # Displays a dialog box describing the problem.
     #
+    # @param command The command (DaveAction) that had the problem.
     # @param message The problem message from the movie engine.
     #
     @hdebug.debug
-    def handleProblem(self, message):
-        current_item = self.ui.commandSequenceTreeView.getCurrentItem()
-        message_str = current_item.getDaveAction().getDescriptor() + "\n" + message.getErrorMessage()
+    def handleProblem(self, command, message):
+        message_str = command.getDescriptor() + "\n" + message.getErrorMessage()
         if not self.test_mode:
 
             # Pause Dave.
@@ -528,7 +619,7 @@ class Dave(QtGui.QMainWindow):
                                           message_str)
 
         else: # Test mode
-            self.ui.commandSequenceTreeView.setCurrentItemValid(False)
+            self.ui.commandSequenceTreeView.setActionValid(command, False)
             message_str += "\nSuppress remaining warnings?"
             if not self.skip_warning:
                 messageBox = QtGui.QMessageBox(parent = self)
@@ -542,7 +633,7 @@ class Dave(QtGui.QMainWindow):
                 if button_ID == QtGui.QMessageBox.YesToAll:
                     self.skip_warning = True # Skip additional warnings
 
-            print "Invalid command: " + current_item.getDaveAction().getDescriptor()
+            print "Invalid command: " + command.getDescriptor()
 
     ## handleRunButton
     #
@@ -597,8 +688,11 @@ class Dave(QtGui.QMainWindow):
             self.ui.validateSequenceButton.setEnabled(False)
             self.running = True
             self.updateRunStatusDisplay()
+            self.command_engine.setMaxInFlight(self.parameters.get("run_in_flight", 3))
             self.command_engine.startCommand(self.ui.commandSequenceTreeView.getCurrentItem().getDaveAction(),
                                              self.test_mode)
+            self.prepareNextMovie(self.ui.commandSequenceTreeView.getCurrentItem().getDaveAction())
+            self.startRunCommands()
 
     ## handleSendTestEmail
     #
@@ -638,9 +732,11 @@ class Dave(QtGui.QMainWindow):
             self.updateRunStatusDisplay()
             self.ui.commandSequenceTreeView.setTestMode(True)
 
-            # Send first command.
+            # Send the first commands.
+            self.command_engine.setMaxInFlight(self.parameters.get("validation_in_flight", 8))
             self.command_engine.startCommand(self.ui.commandSequenceTreeView.getCurrentItem().getDaveAction(),
                                              self.test_mode)
+            self.startTestCommands()
 
         # Mark all commands as invalid
         else: 
@@ -689,6 +785,59 @@ class Dave(QtGui.QMainWindow):
                 self.ui.abortButton.setEnabled(False)
                 self.ui.validateSequenceButton.setEnabled(True)
 
+    ## prepareNextMovie
+    #
+    # When a movie is started, tell HAL about the next movie in the
+    # sequence so that HAL can get ready for it during the current movie.
+    #
+    # @param dave_action The DaveAction that was just started.
+    #
+    def prepareNextMovie(self, dave_action):
+        if self.test_mode or not self.parameters.get("prepare_next_movie", True):
+            return
+        if isinstance(dave_action, daveActions.DATakeMovie):
+            next_movie = self.ui.commandSequenceTreeView.findNextAction(daveActions.DATakeMovie)
+            if next_movie is not None:
+                next_movie.prepare(self.command_engine.HALClient)
+
+    ## startRunCommands
+    #
+    # During a run, start the next commands while they can run at the same
+    # time as the command(s) in progress (see CommandEngine.canOverlap()).
+    #
+    # @return True/False if any commands were started.
+    #
+    def startRunCommands(self):
+        started = False
+        while self.running and (not self.test_mode) and self.command_engine.isBusy():
+            next_action = self.ui.commandSequenceTreeView.findNextAction(daveActions.DaveAction)
+            if (next_action is None) or (not self.command_engine.canOverlap(next_action)):
+                break
+            next_command = self.ui.commandSequenceTreeView.getNextItem()
+            if next_command is None:
+                break
+            self.command_engine.startCommand(next_command.getDaveAction(),
+                                             self.test_mode)
+            self.prepareNextMovie(next_command.getDaveAction())
+            started = True
+        return started
+
+    ## startTestCommands
+    #
+    # When validating, the commands do not depend on each other so we do not
+    # have to wait for a reply before sending the next command. This starts
+    # commands until the command engine has as many in progress as it allows.
+    #
+    def startTestCommands(self):
+        while self.test_mode and self.running and self.command_engine.canStartCommand():
+            if not self.ui.commandSequenceTreeView.haveNextItem():
+                break
+            next_command = self.ui.commandSequenceTreeView.getNextItem()
+            if next_command is None:
+                break
+            self.command_engine.startCommand(next_command.getDaveAction(),
+                                             self.test_mode)
+
     ## updateEstimates
     #
     # Update disk and duration estimates
@@ -765,7 +914,7 @@ if __name__ == "__main__":
     parameters = params.parameters("settings_default.xml")
     
     # Start logger.
-    hdebug.startLogging(parameters.directory + "logs/", "dave")
+    hdebug.startLogging(parameters.directory + "logs/", "dave", trace = parameters.get("want_trace", False))
 
     # Load app.
     window = Dave(parameters)
@@ -51,6 +51,7 @@ class DaveAction(QtCore.QObject):
         self.id = None
         self.tcp_client = None
         self.message = None
+        self.queue = None
         self.valid = True
 
         # Define pause behaviors
@@ -76,7 +77,7 @@ class DaveAction(QtCore.QObject):
     # Handle clean up of the action
     #
     def cleanUp(self):
-        self.tcp_client.messageReceived.disconnect()
+        self.tcp_client.messageReceived.disconnect(self.handleMessage)
         self.resetPause() # Allow a paused action to be rerun without a pause
 
     ## createETree
@@ -167,6 +168,17 @@ class DaveAction(QtCore.QObject):
         else:
             return [None,None]
 
+    ## getQueue
+    #
+    # Actions whose messages go into a HAL dispatch queue (see hal4000/halTcpControl.py)
+    # and that do not depend on the actions before them have a queue. During a run these
+    # can be in progress at the same time as actions in other queues.
+    #
+    # @return The HAL dispatch queue of the action, or None if the action has to run on its own.
+    #
+    def getQueue(self):
+        return self.queue
+
     ## getUsage
     #
     # @return Disk usage.
@@ -174,6 +186,18 @@ class DaveAction(QtCore.QObject):
     def getUsage(self):
         return self.disk_usage
 
+    ## handleMessage
+    #
+    # Handle a message from the TCP client. The client can have more than one
+    # message in flight, so replies to the messages of other actions are ignored.
+    #
+    # @param message A TCP message object
+    #
+    def handleMessage(self, message):
+        if not (message.getID() == self.message.getID()) and self.tcp_client.isPending(message.getID()):
+            return
+        self.handleReply(message)
+
     ## handleReply
     #
     # handle the return of a message
@@ -185,10 +209,11 @@ class DaveAction(QtCore.QObject):
         # Stop lost message timer
         self.lost_message_timer.stop()
 
-        # Check to see if the same message got returned
+        # Check to see if the same message got returned. The error is reported
+        # with our own message so that the command engine can find this action.
         if not (message.getID() == self.message.getID()):
-            message.setError(True, "Communication Error: Incorrect Message Returned")
-            self.completeActionWithError(message)
+            self.message.setError(True, "Communication Error: Incorrect Message Returned")
+            self.completeActionWithError(self.message)
         elif message.hasError():
             self.completeActionWithError(message)
         else: # Correct message and no error
@@ -277,7 +302,7 @@ class DaveAction(QtCore.QObject):
         self.tcp_client = tcp_client
         self.message.setTestMode(test_mode)
 
-        self.tcp_client.messageReceived.connect(self.handleReply)
+        self.tcp_client.messageReceived.connect(self.handleMessage)
         if self.message.isTest():
             self.lost_message_timer.start(self.lost_message_delay)
         self.tcp_client.sendMessage(self.message)
@@ -534,6 +559,7 @@ class DAMoveStage(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.queue = "stage"
 
     ## createETree
     #
@@ -698,6 +724,7 @@ class DASetDirectory(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.queue = "film"
 
     ## createETree
     #
@@ -843,6 +870,7 @@ class DASetProgression(DaveAction):
         DaveAction.__init__(self)
 
         self.action_type = "hal"
+        self.queue = "progressions"
 
     ## createETree
     #
@@ -994,6 +1022,20 @@ class DATakeMovie(DaveAction):
             message.setError(True, err_str)
         DaveAction.handleReply(self,message)                
 
+    ## prepare
+    #
+    # Tell Hal the name and length of this movie so that it can get
+    # ready for it while the current movie is being taken. The reply
+    # is not needed, if Hal is not ready the movie just starts slower.
+    #
+    # @param tcp_client The TCP client to use for communication.
+    #
+    def prepare(self, tcp_client):
+        prepare_message = tcpMessage.TCPMessage(message_type = "Prepare Movie",
+                                                message_data = {"name" : self.name,
+                                                                "length" : self.length})
+        tcp_client.sendMessage(prepare_message)
+
     ## setup
     #
     # Perform post creation initialization.
@@ -116,6 +116,16 @@ class DaveCommandTreeViewer(QtGui.QTreeView):
         self.reset()
         self.aborted = True
 
+    ## findNextAction
+    #
+    # @param action_class A DaveAction class, e.g. daveActions.DATakeMovie.
+    #
+    # @return The next valid DaveAction of this class after the current item, or None.
+    #
+    def findNextAction(self, action_class):
+        if self.dv_model is not None:
+            return self.dv_model.findNextAction(action_class)
+
     ## getActionTypes
     #
     # @return A list of DaveAction types (i.e. "hal" or "kilroy").
@@ -283,6 +293,15 @@ class DaveCommandTreeViewer(QtGui.QTreeView):
             self.dv_model.setCurrentAction(an_item)
             self.viewportUpdate()
 
+    ## setActionValid
+    #
+    # @param dave_action A DaveAction.
+    # @param is_valid True/False determines the validity of the item(s) with this action.
+    #
+    def setActionValid(self, dave_action, is_valid):
+        if self.dv_model is not None:
+            self.dv_model.setActionValid(dave_action, is_valid)
+
     ## setCurrentItemValidity
     #
     # @param is_valid True/False determines the validity of the currentItem(s)
@@ -310,9 +329,11 @@ class DaveCommandTreeViewer(QtGui.QTreeView):
 
     ## updateEstimates
     #
-    def updateEstimates(self):
+    # @param dave_action (Optional) The DaveAction to use, defaults to the action of the current item.
+    #
+    def updateEstimates(self, dave_action = None):
         if self.dv_model is not None:
-            self.dv_model.updateEstimates()
+            self.dv_model.updateEstimates(dave_action)
         
     ## viewportUpdate
     #
@@ -369,6 +390,17 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
                 self.dave_actions_test_dict[action_id] = [dave_action_si] # Start list
             else: # Add to current list of actions with the same id
                 self.dave_actions_test_dict[action_id].append(dave_action_si)
+
+    ## findNextAction
+    #
+    # @param action_class A DaveAction class.
+    #
+    # @return The next valid DaveAction of this class after the current item, or None.
+    #
+    def findNextAction(self, action_class):
+        for item in self.dave_actions_cur[self.dave_action_index+1:]:
+            if item.isValid() and isinstance(item.getDaveAction(), action_class):
+                return item.getDaveAction()
         
     ## getActionTypes
     #
@@ -485,6 +517,22 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
         for item in self.dave_actions_all:
             item.setValid(valid)
 
+    ## setActionValid
+    #
+    # @param dave_action A DaveAction.
+    # @param is_valid True/False determines the validity of the item(s) with this action.
+    #
+    def setActionValid(self, dave_action, is_valid):
+        if self.test_mode:
+            # Change validity of all actions that have the same id
+            for item in self.dave_actions_test_dict[dave_action.getID()]:
+                item.setValid(is_valid)
+
+        else:
+            for item in self.dave_actions_cur:
+                if (item.getDaveAction() == dave_action):
+                    item.setValid(is_valid)
+
     ## setCurrentItem
     #
     # @param an_item The desired DaveActionStandardItem.
@@ -537,12 +585,15 @@ class DaveStandardItemModel(QtGui.QStandardItemModel):
 
     ## updateEstimates
     #
-    def updateEstimates(self):
+    # @param current_action (Optional) The DaveAction to use, defaults to the action of the current item.
+    #
+    def updateEstimates(self, current_action = None):
         if self.test_mode: # Only needed in test mode
 
             # Find current id and the current disk usage and duration.
-            current_item = self.dave_actions_cur[self.dave_action_index]
-            current_action = current_item.getDaveAction()
+            if current_action is None:
+                current_item = self.dave_actions_cur[self.dave_action_index]
+                current_action = current_item.getDaveAction()
             current_id = current_action.getID()
             disk_usage = current_action.getUsage()
             duration = current_action.getDuration()
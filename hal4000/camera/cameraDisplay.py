@@ -11,6 +11,8 @@
 # Hazen 02/14
 #
 
+import time
+
 from PyQt4 import QtCore, QtGui
 
 # Debugging
@@ -36,7 +38,8 @@ class CameraDisplay(QtGui.QFrame):
     ## __init__
     #
     # Create a CameraDisplay object. This object updates the image that it
-    # displays at 10Hz.
+    # displays at up to 20Hz. The actual rate depends on how long it takes
+    # to draw the image and how busy the event loop is (see displayFrame).
     #
     # @param display_module The python module that implements the camera display widget.
     # @param parameters A parameters object.
@@ -55,14 +58,18 @@ class CameraDisplay(QtGui.QFrame):
         self.color_table = 0
         self.color_tables = colorTables.ColorTables("./colorTables/all_tables/")
         self.cycle_length = 0
+        self.display_frame = False
         self.display_timer = QtCore.QTimer(self)
         self.filming = False
         self.frame = False
+        self.last_display_time = 0.0
+        self.last_draw_time = 0.0
         self.max_intensity = parameters.get("max_intensity")
         self.parameters = parameters
         self.show_grid = 0
         self.show_info = 1
         self.show_target = 0
+        self.sync = parameters.getter("sync")
         self.which_camera = which_camera
 
         # UI setup.
@@ -119,6 +126,14 @@ class CameraDisplay(QtGui.QFrame):
         self.ui.targetAct.triggered.connect(self.handleTarget)
 
         # Display timer
+        #
+        # The interval (in milliseconds) is adjusted so that drawing takes
+        # at most display_load of the time, and so that the display backs
+        # off if the timer is firing late because the event loop is busy.
+        self.display_load = 0.2
+        self.display_cost = 0.0
+        self.max_display_interval = 500
+        self.min_display_interval = 50
         self.display_timer.setInterval(100)
         self.display_timer.timeout.connect(self.displayFrame)
         self.display_timer.start()
@@ -155,6 +170,7 @@ class CameraDisplay(QtGui.QFrame):
         self.color_table = self.color_tables.getTableByName(self.parameters.get("colortable"))
         self.camera_widget.newColorTable(self.color_table)
         self.color_gradient.newColorTable(self.color_table)
+        self.display_frame = False
 
     ## contextMenuEvent
     #
@@ -171,11 +187,38 @@ class CameraDisplay(QtGui.QFrame):
 
     ## displayFrame
     #
-    # This is called every 1/10th of a second to update the frame that is displayed.
+    # This is called by the display timer to update the frame that is displayed.
+    # It also adjusts the timer interval based on how long the update took (a
+    # running average) and how late the timer fired.
     #
     def displayFrame(self):
-        if self.frame:
+        start_time = time.time()
+        interval = self.display_timer.interval()
+        lateness = 0.0
+        if (self.last_display_time > 0.0):
+            lateness = 1000.0 * (start_time - self.last_display_time) - interval
+        self.last_display_time = start_time
+
+        # Only redraw if there is a new frame, or if the old frame has not
+        # been redrawn for a while (in case the magnification changed).
+        redraw = (self.frame is not self.display_frame)
+        if ((1000.0 * (start_time - self.last_draw_time)) > self.max_display_interval):
+            redraw = True
+
+        if self.frame and redraw:
             self.camera_widget.updateImageWithFrame(self.frame)
+            self.display_frame = self.frame
+            self.last_draw_time = start_time
+
+            cost = 1000.0 * (time.time() - start_time)
+            self.display_cost = 0.8 * self.display_cost + 0.2 * cost
+
+            new_interval = self.display_cost/self.display_load
+            if (lateness > 0.5 * interval):
+                new_interval = max(new_interval, 2 * interval)
+            new_interval = int(max(self.min_display_interval, min(self.max_display_interval, new_interval)))
+            if (new_interval != interval):
+                self.display_timer.setInterval(new_interval)
 
     ## getShutterButton
     #
@@ -324,11 +367,12 @@ class CameraDisplay(QtGui.QFrame):
     def newFrames(self, frames):
         for frame in frames:
             if (frame.which_camera == self.which_camera):
-                if self.filming and self.parameters.get("sync"):
-                    if((frame.number % self.cycle_length) == (self.parameters.get("sync")-1)):
-                        self.frame = frame
+                sync = self.sync()
+                if self.filming and sync:
+                    if((frame.number % self.cycle_length) == (sync-1)):
+                        self.setFrame(frame)
                 else:
-                    self.frame = frame
+                    self.setFrame(frame)
 
     ## newParameters
     #
@@ -340,6 +384,7 @@ class CameraDisplay(QtGui.QFrame):
     @hdebug.debug
     def newParameters(self, parameters):
         self.parameters = parameters
+        self.sync = parameters.getter("sync")
                 
         # for conveniently accessing parameters
         p = parameters
@@ -390,6 +435,20 @@ class CameraDisplay(QtGui.QFrame):
         self.parameters.set("scalemin", int(scale_min))
         self.updateRange()
 
+    ## setFrame
+    #
+    # Change the frame to display. Only the most recent frame is
+    # kept, the reference to the previous frame is released so
+    # that its buffer can be recycled.
+    #
+    # @param frame A frame object.
+    #
+    def setFrame(self, frame):
+        frame.hold()
+        if self.frame:
+            self.frame.release()
+        self.frame = frame
+
     ## setSyncMax
     #
     # Sets the maximum value for the shutter synchronization spin box.
@@ -431,6 +490,7 @@ class CameraDisplay(QtGui.QFrame):
         self.ui.scaleMax.setText(str(self.parameters.get("scalemax")))
         self.ui.scaleMin.setText(str(self.parameters.get("scalemin")))
         self.camera_widget.newRange([self.parameters.get("scalemin"), self.parameters.get("scalemax")])
+        self.display_frame = False
 
 ## CameraScollArea
 #
@@ -228,7 +228,9 @@ class DualCamera(genericCamera.Camera):
     ## handleNewFrames
     #
     # This passes frame data recieved from the camera control to UIs
-    # for display. It also passes the frame data up to HAL.
+    # for display. It also passes the frame data up to HAL. Once
+    # everyone has had a chance to take a reference to the frames
+    # the camera's reference is released.
     #
     # @param frames A python array of frame objects.
     # @param key The ID of these frames.
@@ -238,6 +240,8 @@ class DualCamera(genericCamera.Camera):
             self.camera1.camera_display.newFrames(frames)
             self.camera2.camera_display.newFrames(frames)
             self.newFrames.emit(frames)
+        for frame in frames:
+            frame.release()
 
     ## newParameters
     #
@@ -14,6 +14,14 @@
 # 2) The numpy data field (np_data) is expected to
 #    be of type numpy.uint16.
 #
+# 3) If the frame data is stored in a recycled (pooled)
+#    buffer then the frame holds one reference to the
+#    buffer when it is created. This reference is released
+#    once the frame has been sent to everyone who wants it,
+#    so anything that keeps the frame (or its data) after
+#    the newFrame() call returns must call hold() and then
+#    release() when it is done with it.
+#
 # Hazen 10/13
 #
 
@@ -35,8 +43,10 @@ class Frame():
     # @param image_y The size of the frame in pixels in y.
     # @param which_camera Which camera the frame came from ("camera1" or "camera2").
     # @param master True/False Is this frame from the "master" (as opposed to the "slave") camera.
+    # @param buffer (Optional) The reference counted object (with hold() and release() methods) that owns np_data.
     #
-    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, master):
+    def __init__(self, np_data, frame_number, image_x, image_y, which_camera, master, buffer = None):
+        self.buffer = buffer
         self.image_x = image_x
         self.image_y = image_y
         self.master = master
@@ -59,6 +69,22 @@ class Frame():
     def getDataPtr(self):
         return self.np_data.ctypes.data
 
+    ## hold
+    #
+    # Add a reference to the buffer that contains the frame data.
+    #
+    def hold(self):
+        if self.buffer:
+            self.buffer.hold()
+
+    ## release
+    #
+    # Remove a reference to the buffer that contains the frame data.
+    #
+    def release(self):
+        if self.buffer:
+            self.buffer.release()
+
 #
 # The MIT License
 #
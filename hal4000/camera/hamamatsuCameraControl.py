@@ -39,7 +39,15 @@ class ACameraControl(cameraControl.CameraControl):
 
         self.stop_at_max = True
 
-        self.camera = hcam.HamamatsuCameraMR(parameters.get("camera_id", 0))
+        # If a frame pool size is specified then use the camera class that
+        # copies the frames into a pool of recycled buffers, otherwise use
+        # the memory recycling camera class, which hands out the camera
+        # buffers directly.
+        if (parameters.get("frame_pool_mb", 0) > 0):
+            self.camera = hcam.HamamatsuCamera(parameters.get("camera_id", 0))
+            self.camera.setFramePoolSize(parameters.get("frame_pool_mb"))
+        else:
+            self.camera = hcam.HamamatsuCameraMR(parameters.get("camera_id", 0))
 
     ## closeShutter
     #
@@ -112,6 +120,7 @@ class ACameraControl(cameraControl.CameraControl):
         else:
             self.filming = False
             self.acq_mode = "run_till_abort"
+        self.camera.setFilming(self.filming)
 
         self.mutex.unlock()
 
@@ -212,13 +221,14 @@ class ACameraControl(cameraControl.CameraControl):
 
                     # Create frame objects.
                     frame_data = []
-                    for hc_data in frames:
+                    for i, hc_data in enumerate(frames):
                         aframe = frame.Frame(hc_data.getData(),
                                              self.frame_number,
                                              frame_size[0],
                                              frame_size[1],
                                              "camera1",
-                                             True)
+                                             True,
+                                             buffer = hc_data)
                         frame_data.append(aframe)
                         self.frame_number += 1
 
@@ -232,9 +242,16 @@ class ACameraControl(cameraControl.CameraControl):
             
                             if (self.acq_mode == "fixed_length") and (self.frame_number == self.frames_to_take):
                                 self.reached_max_frames = True
+
+                                # Return the buffers of the frames that will not be used.
+                                for hc_data in frames[i+1:]:
+                                    hc_data.release()
                                 break
                             
                     # Emit new data signal.
+                    #
+                    # The receiver releases the frames once it has passed them
+                    # on to everyone who is interested in them.
                     self.newData.emit(frame_data, self.key)
 
                     # Emit max frames signal.
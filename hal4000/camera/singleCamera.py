@@ -137,7 +137,9 @@ class SingleCamera(genericCamera.Camera):
     #
     # Handles passing the newFrames from the camera control object
     # to camera display object. It also signals the new frames
-    # to HAL if they are from the current acquisition.
+    # to HAL if they are from the current acquisition. Once everyone
+    # has had a chance to take a reference to the frames the camera's
+    # reference is released.
     #
     # @param frames A python array of frame objects.
     # @param key The ID of the frames from the camera control object.
@@ -146,6 +148,8 @@ class SingleCamera(genericCamera.Camera):
         if (key == self.key):
             self.camera_display.newFrames(frames)
             self.newFrames.emit(frames)
+        for frame in frames:
+            frame.release()
 
     ## newParameters
     #
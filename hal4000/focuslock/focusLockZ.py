@@ -19,6 +19,7 @@
 #
 
 import numpy
+import os
 from PyQt4 import QtCore, QtGui
 
 import qtWidgets.qtAppIcon as qtAppIcon
@@ -28,6 +29,8 @@ import halLib.halModule as halModule
 # Debugging
 import sc_library.hdebug as hdebug
 
+import sc_library.offsetFile as offsetFile
+
 # Widgets
 import focuslock.lockDisplay as lockDisplay
 
@@ -58,6 +61,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
         # general
         self.offset_file = 0
         self.parameters = parameters
+        self.prepared_offset_file = False
         self.jumpsize = 0.0
         self.tcp_message = None
 
@@ -68,6 +72,16 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
         self.num_focus_checks = 0
         self.accum_focus_checks = 0
         
+    ## addLoopStatistics
+    #
+    # Adds the focus lock control loop rate and jitter to the current TCP message.
+    #
+    def addLoopStatistics(self):
+        [loop_rate, mean_jitter, max_jitter] = self.lock_display1.getLoopStatistics()
+        self.tcp_message.addResponse("loop_rate", loop_rate)
+        self.tcp_message.addResponse("loop_jitter", mean_jitter)
+        self.tcp_message.addResponse("loop_max_jitter", max_jitter)
+
     ## cleanup
     #
     @hdebug.debug
@@ -192,6 +206,12 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
     #
     @hdebug.debug
     def handleCommMessage(self, message):
+
+        # Ignore messages for the other modules, they may arrive while
+        # we are still working on one of our messages.
+        if not (message.getType() in ["Find Sum", "Check Focus Lock", "Set Lock Target", "Find Optimal Sum", "Recenter Piezo"]):
+            return
+
         self.tcp_message = message
         if (message.getType() == "Find Sum"):
             if message.isTest():
@@ -245,6 +265,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
         focus_status = self.lock_display1.getFocusStatus()
         self.tcp_message.addResponse("focus_status", focus_status)
         self.tcp_message.addResponse("found_sum", lock_sum)
+        self.addLoopStatistics()
         self.tcpComplete.emit(self.tcp_message)
 
     ## handleJumpPButton
@@ -350,7 +371,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
         if filming and frame.master:
             if self.offset_file:
                 [offset, power, stage_z] = self.lock_display1.getOffsetPowerStage()
-                self.offset_file.write("{0:d} {1:.6f} {2:.6f} {3:.6f}\n".format(frame.number, offset, power, stage_z))
+                self.offset_file.addSample(frame.number, offset, power, stage_z, self.lock_display1.isInFocus())
             self.lock_display1.newFrame(frame)
 
     ## newParameters
@@ -366,14 +387,36 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
 
     ## openOffsetFile
     #
-    # Open a file to save the offset data in during filming.
+    # Open a file to save the offset data in during filming. This is
+    # a text (.off) file unless the focuslock.offset_file_format parameter
+    # is "binary" (.offb, see sc_library/offsetFile.py).
+    #
+    # @param filename The name of the offset file (without the extension).
     #
-    # @param filename The name of the offset file.
+    # @return The offset file object.
     #
     @hdebug.debug
     def openOffsetFile(self, filename):
-        self.offset_file = open(filename + ".off", "w")
-        self.offset_file.write("frame offset power stage-z\n")
+        binary = (self.parameters.get("focuslock.offset_file_format", "text") == "binary")
+        return offsetFile.openOffsetFile(offsetFile.offsetFileName(filename, binary), binary)
+
+    ## prepareFilm
+    #
+    # Opens the offset file of the next film in advance.
+    #
+    # @param film_name The name of the next film, or False to discard the offset file.
+    #
+    @hdebug.debug
+    def prepareFilm(self, film_name):
+        if self.prepared_offset_file:
+            [filename, offset_file] = self.prepared_offset_file
+            offset_file.close()
+
+            # The dual camera offset file is a python file object.
+            os.remove(getattr(offset_file, "filename", offset_file.name))
+            self.prepared_offset_file = False
+        if film_name:
+            self.prepared_offset_file = [film_name, self.openOffsetFile(film_name)]
 
     ## startFilm
     #
@@ -390,7 +433,11 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
         self.error = 0.0
         self.error_counts = 0
         if filename:
-            self.openOffsetFile(filename)
+            if self.prepared_offset_file and (self.prepared_offset_file[0] == filename):
+                self.offset_file = self.prepared_offset_file[1]
+                self.prepared_offset_file = False
+            else:
+                self.offset_file = self.openOffsetFile(filename)
         self.lock_display1.startLock(filename)
         self.toggleLockButtonText(self.lock_display1.amLocked())
         self.toggleLockLabelDisplay(self.lock_display1.shouldDisplayLockLabel())
@@ -456,6 +503,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
 
         if focus_status: # Return message if focus is found
             self.tcp_message.addResponse("focus_status", focus_status)
+            self.addLoopStatistics()
             self.tcpComplete.emit(self.tcp_message)
 
         else:
@@ -477,6 +525,7 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
                     
                 else: # No scan, just return error
                     self.tcp_message.addResponse("focus_status", focus_status)
+                    self.addLoopStatistics()
                     self.tcpComplete.emit(self.tcp_message)
     
     ## toggleLockButtonDisplay
@@ -520,6 +569,21 @@ class FocusLockZ(QtGui.QDialog, halModule.HalModule):
             self.ui.lockButton.setText("Lock")
             self.ui.lockButton.setStyleSheet("QPushButton { color: black}")
 
+    ## updateParameters
+    #
+    # The focus lock is only reconfigured if the focus lock parameters
+    # changed, as newParameters() can also recenter the piezo stage.
+    #
+    # @param parameters A parameters object.
+    # @param changed The names of the parameters that changed, or None if this is not known.
+    #
+    @hdebug.debug
+    def updateParameters(self, parameters, changed):
+        if (changed is None) or (len(filter(lambda(x): x.startswith("focuslock."), changed)) > 0):
+            self.newParameters(parameters)
+        else:
+            self.parameters = parameters
+
 
 ## FocusLockZ
 #
@@ -723,12 +787,15 @@ class FocusLockZDualCam(FocusLockZ):
     #
     # Open a file to save the offset data in during filming.
     #
-    # @param filename The name of the offset file.
+    # @param filename The name of the offset file (without the extension).
+    #
+    # @return The offset file (a python file object).
     #
     @hdebug.debug
     def openOffsetFile(self, filename):
-        self.offset_file = open(filename + ".off", "w")
-        self.offset_file.write("frame offset1 power1 stage-z1 offset2 power2 stage-z2\n")
+        offset_file = open(filename + ".off", "w")
+        offset_file.write("frame offset1 power1 stage-z1 offset2 power2 stage-z2\n")
+        return offset_file
 
     ## startFilm
     #
@@ -104,7 +104,6 @@ class LockDisplay(QtGui.QWidget):
         # start the qpd monitoring thread & stage control thread
         self.control_thread = control_thread
         self.control_thread.start(QtCore.QThread.NormalPriority)
-        self.control_thread.controlUpdate.connect(self.controlUpdate)
         self.control_thread.foundSum.connect(self.handleFoundSum)
         self.control_thread.recenteredPiezo.connect(self.handleRecenteredPiezo)
 
@@ -115,6 +114,14 @@ class LockDisplay(QtGui.QWidget):
             if self.ir_laser.havePowerControl():
                 self.ui.irSlider.setValue(parameters.get("ir_power"))
 
+        # The displays are updated from the control thread ring buffer at
+        # their own rate, independent of the rate of the control loop.
+        self.sample_index = 0
+        self.display_timer = QtCore.QTimer(self)
+        self.display_timer.setInterval(parameters.get("display_interval", 50))
+        self.display_timer.timeout.connect(self.handleDisplayTimer)
+        self.display_timer.start()
+
         self.newParameters(parameters)
 
     ## amLocked
@@ -146,7 +153,7 @@ class LockDisplay(QtGui.QWidget):
 
     ## controlUpdate
     #
-    # Handles the controlUpdate signal from the focus lock control thread.
+    # Handles a new sample from the focus lock control thread.
     #
     # @param x_offset The current x offset of the focus lock.
     # @param y_offset The current y offset of the focus lock.
@@ -171,6 +178,25 @@ class LockDisplay(QtGui.QWidget):
     def getFocusStatus(self):
         return self.control_thread.getFocusStatus()
 
+    ## getLatestSample
+    #
+    # @return The most recent sample from the control thread ring buffer as
+    #    [x_offset, y_offset, power, stage_z, is_locked] (the same as the
+    #    arguments of controlUpdate()), or None if there are no samples yet.
+    #
+    def getLatestSample(self):
+        sample = self.control_thread.getLatestSample()
+        if sample is None:
+            return None
+        return [sample[4], sample[5], sample[2], sample[3], bool(sample[6])]
+
+    ## getLoopStatistics
+    #
+    # @return [loop rate (Hz), mean jitter (ms), maximum jitter (ms)] of the focus lock control thread.
+    #
+    def getLoopStatistics(self):
+        return self.control_thread.getLoopStatistics()
+
     ## getLockModes
     #
     # @return A python array containing all the available lock modes.
@@ -223,6 +249,19 @@ class LockDisplay(QtGui.QWidget):
     def handleAdjustStage(self, direction):
         self.jump(float(direction)*self.parameters.get("lockt_step"))
 
+    ## handleDisplayTimer
+    #
+    # Updates the displays with the most recent sample from the control
+    # thread, if there has been a new sample since the last update.
+    #
+    def handleDisplayTimer(self):
+        index = self.control_thread.getSampleCount()
+        if (index != self.sample_index):
+            self.sample_index = index
+            sample = self.getLatestSample()
+            if sample is not None:
+                self.controlUpdate(*sample)
+
     ## handleFoundSum
     #
     # Handles the foundSum signal from the focus lock control thread.
@@ -272,6 +311,13 @@ class LockDisplay(QtGui.QWidget):
     def handleRecenteredPiezo(self):
         self.recenteredPiezo.emit()
 
+    ## isInFocus
+    #
+    # @return True/False the focus lock was locked at the time of the most recent sample.
+    #
+    def isInFocus(self):
+        return self.is_locked
+
     ## jump
     #
     # Handles requests to jump the piezo stage.
@@ -297,6 +343,9 @@ class LockDisplay(QtGui.QWidget):
     # @param frame A frame data object.
     #
     def newFrame(self, frame):
+        sample = self.getLatestSample()
+        if sample is not None:
+            LockDisplay.controlUpdate(self, *sample)
         self.current_mode.newFrame(frame, self.offset, self.power, self.stage_z)
 
     ## newParameters
@@ -315,6 +364,8 @@ class LockDisplay(QtGui.QWidget):
         if not self.current_mode.amLocked():
             self.control_thread.recenter()
         self.scale = p.get("qpd_scale")
+        self.control_thread.setLoopRate(p.get("loop_rate", 500.0))
+        self.display_timer.setInterval(p.get("display_interval", 50))
 
     ## quit
     #
@@ -322,6 +373,7 @@ class LockDisplay(QtGui.QWidget):
     #
     @hdebug.debug
     def quit(self):
+        self.display_timer.stop()
         self.control_thread.stopThread()
         self.control_thread.wait()
         self.control_thread.cleanUp()
@@ -517,6 +569,8 @@ class LockDisplayCam(LockDisplay):
     #
     @hdebug.debug
     def __init__(self, parameters, control_thread, ir_laser, parent):
+        self.camDisplay = None
+        self.estimator = None
         LockDisplay.__init__(self, parameters, control_thread, ir_laser, parent)
 
         self.filename = ""
@@ -580,6 +634,7 @@ class LockDisplayCam(LockDisplay):
         self.camDisplay.adjustCamera.connect(self.handleAdjustAOI)
         self.camDisplay.adjustOffset.connect(self.handleAdjustOffset)
         self.camDisplay.changeFitMode.connect(self.handleChangeFitMode)
+        self.camDisplay.setEstimator(parameters.get("spot_estimator", "gaussian"))
 
         # timer for updating the display of snapshots captured by the camera.
         self.cam_timer = QtCore.QTimer()
@@ -658,6 +713,25 @@ class LockDisplayCam(LockDisplay):
     def handleChangeFitMode(self, mode):
         self.control_thread.changeFitMode(mode)
 
+    ## newParameters
+    #
+    # Handles a change in parameters, this also selects the spot
+    # estimator (focuslock.spot_estimator) that the camera uses. The
+    # estimator is only changed if the parameter changed, as this also
+    # turns fit mode back on.
+    #
+    # @param parameters A parameters object.
+    #
+    @hdebug.debug
+    def newParameters(self, parameters):
+        LockDisplay.newParameters(self, parameters)
+        estimator = parameters.get("spot_estimator", "gaussian")
+        if (estimator != self.estimator):
+            self.estimator = estimator
+            self.control_thread.changeFitMode(estimator)
+            if self.camDisplay:
+                self.camDisplay.setEstimator(estimator)
+
     # for debugging..
 #    def openOffsetFile(self, filename):
 #        self.filename = filename
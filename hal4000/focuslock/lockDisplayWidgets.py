@@ -583,6 +583,16 @@ class QCamDisplay(QtGui.QWidget):
             painter.setBrush(self.background)
             painter.drawRect(0, 0, self.width(), self.height())
 
+    ## setEstimator
+    #
+    # Sets the name of the spot estimator that is shown in fit mode.
+    #
+    # @param estimator The name of the spot estimator, e.g. "gauss_newton".
+    #
+    def setEstimator(self, estimator):
+        self.static_text[0] = QtGui.QStaticText("Fit (" + estimator + ")")
+        self.update()
+
     ## toggleCircles
     #
     # Show/hide the circles that are drawn to indicate where the fitting code
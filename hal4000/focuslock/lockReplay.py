@@ -0,0 +1,275 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Replays a focus lock offset file through the lock modes in
+# lockModes.py, without any hardware. This is for tuning the
+# focus lock and for checking that changes to the lock modes
+# do not make the lock worse.
+#
+# The recorded offsets are converted into the offset that the
+# focus lock would have measured with the stage at z_center
+# (the "drift"). During the replay the offset is the drift plus
+# the effect of the simulated stage position, so the lock modes
+# and the lock function respond to the same drift as in the
+# original film.
+#
+# Run from the hal4000 directory:
+#
+#   python focuslock/lockReplay.py movie.off(b) settings.xml lock_mode [lock_gain]
+#
+
+import numpy
+import sys
+
+from PyQt4 import QtCore
+
+import sc_library.offsetFile as offsetFile
+
+import focuslock.lockModes as lockModes
+
+## ReplayControlThread
+#
+# This has the same methods as StageQPDThread that the lock modes
+# use. Each call to update() is one iteration of the control loop.
+#
+class ReplayControlThread(object):
+
+    ## __init__
+    #
+    # @param lock_fn A function to use in the focus feedback correction loop.
+    # @param z_center The center position of the piezo.
+    # @param offset_per_um The change in offset per um of stage motion.
+    # @param buffer_length (Optional) The length of the is_locked buffer.
+    # @param offset_thresh (Optional) The minimum difference between the lock and offset to be considered locked.
+    # @param sum_min (Optional) The sum below which the lock does not move the stage.
+    #
+    def __init__(self, lock_fn, z_center, offset_per_um, buffer_length = 10, offset_thresh = 0.01, sum_min = 0.0):
+        self.buffer_length = buffer_length
+        self.is_locked = False
+        self.is_locked_buffer = []
+        self.lock_fn = lock_fn
+        self.locked = False
+        self.offset = 0.0
+        self.offset_per_um = offset_per_um
+        self.offset_thresh = offset_thresh
+        self.power = 0.0
+        self.stage_z = z_center
+        self.sum_min = sum_min
+        self.target = None
+        self.z_center = z_center
+
+    ## getLockTarget
+    #
+    # @return The current focus lock target.
+    #
+    def getLockTarget(self):
+        return self.target
+
+    ## getOffset
+    #
+    # @return The current focus lock offset.
+    #
+    def getOffset(self):
+        return self.offset
+
+    ## moveStageAbs
+    #
+    # @param new_z The desired stage z position.
+    #
+    def moveStageAbs(self, new_z):
+        self.stage_z = new_z
+
+    ## moveStageRel
+    #
+    # @param dz The amount to move the stage from its current position.
+    #
+    def moveStageRel(self, dz):
+        self.stage_z += dz
+
+    ## newZCenter
+    #
+    # @param z_center The value to use as the center point of the piezo stage.
+    #
+    def newZCenter(self, z_center):
+        self.z_center = z_center
+
+    ## recenter
+    #
+    # Move the stage back to its center position.
+    #
+    def recenter(self):
+        self.stage_z = self.z_center
+
+    ## recenterPiezo
+    #
+    # There is no focus motor, so this does nothing.
+    #
+    def recenterPiezo(self):
+        pass
+
+    ## resetBuffer
+    #
+    # Resets the focus lock buffer.
+    #
+    def resetBuffer(self):
+        self.is_locked_buffer = []
+        self.is_locked = False
+
+    ## setTarget
+    #
+    # @param target The focus lock target.
+    #
+    def setTarget(self, target):
+        self.target = target
+        self.resetBuffer()
+
+    ## startLock
+    #
+    # Start the focus lock.
+    #
+    def startLock(self):
+        self.locked = True
+        if self.target is None:
+            self.target = self.offset
+        self.resetBuffer()
+
+    ## stopLock
+    #
+    # Stop the focus lock.
+    #
+    def stopLock(self):
+        self.locked = False
+        self.target = None
+        self.resetBuffer()
+
+    ## update
+    #
+    # One iteration of the focus lock control loop, as in StageQPDThread.run().
+    #
+    # @param drift The recorded offset with the stage at z_center.
+    # @param power The recorded sum signal.
+    #
+    def update(self, drift, power):
+        self.power = power
+        self.offset = drift + self.offset_per_um * (self.stage_z - self.z_center)
+        if self.locked and (power > self.sum_min):
+            self.moveStageRel(self.lock_fn(self.offset - self.target))
+            self.is_locked_buffer.append(abs(self.offset - self.target) < self.offset_thresh)
+            self.is_locked_buffer = self.is_locked_buffer[-self.buffer_length:]
+            self.is_locked = (self.is_locked_buffer.count(True) == self.buffer_length)
+
+
+## replay
+#
+# Replays the offset data through a lock mode.
+#
+# @param data The offset data, a numpy array with dtype offsetFile.offset_dtype.
+# @param lock_mode A lock mode object whose control thread is a ReplayControlThread.
+# @param loop_steps (Optional) The number of control loop iterations per frame.
+#
+# @return The replayed offset data, a numpy array with dtype offsetFile.offset_dtype.
+#
+def replay(data, lock_mode, loop_steps = 1):
+    control_thread = lock_mode.control_thread
+    drift = data["offset"] - control_thread.offset_per_um * (data["stage_z"] - control_thread.z_center)
+
+    results = numpy.zeros(data.size, dtype = offsetFile.offset_dtype)
+    results["frame"] = data["frame"]
+    results["time"] = data["time"]
+    results["power"] = data["power"]
+
+    control_thread.update(drift[0], data["power"][0])
+    lock_mode.startLock()
+    for i in range(data.size):
+        for j in range(loop_steps):
+            control_thread.update(drift[i], data["power"][i])
+        results["offset"][i] = control_thread.offset
+        results["stage_z"][i] = control_thread.stage_z
+        results["is_locked"][i] = control_thread.is_locked
+        lock_mode.newFrame(None, control_thread.offset, control_thread.power, control_thread.stage_z)
+
+        # There is no event loop, so the relock timer fires at the next frame.
+        if hasattr(lock_mode, "relock_timer") and lock_mode.relock_timer.isActive():
+            lock_mode.relock_timer.stop()
+            lock_mode.restartLock()
+    lock_mode.stopLock()
+
+    return results
+
+## summary
+#
+# @param data Offset data, a numpy array with dtype offsetFile.offset_dtype.
+# @param target The lock target.
+#
+# @return [fraction of frames locked, rms offset error, range of the stage z position]
+#
+def summary(data, target):
+    error = data["offset"].astype(numpy.float64) - target
+    return [numpy.mean(data["is_locked"] > 0),
+            numpy.sqrt(numpy.mean(error * error)),
+            numpy.max(data["stage_z"]) - numpy.min(data["stage_z"])]
+
+
+if __name__ == "__main__":
+
+    import sc_library.parameters as params
+
+    if (len(sys.argv) < 4):
+        print "usage: <offset file> <settings.xml> <lock mode> [lock gain]"
+        exit()
+
+    app = QtCore.QCoreApplication(sys.argv)
+
+    data = offsetFile.readOffsetFile(sys.argv[1])
+    parameters = params.parameters(sys.argv[2]).get("focuslock")
+    which_mode = int(sys.argv[3])
+    gain = -0.02
+    if (len(sys.argv) > 4):
+        gain = float(sys.argv[4])
+
+    control_thread = ReplayControlThread(lambda (x): gain * x,
+                                         parameters.get("qpd_zcenter"),
+                                         1000.0/parameters.get("qpd_scale"),
+                                         buffer_length = parameters.get("is_locked_buffer_length", 10),
+                                         offset_thresh = parameters.get("is_locked_offset_thresh", 0.01),
+                                         sum_min = parameters.get("qpd_sum_min", 50.0))
+    modes = [lockModes.NoLockMode,
+             lockModes.AutoLockMode,
+             lockModes.AlwaysOnLockMode,
+             lockModes.OptimalLockMode,
+             lockModes.CalibrationLockMode,
+             lockModes.ZScanLockModeV2]
+    lock_mode = modes[which_mode](control_thread, parameters, None)
+    lock_mode.newParameters(parameters)
+
+    results = replay(data, lock_mode)
+    target = numpy.median(data["offset"])
+    print lock_mode.getName(), "replay of", data.size, "frames"
+    print "  recorded: locked {0:.3f}, rms error {1:.4f}, stage range {2:.3f}um".format(*summary(data, target))
+    print "  replayed: locked {0:.3f}, rms error {1:.4f}, stage range {2:.3f}um".format(*summary(results, target))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
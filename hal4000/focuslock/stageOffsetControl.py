@@ -56,22 +56,86 @@
 #    Return once all running threads have stopped.
 #
 #
-# The control_thread class should emit the following signal when it has
-# new QPD/stage position data.
-#
-# controlUpdate(float x_offset, float y_offset, float power, float stage_z)
+# The control_thread class records every QPD/stage position sample in a
+# ring buffer which can be read (without locking) using getLatestSample(),
+# getSampleCount() and getSamples().
 #
 #
 # Hazen 12/12
 #
 # Jeff 9/14: Added focus lock buffers to track performance to determine if locked
 
+import numpy
+import sys
+import time
+
 from PyQt4 import QtCore
 from collections import deque 
 
 # Debugging
 import sc_library.hdebug as hdebug
 
+# time.time() only has a resolution of ~15ms on windows.
+if (sys.platform == "win32"):
+    clock = time.clock
+else:
+    clock = time.time
+
+## SampleBuffer
+#
+# A fixed length ring buffer of focus lock samples. There is a single
+# writer (the control thread) and any number of readers, none of which
+# need to take a lock. The writer fills in the next slot and only then
+# increments the sample count, so the readers never see a partial sample.
+#
+# Each sample is [time, offset, power, stage_z, x_offset, y_offset, is_locked].
+#
+class SampleBuffer(object):
+
+    ## __init__
+    #
+    # @param length The number of samples to keep.
+    #
+    def __init__(self, length):
+        self.count = 0
+        self.data = numpy.zeros((length, 7))
+        self.length = length
+
+    ## addSample
+    #
+    # @param sample A list in the format described above.
+    #
+    def addSample(self, sample):
+        self.data[self.count % self.length,:] = sample
+        self.count += 1
+
+    ## getLatestSample
+    #
+    # @return The most recent sample (as a numpy array) or None if there are no samples.
+    #
+    def getLatestSample(self):
+        count = self.count
+        if (count == 0):
+            return None
+        return self.data[(count - 1) % self.length,:].copy()
+
+    ## getSamples
+    #
+    # Returns the samples that were added after sample number index. The
+    # oldest slot is not returned as the writer may be in the process of
+    # overwriting it.
+    #
+    # @param index The number of samples that the reader has already seen.
+    #
+    # @return [samples as a 2D numpy array, the new index]
+    #
+    def getSamples(self, index):
+        count = self.count
+        start = max(index, count - self.length + 1, 0)
+        indices = numpy.arange(start, count) % self.length
+        return [self.data[indices,:], count]
+
+
 ## StageQPDThread
 #
 # QPD monitoring and stage control thread.
@@ -102,7 +166,6 @@ import sc_library.hdebug as hdebug
 #   and returns the appropriate response (in um) by the stage.
 #
 class StageQPDThread(QtCore.QThread):
-    controlUpdate = QtCore.pyqtSignal(float, float, float, float, bool)
     foundSum = QtCore.pyqtSignal(float)
     lockStatusRequest = QtCore.pyqtSignal(bool)
     recenteredPiezo = QtCore.pyqtSignal()
@@ -118,9 +181,11 @@ class StageQPDThread(QtCore.QThread):
     # @param offset_thresh The minimum difference between the lock and offset to be considered locked.
     # @param slow_stage (Optional) True/False is communication with the piezo stage slow.
     # @param parent (Optional) The PyQt parent of this object.
+    # @param loop_rate (Optional) The target rate of the control loop in Hz, 0 is as fast as possible.
+    # @param sample_length (Optional) The number of samples to keep in the ring buffer.
     #
     @hdebug.debug
-    def __init__(self, qpd, stage, lock_fn, min_sum, z_center, buffer_length, offset_thresh, slow_stage = False, parent = None):
+    def __init__(self, qpd, stage, lock_fn, min_sum, z_center, buffer_length, offset_thresh, slow_stage = False, parent = None, loop_rate = 500.0, sample_length = 2000):
         QtCore.QThread.__init__(self, parent)
         self.qpd = qpd
         self.stage = stage
@@ -131,11 +196,13 @@ class StageQPDThread(QtCore.QThread):
         self.debug = 1
         self.find_sum = False
         self.locked = 0
+        self.loop_rate = loop_rate
         self.max_pos = 0
         self.max_sum = 0
         self.offset = 0
         self.qpd_mutex = QtCore.QMutex()
         self.running = 1
+        self.samples = SampleBuffer(sample_length)
         self.slow_stage = slow_stage
         self.stage_mutex = QtCore.QMutex()
 
@@ -179,6 +246,34 @@ class StageQPDThread(QtCore.QThread):
             print "QPD/Camera are frozen?"
             return "failed"
 
+    ## getLatestSample
+    #
+    # @return The most recent sample from the ring buffer, or None.
+    #
+    def getLatestSample(self):
+        return self.samples.getLatestSample()
+
+    ## getLoopStatistics
+    #
+    # Calculates the control loop statistics from the time stamps
+    # of the samples in the ring buffer.
+    #
+    # @param n_samples (Optional) The (maximum) number of samples to use.
+    #
+    # @return [loop rate (Hz), mean jitter (ms), maximum jitter (ms)]
+    #
+    def getLoopStatistics(self, n_samples = 500):
+        [samples, index] = self.samples.getSamples(self.samples.count - n_samples)
+        if (samples.shape[0] < 3):
+            return [0.0, 0.0, 0.0]
+        periods = numpy.diff(samples[:,0])
+        rate = 1.0/numpy.mean(periods)
+        if (self.loop_rate > 0):
+            jitter = numpy.abs(periods - 1.0/self.loop_rate)
+        else:
+            jitter = numpy.abs(periods - numpy.mean(periods))
+        return [rate, 1000.0 * numpy.mean(jitter), 1000.0 * numpy.max(jitter)]
+
     ## getOffset
     #
     # @return The current focus lock value.
@@ -190,6 +285,22 @@ class StageQPDThread(QtCore.QThread):
         self.qpd_mutex.unlock()
         return temp
 
+    ## getSampleCount
+    #
+    # @return The number of samples that have been added to the ring buffer.
+    #
+    def getSampleCount(self):
+        return self.samples.count
+
+    ## getSamples
+    #
+    # @param index The number of samples that the caller has already seen.
+    #
+    # @return [samples as a 2D numpy array, the new index]
+    #
+    def getSamples(self, index):
+        return self.samples.getSamples(index)
+
     ## getFocusStatus()
     #
     # @return The status of the focus lock
@@ -289,8 +400,15 @@ class StageQPDThread(QtCore.QThread):
     # if the lock is on, adjust the stage position based on
     # the offsets & the lock function.
     #
+    # The loop runs at (approximately) loop_rate. If an iteration
+    # takes longer than the loop period the next iteration starts
+    # immediately and the schedule is reset, rather than trying
+    # to catch up.
+    #
     def run(self):
+        next_time = clock()
         while(self.running):
+            start_time = clock()
             [power, x_offset, y_offset] = self.qpdScan()
 
             self.qpd_mutex.lock()
@@ -337,10 +455,24 @@ class StageQPDThread(QtCore.QThread):
                     self.is_locked_buffer.append(is_locked_now)
                     self.is_locked = (self.is_locked_buffer.count(True) == self.buffer_length) # 3/4: Kludge to account for periodic jumps in camera based focus lock
                     
-            #self.emit(QtCore.SIGNAL("controlUpdate(float, float, float, float)"), x_offset, y_offset, power, self.stage_z)
-            self.controlUpdate.emit(x_offset, y_offset, power, self.stage_z, self.is_locked)
+            offset = self.offset
+            stage_z = self.stage_z
+            is_locked = self.is_locked
             self.qpd_mutex.unlock()
-            self.msleep(1)
+
+            # The GUI reads the samples from the ring buffer.
+            self.samples.addSample([start_time, offset, power, stage_z, x_offset, y_offset, is_locked])
+
+            # Wait until the start of the next iteration.
+            if (self.loop_rate > 0):
+                next_time += 1.0/self.loop_rate
+                wait = next_time - clock()
+                if (wait > 0):
+                    self.usleep(int(1.0e6 * wait))
+                else:
+                    next_time = clock()
+            else:
+                self.msleep(1)
 
     ## setBufferLength
     #
@@ -352,6 +484,13 @@ class StageQPDThread(QtCore.QThread):
         self.resetBuffer()
         self.qpd_mutex.unlock()
 
+    ## setLoopRate
+    #
+    # @param loop_rate The target rate of the control loop in Hz, 0 is as fast as possible.
+    #
+    def setLoopRate(self, loop_rate):
+        self.loop_rate = loop_rate
+
     ## setOffsetThreshold
     #
     # @param offset_thresh The minimum distance to the lock target to be considered 'in focus'.
@@ -578,7 +717,8 @@ class StageCamThread(StageQPDThread):
     #
     # Changes how the camera fits the data to determine the focus lock offset.
     #
-    # @param mode 1 = Gaussian fit, 2 = Moment based calculation.
+    # @param mode 1 = Fit (with the current spot estimator), 0 = Moment based calculation,
+    #    or the name of a spot estimator (e.g. "gauss_newton", see spotEstimators.py).
     #
     @hdebug.debug
     def changeFitMode(self, mode):
@@ -36,6 +36,8 @@
 import os
 import sys
 import datetime
+import numpy
+import time
 import traceback
 
 from PyQt4 import QtCore, QtGui
@@ -45,6 +47,7 @@ import sc_library.hdebug as hdebug
 
 # Misc.
 import camera.filmSettings as filmSettings
+import halLib.frameBus as frameBus
 import halLib.imagewriters as writers
 import qtWidgets.qtAppIcon as qtAppIcon
 import qtWidgets.qtParametersBox as qtParametersBox
@@ -115,12 +118,17 @@ class Window(QtGui.QMainWindow):
         self.directory_test_mode = False
         self.filename = ""
         self.filming = False
+        self.frame_bus = frameBus.FrameBus(self)
+        self.last_frame = None
         self.logfile_fp = open(parameters.get("film.logfile"), "a")
         self.modules = []
+        self.old_parameters = None
         self.old_shutters_file = ""
         self.parameters = parameters
         self.parameters_test_mode = False
+        self.prepared_film = None
         self.settings = QtCore.QSettings("Zhuang Lab", "hal-4000_" + parameters.get("setup_name").lower())
+        self.start_film_text = "No films have been taken."
         self.tcp_message = None
         self.tcp_requested_movie = False
         self.ui_mode = ""
@@ -240,10 +248,25 @@ class Window(QtGui.QMainWindow):
                 a_action.triggered.connect(instance.show)
             self.modules.append(instance)
 
+            # Subscribe the module to the camera frames.
+            [policy, interval, max_frames] = instance.getFrameSubscription()
+            self.frame_bus.subscribe(instance,
+                                     module.hal_type,
+                                     module.get("frame_policy", policy),
+                                     interval = module.get("frame_interval", interval),
+                                     max_frames = module.get("frame_queue", max_frames),
+                                     filming_max_frames = module.get("frame_filming_queue", None),
+                                     threaded = module.get("frame_thread", False))
+
         # Insert a separator into the file menu if necessary.
         if add_separator:
             self.ui.menuFile.insertSeparator(self.ui.actionQuit)
 
+        # Frame delivery statistics.
+        self.ui.actionFrameStatistics = QtGui.QAction(self.tr("Frame Statistics"), self)
+        self.ui.menuFile.insertAction(self.ui.actionQuit, self.ui.actionFrameStatistics)
+        self.ui.menuFile.insertSeparator(self.ui.actionQuit)
+
         # Connect signals between modules, HAL and the camera.
         everything = self.modules + [self] + [self.camera]
         for from_module in everything:
@@ -266,6 +289,7 @@ class Window(QtGui.QMainWindow):
 
         # ui signals
         self.ui.actionDirectory.triggered.connect(self.newDirectory)
+        self.ui.actionFrameStatistics.triggered.connect(self.handleFrameStatistics)
         self.ui.actionSettings.triggered.connect(self.newSettingsFile)
         self.ui.actionShutter.triggered.connect(self.newShuttersFile)
         self.ui.actionQuit.triggered.connect(self.handleClose)
@@ -332,6 +356,7 @@ class Window(QtGui.QMainWindow):
     def cleanUp(self):
         if self.filming:
             self.stopFilm()
+        self.discardPreparedFilm()
 
         print " Dave? What are you doing Dave?"
         print "  ..."
@@ -394,6 +419,38 @@ class Window(QtGui.QMainWindow):
             elif (signal[1] == "toggleFilm"):
                 signal[2].connect(self.handleToggleFilm)
 
+    ## createWriter
+    #
+    # @param film_name The name of the film without any extensions.
+    # @param film_settings A film settings object.
+    #
+    # @return A file writer object.
+    #
+    @hdebug.debug
+    def createWriter(self, film_name, film_settings):
+        if (self.ui_mode == "dual"):
+            cameras = ["camera1", "camera2"]
+        else:
+            cameras = ["camera1"]
+        return writers.createFileWriter(self.ui.filetypeComboBox.currentText(),
+                                        film_name,
+                                        self.parameters,
+                                        cameras,
+                                        film_settings = film_settings)
+
+    ## discardPreparedFilm
+    #
+    # Discards the file writer and the module preparations for a film that
+    # was prepared (see prepareFilm()) but is not going to be taken.
+    #
+    @hdebug.debug
+    def discardPreparedFilm(self):
+        if self.prepared_film is not None:
+            self.prepared_film[4].discardFile()
+            self.prepared_film = None
+            for module in self.modules:
+                module.prepareFilm(False)
+
     ## dragEnterEvent
     #
     # This is called when a file is dragged into the main window.
@@ -494,20 +551,43 @@ class Window(QtGui.QMainWindow):
                     self.tcp_message.addResponse("aborted", True)
             if self.filming:
                 self.stopFilm()
+            self.discardPreparedFilm()
             return
 
-        # Reject message if Hal is filming.
-        #
-        # FIXME: Why? We used to allow this so that we could remotely set
-        #    and adjust the power while filming.
-        #
-        if self.filming: 
-            message.setError(True, "Hal is filming")
+        # Get ready for the next movie, this is usually sent while the
+        # current movie is being taken.
+        if (message.getType() == "Prepare Movie"):
+            if not message.isTest():
+                self.prepareFilm(message.getData("name"),
+                                 filmSettings.FilmSettings("fixed_length", message.getData("length")))
+            self.tcpComplete.emit(message)
+            return
+
+        # Return the most recent frame from the (master) camera as the message
+        # payload.
+        if (message.getType() == "Get Frame"):
+            if self.last_frame is None:
+                message.setError(True, "No frames")
+            else:
+                frame = self.last_frame
+                image = frame.getData().reshape(frame.image_y, frame.image_x)
+                binning = message.getData("binning")
+                if binning and (binning > 1):
+                    size_x = frame.image_x/binning
+                    size_y = frame.image_y/binning
+                    image = image[:size_y*binning,:size_x*binning].reshape(size_y, binning, size_x, binning)
+                    image = image.mean(axis = 3).mean(axis = 1).astype(numpy.uint16)
+                message.setPayloadArray(image)
+                message.addResponse("frame_number", frame.number)
+                message.addResponse("camera", frame.which_camera)
             self.tcpComplete.emit(message)
             return
 
+        # The messages that are not allowed while filming are rejected
+        # by halTcpControl, so they do not get here.
+
         # Handle mosaic information request, pass mosaic XML data back:
-        elif (message.getType() == "Get Mosaic Settings"):
+        if (message.getType() == "Get Mosaic Settings"):
             message.addResponse("pixels_to_um", self.parameters.get("mosaic.pixels_to_um"))
             i = 1
             while self.parameters.has("mosaic.obj" + str(i)):
@@ -580,7 +660,7 @@ class Window(QtGui.QMainWindow):
             # Check file overwrite (independence of whether the message is a test)
             if not (message.getData("overwrite") == None) and (message.getData("overwrite") == False):
                 file_path = self.directory_test_mode + os.sep + message.getData("name") + self.parameters.get("film.filetype")
-                if os.path.exists(file_path):
+                if os.path.exists(file_path) and not self.isPreparedFile(file_path):
                     message.setError(True, file_path + " will be overwritten")
                     self.tcpComplete.emit(message)
                     return
@@ -628,10 +708,23 @@ class Window(QtGui.QMainWindow):
     #
     @hdebug.debug
     def handleCommStop(self):
+        self.discardPreparedFilm()
         if self.current_directory:
             self.newDirectory(self.current_directory)
             self.current_directory = False
 
+    ## handleFrameStatistics
+    #
+    # Shows the frame delivery statistics of each of the modules.
+    #
+    # @param bool Dummy parameter.
+    #
+    @hdebug.debug
+    def handleFrameStatistics(self, bool):
+        QtGui.QMessageBox.information(self,
+                                      "Frame Statistics",
+                                      "Frames delivered to each module (latency is mean / max time in queue, processing is mean / max time in the module)\n\n" + self.frame_bus.getStatisticsText() + "\n\nTime to start the last film\n\n" + self.start_film_text)
+
     ## handleToggleFilm
     #
     # Start/stop filming.
@@ -656,6 +749,17 @@ class Window(QtGui.QMainWindow):
             self.parameters.set("film.acq_mode", "fixed_length")
         self.showHideLength()
 
+    ## isPreparedFile
+    #
+    # @param filename The name of a file.
+    #
+    # @return True/False the file was created for the prepared film (see prepareFilm()).
+    #
+    def isPreparedFile(self, filename):
+        if self.prepared_film is None:
+            return False
+        return (os.path.normpath(filename) in map(os.path.normpath, self.prepared_film[4].filenames))
+
     ## newDirectory
     #
     # Show the new directory dialog box (if a directory is not specified.
@@ -679,17 +783,26 @@ class Window(QtGui.QMainWindow):
 
     ## newFrames
     #
-    # This is called when there are new frames from the camera.
+    # This is called when there are new frames from the camera. The frames
+    # are passed to the modules by the frame bus, which calls each module's
+    # newFrame() method from the event loop.
     #
     # @param frames A list of frame objects.
     #
     def newFrames(self, frames):
-        for frame in frames:
-            if self.filming:
+        if self.filming:
+            for frame in frames:
                 self.updateFramesForFilm(frame)
 
-            for module in self.modules:
-                module.newFrame(frame, self.filming)
+        # Keep the most recent master frame for "Get Frame" requests.
+        for frame in frames:
+            if frame.master:
+                frame.hold()
+                if self.last_frame is not None:
+                    self.last_frame.release()
+                self.last_frame = frame
+
+        self.frame_bus.newFrames(frames, self.filming)
 
     ## newParameters
     #
@@ -700,6 +813,9 @@ class Window(QtGui.QMainWindow):
     @hdebug.debug
     def newParameters(self):
 
+        # A prepared film is only used with the parameters it was prepared for.
+        self.discardPreparedFilm()
+
         # For conveniently accessing parameters
         p = self.parameters
 
@@ -720,9 +836,15 @@ class Window(QtGui.QMainWindow):
         else:
             self.directory = p.get("film.directory")
 
+        # The names of the parameters that are different from those of the
+        # previous parameters, this is None for the first parameters.
+        changed = None
+        if self.old_parameters is not None:
+            changed = p.diff(self.old_parameters)
+
         # Modules.
         for module in self.modules:
-            module.newParameters(p)
+            module.updateParameters(p, changed)
 
         # If we don't already have the shutter data for these parameters, 
         # then update shutter data using the shutter file specified by 
@@ -758,6 +880,10 @@ class Window(QtGui.QMainWindow):
             self.ui.autoShuttersCheckBox.setChecked(False)
         self.updateFilenameLabel("foo")
 
+        # Keep a copy as the parameters could be changed before the next
+        # parameters are compared to them.
+        self.old_parameters = p.copy()
+
         # Start the camera
         #self.startCamera()
 
@@ -861,6 +987,34 @@ class Window(QtGui.QMainWindow):
             self.xml_directory = os.path.dirname(shutters_filename)
             self.newShutters(shutters_filename)
 
+    ## prepareFilm
+    #
+    # Gets ready for the next film while the current film (if any) is still
+    # being taken. This creates the file writer and tells the modules to
+    # prepare for the film (see HalModule.prepareFilm()). startFilm() uses
+    # the preparation if the film has the same name, parameters and length,
+    # otherwise it is discarded.
+    #
+    # @param name The name of the film without the directory or any extensions.
+    # @param film_settings A film settings object.
+    #
+    @hdebug.debug
+    def prepareFilm(self, name, film_settings):
+        self.discardPreparedFilm()
+
+        # Don't create files that would overwrite an existing film.
+        film_name = self.parameters.get("film.directory") + name
+        filetype = str(self.ui.filetypeComboBox.currentText())
+        if os.path.exists(film_name + filetype) or os.path.exists(film_name + "_cam1" + filetype):
+            return
+
+        start_time = time.time()
+        writer = self.createWriter(film_name, film_settings)
+        for module in self.modules:
+            module.prepareFilm(film_name)
+        self.prepared_film = [film_name, filetype, self.parameters, film_settings, writer]
+        hdebug.logText("prepared film " + film_name + " in {0:.1f}ms".format(1000.0 * (time.time() - start_time)))
+
     ## showHideLength
     #
     # This is called show or hide movie length text box depending on whether
@@ -892,6 +1046,13 @@ class Window(QtGui.QMainWindow):
     #
     @hdebug.debug
     def startFilm(self, film_settings = None):
+        start_times = [["", time.time()]]
+
+        # Make sure that the modules have seen all the frames from before the film.
+        self.frame_bus.flush()
+        self.frame_bus.resetStatistics()
+        start_times.append(["frame bus", time.time()])
+
         self.filming = True
         self.film_name = self.parameters.get("film.directory") + str(self.ui.filenameLabel.text())
         self.film_name = self.film_name[:-len(self.ui.filetypeComboBox.currentText())]
@@ -903,30 +1064,33 @@ class Window(QtGui.QMainWindow):
         else:
             save_film = True
 
-        # Film file prep.
+        # Film file prep, using the file writer from prepareFilm() if it
+        # was created for this film.
         self.writer = False
         self.ui.recordButton.setText("Stop")
         if save_film:
-            if (self.ui_mode == "dual"):
-                self.writer = writers.createFileWriter(self.ui.filetypeComboBox.currentText(),
-                                                       self.film_name,
-                                                       self.parameters,
-                                                       ["camera1", "camera2"])
-            else:
-                self.writer = writers.createFileWriter(self.ui.filetypeComboBox.currentText(),
-                                                       self.film_name,
-                                                       self.parameters,
-                                                       ["camera1"])
+            self.writer = self.usePreparedFilm(film_settings)
+
+        # This has to happen before a new file writer is created, the
+        # prepared film could have the same file names.
+        self.discardPreparedFilm()
+        if save_film and not self.writer:
+            self.writer = self.createWriter(self.film_name, film_settings)
+        start_times.append(["writer", time.time()])
+
+        if save_film:
             self.camera.startFilm(self.writer, film_settings)
             self.ui.recordButton.setStyleSheet("QPushButton { color: red }")
         else:
             self.camera.startFilm(None, film_settings)
             self.ui.recordButton.setStyleSheet("QPushButton { color: orange }")
             self.film_name = False
+        start_times.append(["camera setup", time.time()])
 
         # Modules.
         for module in self.modules:
             module.startFilm(self.film_name, self.ui.autoShuttersCheckBox.isChecked())
+            start_times.append([module.hal_type, time.time()])
 
         # Disable parameters radio buttons.
         self.parameters_box.startFilm()
@@ -937,6 +1101,14 @@ class Window(QtGui.QMainWindow):
 
         # go...
         self.startCamera()
+        start_times.append(["camera start", time.time()])
+
+        # Record how long each step took.
+        self.start_film_text = ""
+        for i in range(1, len(start_times)):
+            self.start_film_text += "{0:s} {1:.1f}ms\n".format(start_times[i][0], 1000.0 * (start_times[i][1] - start_times[i-1][1]))
+        self.start_film_text += "total {0:.1f}ms".format(1000.0 * (start_times[-1][1] - start_times[0][1]))
+        hdebug.logText("start film times, " + self.start_film_text.replace("\n", ", "))
 
     ## stopCamera
     #
@@ -964,6 +1136,10 @@ class Window(QtGui.QMainWindow):
         # Stop the camera.
         self.camera.stopFilm()
 
+        # Make sure that the modules have seen all the frames of the film.
+        self.frame_bus.flush()
+        self.frame_bus.logStatistics()
+
         # Film file finishing up.
         if self.writer:
 
@@ -1138,6 +1314,30 @@ class Window(QtGui.QMainWindow):
     def updateNotes(self):
         self.parameters.set("film.notes", str(self.ui.notesEdit.toPlainText()))
 
+    ## usePreparedFilm
+    #
+    # @param film_settings The film settings object of the film that is starting.
+    #
+    # @return The file writer from prepareFilm() if it was created for this film, otherwise False.
+    #
+    @hdebug.debug
+    def usePreparedFilm(self, film_settings):
+        if self.prepared_film is None:
+            return False
+
+        [film_name, filetype, parameters, prepared_settings, writer] = self.prepared_film
+        if (film_name != self.film_name) or (filetype != str(self.ui.filetypeComboBox.currentText())):
+            return False
+        if not (parameters is self.parameters):
+            return False
+        if (prepared_settings.acq_mode != film_settings.acq_mode) or (prepared_settings.frames_to_take != film_settings.frames_to_take):
+            return False
+
+        # The parameters could have changed (i.e. the notes) since the writer was created.
+        writer.setParameters(self.parameters)
+        self.prepared_film = None
+        return writer
+
 
 if __name__ == "__main__":
     app = QtGui.QApplication(sys.argv)
@@ -1161,7 +1361,9 @@ if __name__ == "__main__":
     params.setSetupName(parameters, setup_name)
 
     # Start logger.
-    hdebug.startLogging(parameters.get("film.directory") + "logs/", "hal4000")
+    hdebug.startLogging(parameters.get("film.directory") + "logs/",
+                        "hal4000",
+                        trace = parameters.get("film.want_trace", False))
 
     # Load app.
     window = Window(hardware, parameters)
@@ -0,0 +1,351 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Distributes the frames from the camera to the HAL modules.
+#
+# Each module subscribes with its own queue. The frames are added
+# to the queues when they arrive from the camera and the queues are
+# emptied (i.e. the frames are passed to the modules newFrame()
+# method) from the Qt event loop. This way a slow module does not
+# hold up the camera display, it just gets behind and (depending on
+# its policy) drops frames.
+#
+# As the frames are delivered from the Qt event loop, a module that
+# takes a long time to process a frame still delays the other
+# modules. Such a module can be given its own thread, in which case
+# its newFrame() method is called from that thread. This is only
+# safe for modules that do not touch the GUI in newFrame(), except
+# by emitting signals.
+#
+# The subscription policies are:
+#
+#  "every"  - Every frame is delivered. If the queue is full the
+#             oldest frame is dropped. When filming the queue can
+#             grow to a (larger) filming limit before frames are
+#             dropped.
+#
+#  "nth"    - Like "every", but only every Nth frame is delivered.
+#
+#  "latest" - Only the most recent frame is kept in the queue.
+#
+
+import collections
+import threading
+import time
+
+from PyQt4 import QtCore
+
+import sc_library.hdebug as hdebug
+
+policies = ["every", "nth", "latest"]
+
+
+## FrameSubscriber
+#
+# The queue and statistics for a single module.
+#
+class FrameSubscriber(object):
+
+    ## __init__
+    #
+    # @param module A HalModule object.
+    # @param name The name of the module.
+    # @param policy One of the policies ("every", "nth", "latest").
+    # @param interval Deliver every interval frame (for the "nth" policy).
+    # @param max_frames The maximum number of frames in the queue.
+    # @param filming_max_frames The maximum number of frames in the queue when filming.
+    # @param threaded True/False deliver the frames from a separate thread.
+    #
+    def __init__(self, module, name, policy, interval, max_frames, filming_max_frames, threaded):
+        if not (policy in policies):
+            raise AssertionError("unknown frame policy " + str(policy))
+
+        self.busy = False
+        self.interval = max(1, int(interval))
+        self.max_frames = max(1, int(max_frames))
+        self.filming_max_frames = max(self.max_frames, int(filming_max_frames))
+        self.lock = threading.Condition()
+        self.module = module
+        self.name = name
+        self.policy = policy
+        self.queue = collections.deque()
+        self.thread = None
+        if (self.policy == "latest"):
+            self.max_frames = 1
+            self.filming_max_frames = 1
+        self.resetStatistics()
+
+        if threaded:
+            self.thread = threading.Thread(target = self.run, name = name)
+            self.thread.daemon = True
+            self.thread.start()
+
+    ## addFrame
+    #
+    # Add a frame to the queue.
+    #
+    # @param frame A frame object.
+    # @param filming True/False if we are currently filming.
+    #
+    def addFrame(self, frame, filming):
+        if (self.policy == "nth") and ((frame.number % self.interval) != 0):
+            return
+
+        if filming:
+            max_frames = self.filming_max_frames
+        else:
+            max_frames = self.max_frames
+
+        with self.lock:
+            self.received += 1
+            if (len(self.queue) >= max_frames):
+                [old_frame, old_filming, old_time] = self.queue.popleft()
+                old_frame.release()
+                self.dropped += 1
+
+            frame.hold()
+            self.queue.append([frame, filming, time.time()])
+            if (len(self.queue) > self.peak_frames):
+                self.peak_frames = len(self.queue)
+            self.lock.notify()
+
+    ## deliverFrames
+    #
+    # Pass the frames that are currently in the queue to the module.
+    #
+    def deliverFrames(self):
+        for i in range(len(self.queue)):
+            with self.lock:
+                if (len(self.queue) == 0):
+                    break
+                [frame, filming, queued_time] = self.queue.popleft()
+            start_time = time.time()
+            try:
+                self.module.newFrame(frame, filming)
+            finally:
+                frame.release()
+            end_time = time.time()
+
+            latency = start_time - queued_time
+            process_time = end_time - start_time
+            self.delivered += 1
+            self.total_latency += latency
+            self.total_process_time += process_time
+            if (latency > self.max_latency):
+                self.max_latency = latency
+            if (process_time > self.max_process_time):
+                self.max_process_time = process_time
+
+    ## getStatistics
+    #
+    # @return A dictionary containing the statistics for this subscriber.
+    #
+    def getStatistics(self):
+        mean_latency = 0.0
+        mean_process_time = 0.0
+        if (self.delivered > 0):
+            mean_latency = self.total_latency/float(self.delivered)
+            mean_process_time = self.total_process_time/float(self.delivered)
+        return {"delivered" : self.delivered,
+                "dropped" : self.dropped,
+                "max_latency_ms" : 1000.0 * self.max_latency,
+                "max_process_ms" : 1000.0 * self.max_process_time,
+                "mean_latency_ms" : 1000.0 * mean_latency,
+                "mean_process_ms" : 1000.0 * mean_process_time,
+                "peak_frames" : self.peak_frames,
+                "received" : self.received}
+
+    ## isThreaded
+    #
+    # @return True/False the frames are delivered from a separate thread.
+    #
+    def isThreaded(self):
+        return self.thread is not None
+
+    ## resetStatistics
+    #
+    # Reset the counters.
+    #
+    def resetStatistics(self):
+        self.delivered = 0
+        self.dropped = 0
+        self.max_latency = 0.0
+        self.max_process_time = 0.0
+        self.peak_frames = len(self.queue)
+        self.received = 0
+        self.total_latency = 0.0
+        self.total_process_time = 0.0
+
+    ## run
+    #
+    # The thread of a threaded subscriber, this delivers frames as they arrive.
+    #
+    def run(self):
+        while True:
+            with self.lock:
+                while (len(self.queue) == 0):
+                    self.lock.wait()
+                self.busy = True
+            try:
+                self.deliverFrames()
+            except Exception as exception:
+                hdebug.logText("frame bus " + self.name + " failed " + str(exception))
+            finally:
+                with self.lock:
+                    self.busy = False
+                    self.lock.notify_all()
+
+    ## waitUntilDone
+    #
+    # Wait until a threaded subscriber has delivered all of the frames in its queue.
+    #
+    def waitUntilDone(self):
+        with self.lock:
+            while self.busy or (len(self.queue) > 0):
+                self.lock.wait(0.1)
+
+
+## FrameBus
+#
+# Queues frames for each of the subscribers and delivers them
+# from the event loop.
+#
+class FrameBus(QtCore.QObject):
+
+    ## __init__
+    #
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parent = None):
+        QtCore.QObject.__init__(self, parent)
+
+        self.subscribers = []
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.deliverFrames)
+
+    ## deliverFrames
+    #
+    # Deliver the queued frames to each of the (not threaded) subscribers in turn.
+    #
+    def deliverFrames(self):
+        for subscriber in self.subscribers:
+            if not subscriber.isThreaded():
+                subscriber.deliverFrames()
+
+    ## flush
+    #
+    # Deliver all of the frames that are currently queued. This is called
+    # before the start and at the end of filming so that the modules see
+    # all of the frames before they are told that filming has started or
+    # stopped.
+    #
+    def flush(self):
+        self.timer.stop()
+        self.deliverFrames()
+        for subscriber in self.subscribers:
+            if subscriber.isThreaded():
+                subscriber.waitUntilDone()
+
+    ## getStatistics
+    #
+    # @return A list of [name, policy, statistics dictionary] for each subscriber.
+    #
+    def getStatistics(self):
+        stats = []
+        for subscriber in self.subscribers:
+            stats.append([subscriber.name, subscriber.policy, subscriber.getStatistics()])
+        return stats
+
+    ## getStatisticsText
+    #
+    # Latency is the time that a frame spent in the queue, processing is
+    # the time that the module took to handle the frame (mean / max).
+    #
+    # @return A string with one line of statistics per subscriber.
+    #
+    def getStatisticsText(self):
+        text = ""
+        for [name, policy, stats] in self.getStatistics():
+            text += name + " (" + policy + "): "
+            text += str(stats["delivered"]) + " delivered, "
+            text += str(stats["dropped"]) + " dropped, "
+            text += "latency {0:.1f} / {1:.1f} ms, ".format(stats["mean_latency_ms"], stats["max_latency_ms"])
+            text += "processing {0:.1f} / {1:.1f} ms, ".format(stats["mean_process_ms"], stats["max_process_ms"])
+            text += "peak queue " + str(stats["peak_frames"]) + "\n"
+        return text
+
+    ## logStatistics
+    #
+    # Write the statistics to the debug log.
+    #
+    def logStatistics(self):
+        for line in self.getStatisticsText().splitlines():
+            hdebug.logText("frame bus " + line)
+
+    ## newFrames
+    #
+    # Add frames to the queue of each subscriber.
+    #
+    # @param frames A list of frame objects.
+    # @param filming True/False if we are currently filming.
+    #
+    def newFrames(self, frames, filming):
+        for frame in frames:
+            for subscriber in self.subscribers:
+                subscriber.addFrame(frame, filming)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    ## resetStatistics
+    #
+    # Reset the statistics of all the subscribers.
+    #
+    def resetStatistics(self):
+        for subscriber in self.subscribers:
+            subscriber.resetStatistics()
+
+    ## subscribe
+    #
+    # Add a module to the bus.
+    #
+    # @param module A HalModule object.
+    # @param name The name of the module.
+    # @param policy One of the policies ("every", "nth", "latest").
+    # @param interval (Optional) Deliver every interval frame (for the "nth" policy), default is 1.
+    # @param max_frames (Optional) The maximum number of frames in the queue, default is 100.
+    # @param filming_max_frames (Optional) The maximum number of frames in the queue when filming, default is 10 x max_frames.
+    # @param threaded (Optional) True/False deliver the frames from a separate thread, default is False.
+    #
+    def subscribe(self, module, name, policy, interval = 1, max_frames = 100, filming_max_frames = None, threaded = False):
+        if filming_max_frames is None:
+            filming_max_frames = 10 * max_frames
+        self.subscribers.append(FrameSubscriber(module, name, policy, interval, max_frames, filming_max_frames, threaded))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -39,6 +39,21 @@ class HalModule(object):
     def connectSignals(self, signals):
         pass
 
+    ## getFrameSubscription
+    #
+    # This returns how the module wants to receive frames from
+    # the camera (see halLib/frameBus.py). This can be overridden
+    # in the hardware file with the frame_policy, frame_interval and
+    # frame_queue elements of the module. The frame_filming_queue
+    # (the queue limit when filming) and frame_thread (deliver the
+    # frames from a separate thread) elements can also be set there.
+    #
+    # @return [policy, interval, maximum number of queued frames].
+    #
+    @hdebug.debug
+    def getFrameSubscription(self):
+        return ["every", 1, 100]
+
     ## getSignals
     #
     # This returns the (PyQt) signals that this module provides
@@ -107,6 +122,20 @@ class HalModule(object):
     def newShutters(self, shutters_filename):
         pass
 
+    ## prepareFilm
+    #
+    # Called when the name of the next film is known, which is usually
+    # while the current film is still being taken, so this should not
+    # change the state of the hardware. Modules can use this to do the
+    # slow parts of startFilm() (opening files, etc.) in advance. If the
+    # film is taken, startFilm() is called with the same film name.
+    #
+    # @param film_name The name of the next film without any extensions, or False to discard the previous preparation.
+    #
+    @hdebug.debug
+    def prepareFilm(self, film_name):
+        pass
+
     ## saveGUISettings
     #
     # Called when HAL closes so that the module can save any
@@ -152,6 +181,18 @@ class HalModule(object):
     def stopFilm(self, film_writer):
         pass
 
+    ## updateParameters
+    #
+    # Called when a new set of parameters is chosen. Modules whose
+    # newParameters() is slow (or moves hardware) can override this
+    # to skip newParameters() when none of their parameters changed.
+    #
+    # @param parameters A parameters object.
+    # @param changed The names of the parameters that are different from the previous parameters, or None if this is not known.
+    #
+    def updateParameters(self, parameters, changed):
+        self.newParameters(parameters)
+
 
 #
 # The MIT License
@@ -7,9 +7,18 @@
 # Hazen 02/14
 #
 
+import collections
 import copy
+import ctypes
+import ctypes.util
+import numpy
+import os
 import struct
+import sys
+import threading
+import time
 import tiffwriter
+import weakref
 
 import sc_library.hgit as hgit
 import sc_library.parameters as params
@@ -17,6 +26,12 @@ import sc_library.parameters as params
 # Get the version of the software.
 software_version = hgit.getVersion()
 
+# The file writer that owns each of the open movie files (by path).
+# A file writer only removes the files that it still owns, so
+# discarding an old file writer cannot remove a new film that was
+# created with the same name.
+file_owners = weakref.WeakValueDictionary()
+
 ## availableFileFormats
 #
 # Return a list of the available movie formats.
@@ -38,21 +53,22 @@ def availableFileFormats(ui_mode):
 # @param filename The name of the file.
 # @param parameters A parameters object.
 # @param cameras A array of camera names, such as ["camera1"].
+# @param film_settings (Optional) A film settings object.
 #
 # @return A file writer object.
 #
-def createFileWriter(filetype, filename, parameters, cameras):
+def createFileWriter(filetype, filename, parameters, cameras, film_settings = None):
     if (filetype == ".dax"):
-        return DaxFile(filename, parameters, cameras)
+        return DaxFile(filename, parameters, cameras, film_settings = film_settings)
     elif (filetype == ".dcf"):
-        return DualCameraFormatFile(filename, parameters, cameras)
+        return DualCameraFormatFile(filename, parameters, cameras, film_settings = film_settings)
     elif (filetype == ".spe"):
-        return SPEFile(filename, parameters, cameras)
+        return SPEFile(filename, parameters, cameras, film_settings = film_settings)
     elif (filetype == ".tif"):
-        return TIFFile(filename, parameters, cameras)
+        return TIFFile(filename, parameters, cameras, film_settings = film_settings)
     else:
         print "Unknown output file format, defaulting to .dax"
-        return DaxFile(filename, parameters, cameras)
+        return DaxFile(filename, parameters, cameras, film_settings = film_settings)
 
 ## getCameraSize
 #
@@ -67,6 +83,57 @@ def getCameraSize(parameters, camera_name):
     camera_obj = parameters.get(camera_name, parameters)
     return [camera_obj.get("x_pixels"), camera_obj.get("y_pixels")]
 
+## createFallocate
+#
+# Returns the C library posix_fallocate() function on linux. Python 2
+# does not have os.posix_fallocate(), so this is called with ctypes.
+#
+# @return posix_fallocate64(fd, offset, length) or None if it is not available.
+#
+def createFallocate():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        posix_fallocate = libc.posix_fallocate64
+    except (OSError, AttributeError):
+        return None
+    posix_fallocate.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    posix_fallocate.restype = ctypes.c_int
+    return posix_fallocate
+
+fallocate = createFallocate()
+
+## preallocateFile
+#
+# Reserve space on the disk for a file so that the file system
+# does not have to grow (and fragment) it one frame at a time.
+# On linux this uses posix_fallocate(), which allocates the blocks
+# of the file. Elsewhere the file is extended with truncate(), which
+# allocates the clusters of the file on NTFS, but on most other
+# file systems (e.g. HFS+) only creates a sparse file. The file
+# pointer is left at the start of the file.
+#
+# @param fp A file pointer.
+# @param size The size of the file in bytes.
+#
+# @return True/False if the space was reserved.
+#
+def preallocateFile(fp, size):
+    try:
+        if fallocate is not None:
+            fp.flush()
+            error = fallocate(fp.fileno(), 0, size)
+            if (error != 0):
+                raise OSError(error, os.strerror(error))
+        else:
+            fp.truncate(size)
+        fp.seek(0)
+        return True
+    except (IOError, OSError) as exception:
+        print "Could not preallocate", fp.name, str(exception)
+        return False
+
 ## writeInfFile
 #
 # Inf writing function. We save one of these regardless of the
@@ -128,6 +195,16 @@ def writeInfFile(filename, number_frames, parameters, camera):
     fp.write("Stage Z = {0:.2f}".format(p.get("acquisition.stage_position")[2]) + nl)
     fp.write("Lock Target = " + str(p.get("acquisition.lock_target")) + nl)
     fp.write("notes = " + str(p.get("film.notes")) + nl)
+
+    # Frame writer statistics (only when the frames were queued).
+    if p.has("acquisition.writer_peak_frames"):
+        fp.write("writer peak queue depth (frames) = " + str(p.get("acquisition.writer_peak_frames")) + nl)
+        fp.write("writer peak queue size (MB) = {0:.2f}".format(p.get("acquisition.writer_peak_mb")) + nl)
+        fp.write("writer dropped frames = " + str(p.get("acquisition.writer_dropped_frames")) + nl)
+        fp.write("writer mean write time (ms) = {0:.3f}".format(p.get("acquisition.writer_mean_ms")) + nl)
+        fp.write("writer max write time (ms) = {0:.3f}".format(p.get("acquisition.writer_max_ms")) + nl)
+    if p.has("acquisition.write_mb_per_second"):
+        fp.write("write speed (MB/s) = {0:.1f}".format(p.get("acquisition.write_mb_per_second")) + nl)
     fp.close()
 
 #def writeInfFile(file_class, stage_position, lock_target):
@@ -136,6 +213,158 @@ def writeInfFile(filename, number_frames, parameters, camera):
 #        nl =  "\n"
 
 
+## FrameWriterThread
+#
+# Drains a bounded queue of frames to the disk so that the camera
+# thread does not have to wait on the file system. The frames are
+# written in the order in which they were received using the file
+# writer's writeFrame() method.
+#
+# The queue is bounded both by the number of frames and (optionally)
+# by the number of bytes. When it is full addFrame() either waits
+# for space (block = True, nothing is lost) or drops the frame and
+# records that it did so.
+#
+class FrameWriterThread(threading.Thread):
+
+    ## __init__
+    #
+    # @param file_writer A GenericFile (sub-class) object.
+    # @param max_frames The maximum number of frames in the queue.
+    # @param max_bytes The maximum number of bytes in the queue, 0 for no limit.
+    # @param block True/False wait for space in the queue instead of dropping frames.
+    #
+    def __init__(self, file_writer, max_frames, max_bytes, block):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.block = block
+        self.condition = threading.Condition()
+        self.error = False
+        self.file_writer = file_writer
+        self.frames = collections.deque()
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.queued_bytes = 0
+        self.running = True
+
+        # Statistics.
+        self.dropped_frames = 0
+        self.max_write_time = 0.0
+        self.peak_bytes = 0
+        self.peak_frames = 0
+        self.total_write_time = 0.0
+        self.written_frames = 0
+
+    ## addFrame
+    #
+    # Add a frame to the queue. This is called by the camera thread.
+    # The queue holds a reference to the frame until it is written.
+    #
+    # @param frame A frame object.
+    #
+    def addFrame(self, frame):
+        size = frame.getData().nbytes
+        with self.condition:
+            while self.isFull(size):
+                if (not self.block) or self.error:
+                    self.dropped_frames += 1
+                    return
+                self.condition.wait()
+
+            frame.hold()
+            self.frames.append([frame, size])
+            self.queued_bytes += size
+            if (len(self.frames) > self.peak_frames):
+                self.peak_frames = len(self.frames)
+            if (self.queued_bytes > self.peak_bytes):
+                self.peak_bytes = self.queued_bytes
+            self.condition.notify_all()
+
+    ## getStatistics
+    #
+    # @return A dictionary of the writer statistics.
+    #
+    def getStatistics(self):
+        with self.condition:
+            mean_time = 0.0
+            if (self.written_frames > 0):
+                mean_time = self.total_write_time/float(self.written_frames)
+            return {"writer_dropped_frames" : self.dropped_frames,
+                    "writer_max_ms" : 1000.0 * self.max_write_time,
+                    "writer_mean_ms" : 1000.0 * mean_time,
+                    "writer_peak_frames" : self.peak_frames,
+                    "writer_peak_mb" : float(self.peak_bytes) * 0.000000953674}
+
+    ## isFull
+    #
+    # This should only be called with the condition acquired.
+    #
+    # @param size The size of the frame that is to be added in bytes.
+    #
+    # @return True/False if there is no room in the queue for a frame of this size.
+    #
+    def isFull(self, size):
+        if self.error:
+            return True
+        if (len(self.frames) >= self.max_frames):
+            return True
+        if (self.max_bytes > 0) and (len(self.frames) > 0) and ((self.queued_bytes + size) > self.max_bytes):
+            return True
+        return False
+
+    ## run
+    #
+    # Write frames until we are told to stop and the queue is empty.
+    #
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (len(self.frames) == 0):
+                    self.condition.wait()
+                if (len(self.frames) == 0):
+                    return
+                [frame, size] = self.frames[0]
+
+            # The frame stays in the queue while it is written so that
+            # the queue depth includes the frame that is being written.
+            start_time = time.time()
+            try:
+                self.file_writer.writeFrame(frame)
+            except Exception as exception:
+                print "Frame writer failed", str(exception)
+                with self.condition:
+                    self.error = True
+                    self.dropped_frames += len(self.frames)
+                    for [frame, size] in self.frames:
+                        frame.release()
+                    self.frames.clear()
+                    self.queued_bytes = 0
+                    self.condition.notify_all()
+                return
+            write_time = time.time() - start_time
+
+            frame.release()
+            with self.condition:
+                self.frames.popleft()
+                self.queued_bytes -= size
+                self.total_write_time += write_time
+                self.written_frames += 1
+                if (write_time > self.max_write_time):
+                    self.max_write_time = write_time
+                self.condition.notify_all()
+
+    ## stopThread
+    #
+    # Write out any frames that are still in the queue, then stop the thread.
+    #
+    def stopThread(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.join()
+
+
 ## GenericFile
 #
 # Generic file writing class
@@ -149,17 +378,18 @@ class GenericFile:
     # @param cameras A python array of camera names, e.g. ["camera1"].
     # @param extension The movie file extension (".spe", ".dax", etc.).
     # @param want_fp (Optional) Create file pointer(s) for saving the movie.
+    # @param film_settings (Optional) A film settings object.
     #
-    def __init__(self, filename, parameters, cameras, extension, want_fp = True):
+    def __init__(self, filename, parameters, cameras, extension, want_fp = True, film_settings = None):
         self.cameras = cameras
+        self.film_settings = film_settings
         self.is_open = True
-        self.parameters = parameters.copy()
-        self.parameters.set("acquisition", params.StormXMLObject([]))
+        self.setParameters(parameters)
 
-        # FIXME: different cameras could have different lock targets.
-        self.parameters.set("acquisition.lock_target", 0.0)
-        self.parameters.set("acquisition.spot_counts", "NA")
-        self.parameters.set("acquisition.stage_position", [0.0, 0.0, 0.0])
+        # The frame sizes (in bytes) for totalFilmSize().
+        self.bytes_per_frame = []
+        for camera in cameras:
+            self.bytes_per_frame.append(self.parameters.get(camera, self.parameters).get("bytes_per_frame"))
 
         self.filename = filename
         self.filenames = []
@@ -179,12 +409,28 @@ class GenericFile:
                 self.file_ptrs.append(open(fname, "wb"))
             self.number_frames.append(0)
 
+        for fname in self.filenames:
+            file_owners[os.path.normpath(fname)] = self
+
+        # Queued (asynchronous) frame writing. The default is to
+        # write the frames in the camera thread.
+        self.writer_thread = False
+        queue_frames = self.parameters.get("film.writer_queue_frames", 0)
+        if (queue_frames > 0):
+            queue_bytes = int(self.parameters.get("film.writer_queue_mb", 0) * 1048576)
+            self.writer_thread = FrameWriterThread(self,
+                                                   queue_frames,
+                                                   queue_bytes,
+                                                   self.parameters.get("film.writer_block", True))
+            self.writer_thread.start()
+
     ## closeFile
     #
     # Close the file pointers (if any) and write the .inf file.
     #
     def closeFile(self):
-        
+        self.stopWriterThread()
+
         # Close the files.
         if (len(self.file_ptrs)>0):
             for fp in self.file_ptrs:
@@ -204,6 +450,23 @@ class GenericFile:
             self.parameters.set("acquisition.number_frames", self.number_frames[i])
             self.parameters.saveToFile(filename + ".xml")
 
+        self.releaseFiles()
+        self.is_open = False
+
+    ## discardFile
+    #
+    # Closes and removes the files, this is for a file writer that was
+    # created in advance for a film that was then not taken. Files that
+    # now belong to another file writer are not removed.
+    #
+    def discardFile(self):
+        self.stopWriterThread()
+        for fp in self.file_ptrs:
+            fp.close()
+        for fname in self.filenames:
+            if self.ownsFile(fname) and os.path.exists(fname):
+                os.remove(fname)
+        self.releaseFiles()
         self.is_open = False
 
     ## getFilmLength()
@@ -234,6 +497,37 @@ class GenericFile:
     def getSpotCounts(self):
         return self.parameters.get("acquisition.spot_counts")
 
+    ## ownsFile
+    #
+    # @param fname The name of a movie file.
+    #
+    # @return True if this file writer is the last one that opened the file.
+    #
+    def ownsFile(self, fname):
+        return (file_owners.get(os.path.normpath(fname)) is self)
+
+    ## releaseFiles
+    #
+    # Gives up the ownership of the movie files (see file_owners).
+    #
+    def releaseFiles(self):
+        for fname in self.filenames:
+            if self.ownsFile(fname):
+                del file_owners[os.path.normpath(fname)]
+
+    ## saveFrame
+    #
+    # Saves a frame, either directly or by adding it to the
+    # queue of the frame writer thread.
+    #
+    # @param frame A frame object.
+    #
+    def saveFrame(self, frame):
+        if self.writer_thread:
+            self.writer_thread.addFrame(frame)
+        else:
+            self.writeFrame(frame)
+
 #    ## setLockTarget()
 #    #
 #    # @param lock_target The film's lock target.
@@ -255,6 +549,40 @@ class GenericFile:
 #    def setStagePosition(self, stage_position):
 #        self.stage_position = stage_position
 
+    ## setParameters
+    #
+    # Set the parameters that are saved with the film. This is called
+    # again at the start of the film for a file writer that was created
+    # in advance, as the parameters could have changed in the meantime.
+    #
+    # @param parameters A parameters object.
+    #
+    def setParameters(self, parameters):
+        self.parameters = parameters.copy()
+        self.parameters.set("acquisition", params.StormXMLObject([]))
+
+        # FIXME: different cameras could have different lock targets.
+        self.parameters.set("acquisition.lock_target", 0.0)
+        self.parameters.set("acquisition.spot_counts", "NA")
+        self.parameters.set("acquisition.stage_position", [0.0, 0.0, 0.0])
+
+        # The film settings do not change while filming, so the code that
+        # is called for every frame reads them from a frozen snapshot.
+        self.film_parameters = self.parameters.freeze()
+
+    ## stopWriterThread
+    #
+    # Write any queued frames to disk, stop the frame writer thread (if
+    # any) and record the writer statistics in the film parameters.
+    #
+    def stopWriterThread(self):
+        if self.writer_thread:
+            self.writer_thread.stopThread()
+            stats = self.writer_thread.getStatistics()
+            for key in sorted(stats):
+                self.parameters.set("acquisition." + key, stats[key])
+            self.writer_thread = False
+
     ## totalFilmSize
     #
     # @return The total size of the film taken so far in mega-bytes.    
@@ -262,8 +590,7 @@ class GenericFile:
     def totalFilmSize(self):
         total_size = 0.0
         for i in range(len(self.filenames)):
-            temp = self.parameters.get(self.cameras[i], self.parameters)
-            total_size += self.number_frames[i] * temp.get("bytes_per_frame") * 0.000000953674
+            total_size += self.number_frames[i] * self.bytes_per_frame[i] * 0.000000953674
         return total_size
 
     ## __del__
@@ -278,6 +605,11 @@ class GenericFile:
 #
 # Dax file writing class.
 #
+# Frames can (optionally) be collected into a buffer and written N
+# at a time (film.batch_frames, film.batch_mb) and the file for a
+# fixed length film can be allocated on the disk before filming
+# starts (film.preallocate).
+#
 class DaxFile(GenericFile):
 
     ## __init__
@@ -285,26 +617,118 @@ class DaxFile(GenericFile):
     # @param filename The name of the movie file (without an extension).
     # @param parameters A parameters object.
     # @param cameras A python array of camera names, e.g. ["camera1"].
+    # @param film_settings (Optional) A film settings object.
     #
-    def __init__(self, filename, parameters, cameras):
-        GenericFile.__init__(self, filename, parameters, cameras, "dax")
+    def __init__(self, filename, parameters, cameras, film_settings = None):
+        GenericFile.__init__(self, filename, parameters, cameras, "dax", film_settings = film_settings)
 
-    ## saveFrame
+        self.batch_buffers = []
+        self.batch_counts = []
+        self.big_endian = self.parameters.get("film.want_big_endian")
+        self.bytes_written = 0
+        self.preallocated = False
+        self.write_time = 0.0
+
+        batch_frames = self.parameters.get("film.batch_frames", 0)
+        batch_bytes = int(self.parameters.get("film.batch_mb", 0) * 1048576)
+        preallocate = self.parameters.get("film.preallocate", False)
+        if (not film_settings) or (film_settings.acq_mode != "fixed_length"):
+            preallocate = False
+
+        for i in range(len(self.cameras)):
+            [x_pixels, y_pixels] = getCameraSize(self.parameters, self.cameras[i])
+            frame_bytes = 2 * x_pixels * y_pixels
+
+            # Figure out how many frames to write at once. If both the
+            # number of frames and the size are specified the smaller
+            # of the two is used.
+            n_frames = batch_frames
+            if (batch_bytes > 0):
+                n_bytes_frames = max(1, batch_bytes/frame_bytes)
+                if (n_frames == 0) or (n_bytes_frames < n_frames):
+                    n_frames = n_bytes_frames
+            if (n_frames > 1):
+                self.batch_buffers.append(numpy.empty((n_frames, x_pixels * y_pixels), dtype = numpy.uint16))
+                self.batch_counts.append(0)
+
+            if preallocate:
+                if preallocateFile(self.file_ptrs[i], film_settings.frames_to_take * frame_bytes):
+                    self.preallocated = True
+
+        # All the cameras have to use the same mode.
+        if (len(self.batch_buffers) != len(self.cameras)):
+            self.batch_buffers = []
+            self.batch_counts = []
+
+    ## closeFile
+    #
+    # Writes any frames that are still in the batch buffers, removes any
+    # preallocated space that was not used and records the write speed.
+    #
+    def closeFile(self):
+        self.stopWriterThread()
+
+        for i in range(len(self.batch_buffers)):
+            self.writeBatch(i)
+
+        if self.preallocated:
+            for fp in self.file_ptrs:
+                fp.truncate(fp.tell())
+
+        if (self.write_time > 0.0):
+            self.parameters.set("acquisition.write_mb_per_second", float(self.bytes_written) * 0.000000953674 / self.write_time)
+
+        GenericFile.closeFile(self)
+
+    ## writeBatch
+    #
+    # Write the frames in a batch buffer to disk.
     #
-    # Saves a frame. If we have two cameras then this first figures
+    # @param index The index of the camera / file.
+    #
+    def writeBatch(self, index):
+        count = self.batch_counts[index]
+        if (count > 0):
+            np_data = self.batch_buffers[index][:count]
+            if self.big_endian:
+                np_data.byteswap(True)
+            self.writeData(index, np_data)
+            self.batch_counts[index] = 0
+
+    ## writeData
+    #
+    # Write a numpy array to one of the files and keep track of
+    # how long this took.
+    #
+    # @param index The index of the camera / file.
+    # @param np_data A numpy array.
+    #
+    def writeData(self, index, np_data):
+        start_time = time.time()
+        np_data.tofile(self.file_ptrs[index])
+        self.write_time += time.time() - start_time
+        self.bytes_written += np_data.nbytes
+
+    ## writeFrame
+    #
+    # Writes a frame. If we have two cameras then this first figures
     # out which of the two output files to save it to.
     #
     # @param frame A frame object.
     #
-    def saveFrame(self, frame):
+    def writeFrame(self, frame):
         for i in range(len(self.cameras)):
             if (frame.which_camera == self.cameras[i]):
                 np_data = frame.getData()
-                if self.parameters.get("film.want_big_endian"):
-                    np_data = np_data.byteswap()
-                    np_data.tofile(self.file_ptrs[i])
+                if self.batch_buffers:
+                    self.batch_buffers[i][self.batch_counts[i]] = np_data.reshape(-1)
+                    self.batch_counts[i] += 1
+                    if (self.batch_counts[i] == self.batch_buffers[i].shape[0]):
+                        self.writeBatch(i)
+                elif self.big_endian:
+                    self.writeData(i, np_data.byteswap())
                 else:
-                    np_data.tofile(self.file_ptrs[i])
+                    self.writeData(i, np_data)
 
                 self.number_frames[i] += 1
 
@@ -323,28 +747,31 @@ class DualCameraFormatFile(GenericFile):
     # @param filename The name of the movie file (without an extension).
     # @param parameters A parameters object.
     # @param cameras A python array of camera names, e.g. ["camera1"].
+    # @param film_settings (Optional) A film settings object.
     #
-    def __init__(self, filename, parameters, cameras):
-        GenericFile.__init__(self, filename, parameters, cameras, "dax")
+    def __init__(self, filename, parameters, cameras, film_settings = None):
+        GenericFile.__init__(self, filename, parameters, cameras, "dax", film_settings = film_settings)
 
-    ## saveFrame
+    ## writeFrame
     #
-    # Saves a frame. In this format the camera information (i.e. which
+    # Writes a frame. In this format the camera information (i.e. which
     # camera the frame is from) is encoded into the first pixel of the picture.
     #
+    # The camera pixel is written separately from the rest of the frame so
+    # that the frame data (which may be a shared camera buffer) does not have
+    # to be copied or modified.
+    #
     # @param frame A frame object.
     #
-    def saveFrame(self, frame):
-        #camera_int = int(frame.which_camera[6:])-1
-        np_data = frame.getData().copy()
-        np_data[0] = int(frame.which_camera[6:])-1
-        #temp = chr(camera_int) + chr(camera_int) + copy.copy(frame.data[2:])
-        if self.parameters.get("film.want_big_endian"):
-            np_data.tofile(self.file_ptrs[0]).byteswap()
-            #self.file_ptrs[0].write(fconv.LEtoBE(temp))
+    def writeFrame(self, frame):
+        camera_pixel = numpy.array([int(frame.which_camera[6:])-1], dtype = numpy.uint16)
+        np_data = frame.getData()
+        if self.film_parameters.get("film.want_big_endian"):
+            camera_pixel.byteswap().tofile(self.file_ptrs[0])
+            np_data[1:].byteswap().tofile(self.file_ptrs[0])
         else:
-            np_data.tofile(self.file_ptrs[0])
-            #self.file_ptrs[0].write(temp)
+            camera_pixel.tofile(self.file_ptrs[0])
+            np_data[1:].tofile(self.file_ptrs[0])
         self.number_frames[0] += 1
 
 ## SPEFile
@@ -358,9 +785,10 @@ class SPEFile(GenericFile):
     # @param filename The name of the movie file (without an extension).
     # @param parameters A parameters object.
     # @param cameras A python array of camera names, e.g. ["camera1"].
+    # @param film_settings (Optional) A film settings object.
     #
-    def __init__(self, filename, parameters, cameras):
-        GenericFile.__init__(self, filename, parameters, cameras, "spe")
+    def __init__(self, filename, parameters, cameras, film_settings = None):
+        GenericFile.__init__(self, filename, parameters, cameras, "spe", film_settings = film_settings)
         
         # write headers
         for i in range(len(self.file_ptrs)):
@@ -391,11 +819,11 @@ class SPEFile(GenericFile):
 
             fp.seek(4100)
 
-    ## saveFrame
+    ## writeFrame
     #
     # @param frame A frame object.
     #
-    def saveFrame(self, frame):
+    def writeFrame(self, frame):
         for i in range(len(self.cameras)):
             if (frame.which_camera == self.cameras[i]):
                 np_data = frame.getData()
@@ -410,6 +838,8 @@ class SPEFile(GenericFile):
     # then closes the file.
     #
     def closeFile(self):
+        self.stopWriterThread()
+
         # write film length & close the file
         for i in range(len(self.file_ptrs)):
             self.file_ptrs[i].seek(1446)
@@ -419,9 +849,11 @@ class SPEFile(GenericFile):
 
 ## TIFFile
 #
-# TIF file writing class. Note that this is a normal tif file format
+# TIF file writing class. By default this is a normal tif file format
 # and not a big tif format so the maximum size is limited to 4GB
-# more or less.
+# more or less. If film.want_bigtiff is set the movie is saved as a
+# BigTIFF, optionally with an OME-XML description that includes the
+# film parameters (film.want_ome_xml).
 #
 class TIFFile(GenericFile):
 
@@ -432,37 +864,66 @@ class TIFFile(GenericFile):
     # @param filename The name of the movie file (without an extension).
     # @param parameters A parameters object.
     # @param cameras A python array of camera names, e.g. ["camera1"].
+    # @param film_settings (Optional) A film settings object.
     #
-    def __init__(self, filename, parameters, cameras):
-        GenericFile.__init__(self, filename, parameters, cameras, "tif", want_fp = False)
+    def __init__(self, filename, parameters, cameras, film_settings = None):
+        GenericFile.__init__(self, filename, parameters, cameras, "tif", want_fp = False, film_settings = film_settings)
+
+        self.want_bigtiff = self.parameters.get("film.want_bigtiff", False)
+        self.want_ome_xml = self.want_bigtiff and self.parameters.get("film.want_ome_xml", False)
 
         self.tif_writers = []
         for i in range(len(cameras)):
-            tif_writer = tiffwriter.TiffWriter(self.filenames[i],
-                                               software = "hal4000")
+            if self.want_bigtiff:
+                tif_writer = tiffwriter.BigTiffWriter(self.filenames[i],
+                                                      software = "hal4000",
+                                                      ifd_block = self.parameters.get("film.bigtiff_ifd_block", 0))
+            else:
+                tif_writer = tiffwriter.TiffWriter(self.filenames[i],
+                                                   software = "hal4000")
             self.tif_writers.append(tif_writer)
 
-    ## saveFrame
+    ## writeFrame
     #
     # @param frame A frame object.
     #
-    def saveFrame(self, frame):
+    def writeFrame(self, frame):
         for i in range(len(self.cameras)):
             if (frame.which_camera == self.cameras[i]):
-                [x_pixels, y_pixels] = getCameraSize(self.parameters, self.cameras[i])
+                [x_pixels, y_pixels] = getCameraSize(self.film_parameters, self.cameras[i])
                 self.tif_writers[i].addFrame(frame.getData(), x_pixels, y_pixels)
 
                 self.number_frames[i] += 1
 
     ## closeFile
     #
-    # Closes the tif file writers.
+    # Closes the tif file writers. The OME-XML description (if any) is
+    # created here so that it includes the acquisition information.
     #
     def closeFile(self):
-        for writer in self.tif_writers:
+        self.stopWriterThread()
+        for i, writer in enumerate(self.tif_writers):
+            if self.want_ome_xml:
+                [x_pixels, y_pixels] = getCameraSize(self.parameters, self.cameras[i])
+                self.parameters.set("acquisition.camera", "camera" + str(i+1))
+                self.parameters.set("acquisition.number_frames", self.number_frames[i])
+                writer.setDescription(tiffwriter.createOMEXML(x_pixels,
+                                                              y_pixels,
+                                                              self.number_frames[i],
+                                                              name = os.path.basename(self.filenames[i]),
+                                                              parameters_xml = self.parameters.toXML()))
             writer.close()
         GenericFile.closeFile(self)
 
+    ## discardFile
+    #
+    # Closes the tif file writers and removes the files.
+    #
+    def discardFile(self):
+        for writer in self.tif_writers:
+            writer.close()
+        GenericFile.discardFile(self)
+
 #
 # Testing
 # 
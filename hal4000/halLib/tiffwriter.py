@@ -6,12 +6,19 @@
 # is written as a single strip to make things a bit less 
 # of headache.
 #
+# TiffWriter writes classic (32 bit offset) tiff files, which
+# are limited to 4GB. BigTiffWriter writes BigTIFF files (64 bit
+# offsets) which do not have this limit and can include an
+# OME-XML description of the movie.
+#
 # Hazen 10/13
 #
 
 import struct
 import time
 
+from xml.etree import ElementTree
+
 # some tag definitions to make the code easier to read
 NewSubfileType = 254
 ImageWidth = 256
@@ -28,6 +35,53 @@ YResolution = 283
 ResolutionUnit = 296
 Software = 305
 DateTime = 306
+ImageDescription = 270
+
+# BigTIFF tag types.
+bigtiff_types = {"ascii" : 2,
+                 "short" : 3,
+                 "long" : 4,
+                 "rational" : 5,
+                 "long8" : 16}
+
+## createOMEXML
+#
+# Creates a (minimal) OME-XML description of a 16 bit single channel
+# movie. The (optional) parameters are stored as an XML annotation
+# so that the file contains all the acquisition settings.
+#
+# @param x_size The size of a frame in x (in pixels).
+# @param y_size The size of a frame in y (in pixels).
+# @param frames The number of frames in the movie.
+# @param name (Optional) The name of the movie.
+# @param parameters_xml (Optional) An ElementTree element, e.g. from StormXMLObject.toXML().
+#
+# @return The OME-XML as a string.
+#
+def createOMEXML(x_size, y_size, frames, name = "", parameters_xml = None):
+    ome = ElementTree.Element("OME", {"xmlns" : "http://www.openmicroscopy.org/Schemas/OME/2016-06"})
+    image = ElementTree.SubElement(ome, "Image", {"ID" : "Image:0", "Name" : name})
+    pixels = ElementTree.SubElement(image, "Pixels", {"ID" : "Pixels:0",
+                                                      "DimensionOrder" : "XYZCT",
+                                                      "Type" : "uint16",
+                                                      "BigEndian" : "false",
+                                                      "SizeX" : str(x_size),
+                                                      "SizeY" : str(y_size),
+                                                      "SizeZ" : "1",
+                                                      "SizeC" : "1",
+                                                      "SizeT" : str(frames)})
+    ElementTree.SubElement(pixels, "Channel", {"ID" : "Channel:0:0", "SamplesPerPixel" : "1"})
+    ElementTree.SubElement(pixels, "TiffData", {"IFD" : "0", "PlaneCount" : str(frames)})
+
+    if parameters_xml is not None:
+        ElementTree.SubElement(image, "AnnotationRef", {"ID" : "Annotation:0"})
+        annotations = ElementTree.SubElement(ome, "StructuredAnnotations")
+        annotation = ElementTree.SubElement(annotations, "XMLAnnotation", {"ID" : "Annotation:0",
+                                                                           "Namespace" : "storm-control/hal4000/parameters"})
+        value = ElementTree.SubElement(annotation, "Value")
+        value.append(parameters_xml)
+
+    return "<?xml version=\"1.0\" encoding=\"UTF-8\"?>" + ElementTree.tostring(ome)
 
 ## TiffWriter
 #
@@ -180,6 +234,216 @@ class TiffWriter:
         else:
             print "unknown tag_type", tag_type, "this tiff file will be mal-formed"
 
+
+## BigTiffWriter
+#
+# This class encapsulates writing 16 bit single channel BigTIFF movies
+# to a file.
+#
+# The image data is written strictly sequentially. The location of each
+# frame is kept in memory and the IFDs are written in a single block
+# when the file is closed, or every ifd_block frames if this is not 0
+# so that most of a movie can be recovered if the program crashes. The
+# only seeks are to patch the header, the last IFD of the previous
+# block and (if the description is set after the first block of IFDs
+# was written) the ImageDescription tag of the first IFD.
+#
+class BigTiffWriter:
+
+    ## __init__
+    #
+    # @param filename The name of the tif file to write.
+    # @param software (Optional) The name of the program that is "creating" the tif file, defaults to "unknown".
+    # @param ifd_block (Optional) Write the IFDs every ifd_block frames, the default is 0 (at close).
+    #
+    def __init__(self, filename, software = "unknown", ifd_block = 0):
+        self.bytes_per_pixel = 2
+        self.description = ""
+        self.description_tag_loc = 0
+        self.fp = open(filename, "wb")
+        self.frames = []
+        self.ifd_block = ifd_block
+        self.last_next_ifd_offset = 8
+        self.software = software + chr(0)
+        self.written_ifds = 0
+
+        cur_time = time.localtime()
+        self.date_time = "{0:04d}:{1:02d}:{2:02d} {3:02d}:{4:02d}:{5:02d}".format(cur_time.tm_year,
+                                                                                  cur_time.tm_mon,
+                                                                                  cur_time.tm_mday,
+                                                                                  cur_time.tm_hour,
+                                                                                  cur_time.tm_min,
+                                                                                  cur_time.tm_sec) + chr(0)
+
+        #
+        # Write BigTIFF header, the offset of the first IFD is
+        # filled in when the first block of IFDs is written.
+        #
+        self.fp.write(struct.pack("<2sHHHQ", "II", 43, 8, 0, 0))
+
+    ## addFrame
+    #
+    # Adds a frame (numpy.uint16 array) to the tiff image.
+    #
+    # @param np_frame The image data as a numpy.uint16 array.
+    # @param x_size The size of the frame in x (in pixels).
+    # @param y_size The size of the frame in y (in pixels).
+    #
+    def addFrame(self, np_frame, x_size, y_size):
+        self.frames.append([self.fp.tell(), x_size, y_size])
+        np_frame.tofile(self.fp)
+
+        if (self.ifd_block > 0) and ((len(self.frames) - self.written_ifds) >= self.ifd_block):
+            self.writeIFDs()
+
+    ## close
+    #
+    # Writes any remaining IFDs and closes the file.
+    #
+    def close(self):
+        self.writeIFDs()
+        self.fp.close()
+
+    ## setDescription
+    #
+    # Set the ImageDescription tag of the first frame, this is typically
+    # OME-XML. If the first block of IFDs has already been written the
+    # description is added at the end of the file and the (reserved)
+    # ImageDescription tag of the first IFD is pointed at it.
+    #
+    # @param description A string.
+    #
+    def setDescription(self, description):
+        self.description = description
+        if (self.written_ifds > 0):
+            data = description + chr(0)
+            data_offset = self.fp.tell()
+            if (len(data) > 8):
+                self.fp.write(data)
+            end_of_file = self.fp.tell()
+            self.fp.seek(self.description_tag_loc)
+            self.fp.write(packBigTag(ImageDescription, "ascii", len(data), [data, data_offset]))
+            self.fp.seek(end_of_file)
+
+    ## writeIFDs
+    #
+    # Write the IFDs of all the frames that do not have one yet, along
+    # with the (ascii) data that they point to, in one block at the
+    # current end of the file.
+    #
+    def writeIFDs(self):
+        if (self.written_ifds == len(self.frames)):
+            return
+
+        block_start = self.fp.tell()
+        block = []
+
+        # Ascii data shared by all the IFDs in this block.
+        software_offset = block_start
+        block.append(self.software)
+        datetime_offset = software_offset + len(self.software)
+        block.append(self.date_time)
+        offset = datetime_offset + len(self.date_time)
+        description = ""
+        if (self.written_ifds == 0) and self.description:
+            description = self.description + chr(0)
+            description_offset = offset
+            block.append(description)
+            offset += len(description)
+
+        # Keep the IFDs word aligned.
+        if ((offset % 2) != 0):
+            block.append(chr(0))
+            offset += 1
+
+        first_ifd_offset = offset
+        next_ifd_offset_loc = 0
+        for i in range(self.written_ifds, len(self.frames)):
+            [image_offset, x_size, y_size] = self.frames[i]
+            image_size = x_size * y_size * self.bytes_per_pixel
+
+            tags = []
+            if (len(self.frames) > 1):
+                tags.append([NewSubfileType, "long", 1, 2])
+            else:
+                tags.append([NewSubfileType, "long", 1, 0])
+            tags.append([ImageWidth, "long", 1, x_size])
+            tags.append([ImageLength, "long", 1, y_size])
+            tags.append([BitsPerSample, "short", 1, 8 * self.bytes_per_pixel])
+            tags.append([Compression, "short", 1, 1])
+            tags.append([PhotometricInterpretation, "short", 1, 1])
+            # The first IFD always has an ImageDescription tag, so that
+            # the description can still be set after it was written.
+            if (i == 0):
+                self.description_tag_loc = offset + 8 + 20 * len(tags)
+                if description:
+                    tags.append([ImageDescription, "ascii", len(description), [description, description_offset]])
+                else:
+                    tags.append([ImageDescription, "ascii", 1, [chr(0), 0]])
+            tags.append([StripOffsets, "long8", 1, image_offset])
+            tags.append([SamplesPerPixel, "short", 1, 1])
+            tags.append([RowsPerStrip, "long", 1, y_size])
+            tags.append([StripByteCounts, "long8", 1, image_size])
+            tags.append([XResolution, "rational", 1, [1, 1]])
+            tags.append([YResolution, "rational", 1, [1, 1]])
+            tags.append([ResolutionUnit, "short", 1, 1])
+            tags.append([Software, "ascii", len(self.software), [self.software, software_offset]])
+            tags.append([DateTime, "ascii", len(self.date_time), [self.date_time, datetime_offset]])
+
+            ifd = [struct.pack("<Q", len(tags))]
+            for [tag, tag_type, count, value] in tags:
+                ifd.append(packBigTag(tag, tag_type, count, value))
+
+            # Next IFD offset, this is zero for the last IFD in the block.
+            ifd_size = 8 + 20 * len(tags) + 8
+            if (i == (len(self.frames) - 1)):
+                next_ifd_offset_loc = offset + ifd_size - 8
+                ifd.append(struct.pack("<Q", 0))
+            else:
+                ifd.append(struct.pack("<Q", offset + ifd_size))
+            block.append("".join(ifd))
+            offset += ifd_size
+
+        self.fp.write("".join(block))
+        end_of_file = self.fp.tell()
+
+        # Point the header, or the last IFD of the previous block, at this block.
+        self.fp.seek(self.last_next_ifd_offset)
+        self.fp.write(struct.pack("<Q", first_ifd_offset))
+        self.fp.seek(end_of_file)
+
+        self.last_next_ifd_offset = next_ifd_offset_loc
+        self.written_ifds = len(self.frames)
+
+
+## packBigTag
+#
+# Pack a single BigTIFF tag. Values that fit in 8 bytes are stored
+# in the tag, everything else is an offset.
+#
+# @param tag A tif tag (this is a integer, see tag definitions at the start of the file).
+# @param tag_type The tag type, "ascii", "short", "long", "rational" or "long8".
+# @param count The number of elements in tag (this is usually 1, except for ascii where it is the length of the string).
+# @param value The tag value, for rationals this is [numerator, denominator], for ascii it is [string, offset].
+#
+# @return A 20 byte string.
+#
+def packBigTag(tag, tag_type, count, value):
+    header = struct.pack("<HHQ", tag, bigtiff_types[tag_type], count)
+    if (tag_type == "ascii"):
+        if (count <= 8):
+            return header + struct.pack("8s", value[0])
+        else:
+            return header + struct.pack("<Q", value[1])
+    elif (tag_type == "short"):
+        return header + struct.pack("<HHI", value, 0, 0)
+    elif (tag_type == "long"):
+        return header + struct.pack("<II", value, 0)
+    elif (tag_type == "rational"):
+        return header + struct.pack("<II", value[0], value[1])
+    else:
+        return header + struct.pack("<Q", value)
+
     
 if __name__ == "__main__":
 
@@ -198,6 +462,14 @@ if __name__ == "__main__":
 
     im.close()
 
+    # BigTIFF with an OME-XML description.
+    if (len(sys.argv) > 2):
+        im = BigTiffWriter(sys.argv[2], software = "hal4000")
+        for i in range(5):
+            im.addFrame(frame + i, frame_x, frame_y)
+        im.setDescription(createOMEXML(frame_x, frame_y, 5, name = sys.argv[2]))
+        im.close()
+
 
 #
 # The MIT License
@@ -6,12 +6,49 @@
 #
 # Hazen 02/14
 #
+# Messages are passed to the modules through per module dispatch
+# queues. The messages in a queue are handled one at a time, but
+# messages in different queues can be handled at the same time, so
+# a client can have several requests in flight. While HAL is filming
+# only the messages that do not change the setup are handled, the
+# others are rejected.
+#
+
+import time
+
+from PyQt4 import QtCore
 
 import halLib.halModule as halModule
 
 import sc_library.hdebug as hdebug
 from sc_library.tcpServer import TCPServer
 
+## message_routes
+#
+# For each message type, the HAL module that handles it, the dispatch
+# queue that it goes into (None means that it is passed on immediately)
+# and True/False it can be handled while filming. Messages that are not
+# in this table are passed on immediately, but not while filming.
+#
+message_routes = {"Abort Movie" : ["hal", None, True],
+                  "Get Frame" : ["hal", "hal", True],
+                  "Get Mosaic Settings" : ["hal", "hal", True],
+                  "Get Objective" : ["hal", "hal", True],
+                  "Prepare Movie" : ["hal", None, True],
+                  "Set Directory" : ["hal", "film", False],
+                  "Set Parameters" : ["hal", "film", False],
+                  "Take Movie" : ["hal", "film", False],
+                  "Check Focus Lock" : ["focuslock", "focuslock", True],
+                  "Find Optimal Sum" : ["focuslock", "focuslock", False],
+                  "Find Sum" : ["focuslock", "focuslock", False],
+                  "Recenter Piezo" : ["focuslock", "focuslock", False],
+                  "Set Lock Target" : ["focuslock", "focuslock", False],
+                  "Increment Power" : ["illumination", "illumination", True],
+                  "Set Power" : ["illumination", "illumination", True],
+                  "Set Progression" : ["progressions", "progressions", False],
+                  "Get Stage Position" : ["stage", "stage", True],
+                  "Move Stage" : ["stage", "stage", False]}
+
 ## TCP/IP Control Class
 #
 # To allow only one connection at a time from the local computer
@@ -19,6 +56,7 @@ from sc_library.tcpServer import TCPServer
 # connection is broken the server is opened again.
 #
 class HalTCPControl(TCPServer, halModule.HalModule):
+    commMessage = QtCore.pyqtSignal(object)
 
     ## __init__
     #
@@ -38,6 +76,13 @@ class HalTCPControl(TCPServer, halModule.HalModule):
                            verbose = True)
         halModule.HalModule.__init__(self)
 
+        self.filming = False
+        self.handlers = []
+        self.queues = {}
+        self.received = {}
+
+        self.messageReceived.connect(self.handleMessage)
+
     ## connectSignals
     #
     # @param signals An array of signals that we might be interested in connecting to.
@@ -47,6 +92,7 @@ class HalTCPControl(TCPServer, halModule.HalModule):
         for signal in signals:
             if (signal[1] == "tcpComplete"):
                 signal[2].connect(self.sendMessage)
+                self.handlers.append(signal[0])
 
     ## getSignals
     #
@@ -56,7 +102,96 @@ class HalTCPControl(TCPServer, halModule.HalModule):
     def getSignals(self):
         return [[self.hal_type, "commGotConnection", self.comGotConnection],
                 [self.hal_type, "commLostConnection", self.comLostConnection],
-                [self.hal_type, "commMessage", self.messageReceived]]
+                [self.hal_type, "commMessage", self.commMessage]]
+
+    ## handleClientDisconnect
+    #
+    # Log the message latency when the client disconnects.
+    #
+    def handleClientDisconnect(self):
+        TCPServer.handleClientDisconnect(self)
+        self.logLatency()
+
+    ## handleMessage
+    #
+    # Pass a message from the client on to the modules. If the queue
+    # for the message is busy the message waits until the message(s)
+    # in front of it have been handled.
+    #
+    # @param message A TCPMessage object.
+    #
+    def handleMessage(self, message):
+        self.received[message.getID()] = [message.getType(), time.time()]
+        route = message_routes.get(message.getType())
+
+        # Reject messages that would change the setup while filming.
+        if self.filming and ((route is None) or (not route[2])):
+            message.setError(True, "Hal is filming")
+            self.sendMessage(message)
+            return
+
+        # Messages that do not go into a queue, or that are handled by a
+        # module that this setup does not have, are passed on immediately.
+        if (route is None) or (route[1] is None) or (not route[0] in self.handlers):
+            self.commMessage.emit(message)
+            return
+
+        if not route[1] in self.queues:
+            self.queues[route[1]] = []
+        queue = self.queues[route[1]]
+        queue.append(message)
+        if (len(queue) == 1):
+            self.commMessage.emit(message)
+
+    ## resetConnection
+    #
+    # Also forget about any messages from the previous client.
+    #
+    def resetConnection(self):
+        TCPServer.resetConnection(self)
+        self.latency.reset()
+        self.queues = {}
+        self.received = {}
+
+    ## sendMessage
+    #
+    # Send the reply to a message and pass on the next message (if any)
+    # in the queue of the message.
+    #
+    # @param message A TCPMessage object.
+    #
+    def sendMessage(self, message):
+        if message.getID() in self.received:
+            [message_type, receive_time] = self.received.pop(message.getID())
+            self.latency.addLatency(message_type, time.time() - receive_time)
+
+        if self.isConnected():
+            TCPServer.sendMessage(self, message)
+
+        route = message_routes.get(message.getType())
+        if route is not None:
+            queue = self.queues.get(route[1], [])
+            if (len(queue) > 0) and (queue[0].getID() == message.getID()):
+                queue.pop(0)
+                if (len(queue) > 0):
+                    self.commMessage.emit(queue[0])
+
+    ## startFilm
+    #
+    # @param film_name The name of the film without any extensions, or False if the film is not being saved.
+    # @param run_shutters True/False the shutters should be run or not.
+    #
+    @hdebug.debug
+    def startFilm(self, film_name, run_shutters):
+        self.filming = True
+
+    ## stopFilm
+    #
+    # @param film_writer The film writer object, or False if the film was not saved.
+    #
+    @hdebug.debug
+    def stopFilm(self, film_writer):
+        self.filming = False
 
 #
 # The MIT License
@@ -7,6 +7,7 @@
 # Hazen 04/14
 #
 
+import numpy
 from PyQt4 import QtCore
 
 import illumination.illuminationChannelUI as illuminationChannelUI
@@ -242,15 +243,15 @@ class Channel(QtCore.QObject):
     # This both sets the internal shutter data store and converts it
     # to the appropriate scale based on the analog modulation settings.
     #
-    # @param shutter_data A array containing the shutter data.
+    # @param shutter_data A numpy array containing the shutter data. This is
+    #    not changed as it may be shared with other users of the shutters file.
     #
     # @return The processed shutter data.
     #
     def newShutters(self, shutter_data):
         self.shutter_data = shutter_data
         if self.analog_modulation:
-            for i in range(len(self.shutter_data)):
-                self.shutter_data[i] = self.analog_modulation.powerToVoltage(self.channel_id, self.shutter_data[i])
+            self.shutter_data = self.analog_modulation.powerToVoltage(self.channel_id, self.shutter_data)
 
         return self.shutter_data
 
@@ -300,7 +301,7 @@ class Channel(QtCore.QObject):
 
         # Figure out if this channel is used for filming.
         self.used_for_film = False
-        if any((y > 0.0) for y in self.shutter_data):
+        if numpy.any(numpy.asarray(self.shutter_data) > 0.0):
             self.used_for_film = True
 
         # Add analog waveform data.
@@ -7,6 +7,8 @@
 # Hazen 04/14
 #
 
+import os
+
 from PyQt4 import QtCore, QtGui
 
 import qtWidgets.qtAppIcon as qtAppIcon
@@ -45,6 +47,7 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
         self.hardware_modules = {}
         self.fp = False
         self.parameters = parameters
+        self.prepared_fp = False
         self.running_shutters = False
         self.spacing = 3
 
@@ -150,12 +153,12 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
             if not message.isTest():
                 self.remoteSetPower(message.getData("channel"),
                                     message.getData("power"))
-            self.tcpMessage.emit(message)
+            self.tcpComplete.emit(message)
         elif (message.getType() == "Increment Power"):
             if not message.isTest():
                 self.remoteIncPower(message.getData("channel"),
                                     message.getData("increment"))
-            self.tcpMessage.emit(message)
+            self.tcpComplete.emit(message)
 
     ## handleOk
     #
@@ -251,6 +254,40 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
         self.newColors.emit(colors)
         self.newCycleLength.emit(frames)
 
+    ## openPowerFile
+    #
+    # Opens the file that the channel powers are saved in during filming.
+    #
+    # @param film_name The name of the film without any extensions.
+    #
+    # @return A file pointer.
+    #
+    def openPowerFile(self, film_name):
+        fp = open(film_name + ".power", "w")
+        str = "frame"
+        for channel in self.channels:
+            str = str + " " + channel.getName()
+        fp.write(str + "\n")
+        return fp
+
+    ## prepareFilm
+    #
+    # Opens the power file of the next film in advance. The shutter
+    # waveforms are already calculated in newShutters(), but they can
+    # only be passed to the hardware at the start of the film.
+    #
+    # @param film_name The name of the next film, or False to discard the power file.
+    #
+    @hdebug.debug
+    def prepareFilm(self, film_name):
+        if self.prepared_fp:
+            [name, fp] = self.prepared_fp
+            fp.close()
+            os.remove(name + ".power")
+            self.prepared_fp = False
+        if film_name:
+            self.prepared_fp = [film_name, self.openPowerFile(film_name)]
+
     ## remoteIncPower
     #
     # Calls QIlluminationControl's remoteIncPower method.
@@ -283,11 +320,11 @@ class IlluminationControl(QtGui.QDialog, halModule.HalModule):
 
         # Recording the power.
         if film_name:
-            self.fp = open(film_name + ".power", "w")
-            str = "frame"
-            for channel in self.channels:
-                str = str + " " + channel.getName()
-            self.fp.write(str + "\n")
+            if self.prepared_fp and (self.prepared_fp[0] == film_name):
+                self.fp = self.prepared_fp[1]
+                self.prepared_fp = False
+            else:
+                self.fp = self.openPowerFile(film_name)
 
         # Running the shutters.
         if run_shutters:
@@ -7,11 +7,21 @@
 # Hazen 04/14
 #
 
+import collections
+import numpy
+import os
 import xml.etree.ElementTree as ElementTree
 
 # Debugging
 import sc_library.hdebug as hdebug
 
+#
+# Compiled shutter sequences, keyed by (file name, modification
+# time, number of channels, oversampling). The most recently used
+# sequence is last.
+#
+shutters_cache = collections.OrderedDict()
+shutters_cache_size = 10
 
 ## HardwareXMLObject
 #
@@ -96,24 +106,25 @@ def parseHardwareXML(hardware_xml_file):
     return xml_object
 
 
-## parseXML
+## compileShuttersXML
 #
-# This parses a XML file that defines a shutter sequence.
+# This parses a XML file that defines a shutter sequence and creates
+# the waveforms. The waveforms are stored in a single (read only) 2D
+# numpy array with one row per channel.
 #
 # @param number_channels The number of channels.
 # @param shutters_file The name of the shutter sequence xml file.
+# @param oversampling The number of waveform values per frame (if not specified in the file).
 #
 # @return [waveforms, colors, frames, oversampling]
 #
-@hdebug.debug
-def parseShuttersXML(number_channels, shutters_file, oversampling = 100):
+def compileShuttersXML(number_channels, shutters_file, oversampling):
 
     # Load XML shutters file.
     xml = ElementTree.parse(shutters_file).getroot()
     assert xml.tag == "repeat", shutters_file + " is not a shutters file."
 
-    # Use user-specified oversampling (if requested), otherwise use 100.
-    oversampling = 100
+    # Use the oversampling in the file (if specified).
     if xml.find("oversampling") is not None:
         oversampling = int(xml.find("oversampling").text)
 
@@ -125,21 +136,14 @@ def parseShuttersXML(number_channels, shutters_file, oversampling = 100):
     # other modules (such as the spot counter) to associate a color with the
     # a particular frame when, for example, updating the STORM image.
     #
-    color_data = []
-    for i in range(frames):
-        color_data.append(0)
+    color_data = [0] * frames
 
     #
     # Create waveforms.
     #
     # Blank waveforms are created for all channels, even those that are not used.
     #
-    waveforms = []
-    for i in range(number_channels):
-        waveform = []
-        for j in range(frames * oversampling):
-            waveform.append(0.0)
-        waveforms.append(waveform)
+    waveforms = numpy.zeros((number_channels, frames * oversampling))
 
     # Add in the events.
     for event in xml.findall("event"):
@@ -174,24 +178,52 @@ def parseShuttersXML(number_channels, shutters_file, oversampling = 100):
             assert off <= frames * oversampling, "off out of range: " + str(on) + " " + str(channel)
 
             # Channel waveform setup.
-            i = on
-            waveform = waveforms[channel]
-            while i < off:
-                waveform[i] = power
-                i += 1
+            if (off > on):
+                waveforms[channel,on:off] = power
 
             # Color information setup.
             if color:
                 color_start = int(round(float(on)/float(oversampling)))
                 color_end = int(round(float(off)/float(oversampling)))
-                i = color_start
-                while i < color_end:
-                    color_data[i] = color
-                    i += 1
+                if (color_end > color_start):
+                    color_data[color_start:color_end] = [color] * (color_end - color_start)
+
+    # The waveforms are shared by everyone who loads this file.
+    waveforms.flags.writeable = False
 
     return [waveforms, color_data, frames, oversampling]
 
 
+## parseShuttersXML
+#
+# This returns the compiled shutter sequence, from the cache if the
+# shutters file has not changed since it was last compiled.
+#
+# @param number_channels The number of channels.
+# @param shutters_file The name of the shutter sequence xml file.
+# @param oversampling (Optional) The number of waveform values per frame (if not specified in the file), defaults to 100.
+#
+# @return [waveforms, colors, frames, oversampling]
+#
+@hdebug.debug
+def parseShuttersXML(number_channels, shutters_file, oversampling = 100):
+    key = (os.path.abspath(shutters_file),
+           os.path.getmtime(shutters_file),
+           number_channels,
+           oversampling)
+
+    if key in shutters_cache:
+        compiled = shutters_cache.pop(key)
+    else:
+        compiled = compileShuttersXML(number_channels, shutters_file, oversampling)
+        while (len(shutters_cache) >= shutters_cache_size):
+            shutters_cache.popitem(last = False)
+    shutters_cache[key] = compiled
+
+    [waveforms, color_data, frames, oversampling] = compiled
+    return [waveforms, list(color_data), frames, oversampling]
+
+
 #
 # Testing
 #
@@ -8,6 +8,9 @@
 #
 # This is not currently used.
 #
+# If the C library cannot be loaded the numpy version of the object
+# finder (in numpyObjectFinder.py) is used instead.
+#
 # Hazen 10/09
 #
 
@@ -15,6 +18,8 @@ from ctypes import *
 import os
 import sys
 
+import numpyObjectFinder
+
 MEDDLL = 0
 def loadDLLs():
     global MEDDLL
@@ -26,8 +31,16 @@ def loadDLLs():
 
 
 class MedFastObjectFinder:
-    def __init__(self, cell_size, threshold):
-        loadDLLs()
+    def __init__(self, cell_size, threshold, implementation = "auto"):
+        self.use_numpy = (implementation == "numpy")
+        if not self.use_numpy:
+            try:
+                loadDLLs()
+            except OSError:
+                if (implementation == "c"):
+                    raise
+                print "MedianCounter library not available, using the numpy object finder."
+                self.use_numpy = True
         self.cell_size = cell_size
         self.threshold = threshold
         self.coefficients = [0.0, 1.0]
@@ -44,11 +57,18 @@ class MedFastObjectFinder:
     def countObjects(self, image, image_x, image_y):
         if not self._checkSize(image_x, image_y):
             return 0
-        counts = float(MEDDLL.number_objects(image,
-                                             c_int(image_x),
-                                             c_int(image_y),
-                                             c_int(self.cell_size),
-                                             c_float(self.threshold)))
+        if self.use_numpy:
+            counts = float(numpyObjectFinder.medianCountObjects(image,
+                                                                image_x,
+                                                                image_y,
+                                                                self.cell_size,
+                                                                self.threshold))
+        else:
+            counts = float(MEDDLL.number_objects(image,
+                                                 c_int(image_x),
+                                                 c_int(image_y),
+                                                 c_int(self.cell_size),
+                                                 c_float(self.threshold)))
         number = 0.0
         product = 1.0
         for coeff in self.coefficients:
@@ -59,6 +79,13 @@ class MedFastObjectFinder:
     def findObjects(self, image, image_x, image_y):
         if not self._checkSize(image_x, image_y):
             return [0, 0, 0]
+        if self.use_numpy:
+            return numpyObjectFinder.medianFindObjects(image,
+                                                       image_x,
+                                                       image_y,
+                                                       self.cell_size,
+                                                       self.threshold,
+                                                       self.max_locs)
         x = self.loc_type()
         y = self.loc_type()
         n = c_int(self.max_locs)
@@ -88,7 +115,10 @@ if __name__ == "__main__":
     image_type = c_short * (image_x * image_y)
     image = image_type()
 
-    mObjF = MedFastObjectFinder(32, 3.0)
+    if (len(sys.argv) > 1):
+        mObjF = MedFastObjectFinder(32, 3.0, sys.argv[1])
+    else:
+        mObjF = MedFastObjectFinder(32, 3.0)
         
     repeats = 100
     start = time.time()
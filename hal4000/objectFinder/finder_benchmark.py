@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Compares the speed and the results of the C and numpy versions
+# of the object finders on simulated STORM frames.
+#
+# Run from the objectFinder directory:
+#
+#   python finder_benchmark.py
+#
+
+from ctypes import *
+import numpy
+import time
+
+import fastObjectFinder
+import lmmObjectFinder
+import numpyObjectFinder
+
+## compareLocalizations
+#
+# @param c_results [x, y, n] from the C object finder.
+# @param np_results [x, y, n] from the numpy object finder.
+#
+# @return [True/False the number of objects agrees, maximum position difference].
+#
+def compareLocalizations(c_results, np_results):
+    n = min(c_results[2], np_results[2])
+    max_diff = 0.0
+    if (n > 0):
+        c_x = numpy.array(c_results[0][:n])
+        c_y = numpy.array(c_results[1][:n])
+        max_diff = max(numpy.max(numpy.abs(c_x - np_results[0][:n])),
+                       numpy.max(numpy.abs(c_y - np_results[1][:n])))
+    return [(c_results[2] == np_results[2]), max_diff]
+
+## simulateFrame
+#
+# Creates a STORM like frame, gaussian spots on a camera offset with poisson noise.
+#
+# @param image_x The size of the frame in x.
+# @param image_y The size of the frame in y.
+# @param n_spots The number of spots.
+#
+# @return A 2D numpy.uint16 array.
+#
+def simulateFrame(image_x, image_y, n_spots):
+    sigma = 1.5
+    frame = numpy.zeros((image_y, image_x))
+    [yy, xx] = numpy.mgrid[-6:7, -6:7]
+    for i in range(n_spots):
+        x = numpy.random.randint(10, image_x - 10)
+        y = numpy.random.randint(10, image_y - 10)
+        dx = numpy.random.uniform(-0.5, 0.5)
+        dy = numpy.random.uniform(-0.5, 0.5)
+        height = numpy.random.uniform(200.0, 1000.0)
+        spot = height * numpy.exp(-((xx - dx) * (xx - dx) + (yy - dy) * (yy - dy))/(2.0 * sigma * sigma))
+        frame[y-6:y+7,x-6:x+7] += spot
+    frame = numpy.random.poisson(frame + 20.0) + 100
+    return frame.astype(numpy.uint16)
+
+## timeIt
+#
+# @param function The function to call.
+# @param frames A list of frames.
+#
+# @return [list of results, mean time per frame in milliseconds].
+#
+def timeIt(function, frames):
+    results = []
+    start_time = time.time()
+    for frame in frames:
+        results.append(function(frame))
+    return [results, 1000.0 * (time.time() - start_time)/float(len(frames))]
+
+## report
+#
+# Print the timing and agreement of the C and numpy versions.
+#
+# @param name The name of the object finder.
+# @param frames A list of frames.
+# @param c_function The C version or None if it is not available.
+# @param np_function The numpy version.
+#
+def report(name, frames, c_function, np_function):
+    [np_results, np_time] = timeIt(np_function, frames)
+    print name
+    print "  numpy: {0:.2f} ms/frame, mean objects {1:.1f}".format(np_time,
+                                                                  numpy.mean([r[2] for r in np_results]))
+    if c_function is None:
+        print "  C library not available"
+        return
+
+    [c_results, c_time] = timeIt(c_function, frames)
+    agree = 0
+    max_diff = 0.0
+    for i in range(len(frames)):
+        [same, diff] = compareLocalizations(c_results[i], np_results[i])
+        if same:
+            agree += 1
+        max_diff = max(max_diff, diff)
+    print "  C: {0:.2f} ms/frame, mean objects {1:.1f}".format(c_time,
+                                                              numpy.mean([r[2] for r in c_results]))
+    print "  counts agree for {0:d} of {1:d} frames, maximum position difference {2:.2e} pixels".format(agree,
+                                                                                                        len(frames),
+                                                                                                        max_diff)
+
+
+if __name__ == "__main__":
+
+    image_x = 512
+    image_y = 512
+    repeats = 20
+    threshold = 100
+
+    frames = []
+    for i in range(repeats):
+        frames.append(simulateFrame(image_x, image_y, 200))
+
+    # Local maxima / moment finder.
+    try:
+        lmmObjectFinder.initialize("c")
+        c_function = lambda frame: lmmObjectFinder.findObjects(frame, image_x, image_y, threshold)
+    except OSError:
+        c_function = None
+    np_function = lambda frame: numpyObjectFinder.lmmFindObjects(frame, image_x, image_y, threshold)
+    report("LMMoment", frames, c_function, np_function)
+
+    # Median finder.
+    cell_size = 32
+    try:
+        finder = fastObjectFinder.MedFastObjectFinder(cell_size, threshold, "c")
+        c_function = lambda frame: finder.findObjects(frame.ctypes.data_as(POINTER(c_short)), image_x, image_y)
+    except OSError:
+        c_function = None
+    np_function = lambda frame: numpyObjectFinder.medianFindObjects(frame, image_x, image_y, cell_size, threshold)
+    report("MedianCounter", frames, c_function, np_function)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
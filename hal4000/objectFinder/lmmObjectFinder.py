@@ -7,6 +7,9 @@
 #
 # Note that the maximum number of objects found per image is limited to 1000.
 #
+# If the C library cannot be loaded the numpy version of the object
+# finder (in numpyObjectFinder.py) is used instead.
+#
 # Hazen 09/13
 #
 
@@ -16,7 +19,10 @@ from numpy.ctypeslib import ndpointer
 import os
 import sys
 
+import numpyObjectFinder
+
 lmmoment = False
+use_numpy = False
 
 max_locs = 1000
 
@@ -25,15 +31,27 @@ max_locs = 1000
 # Called at program shutdown to free arrays allocated in C.
 #
 def cleanup():
-    lmmoment.cleanup()
+    if lmmoment:
+        lmmoment.cleanup()
 
 ## initialize
 #
 # Called at program start up to allocate array and perform other
 # initialization in C.
 #
-def initialize():
+# @param implementation (Optional) "auto" (the default) uses the C library if it can be loaded and numpy otherwise, "c" requires the C library, "numpy" always uses numpy.
+#
+def initialize(implementation = "auto"):
     global lmmoment
+    global use_numpy
+
+    if not (implementation in ["auto", "c", "numpy"]):
+        raise AssertionError("unknown object finder implementation " + str(implementation))
+
+    use_numpy = False
+    if (implementation == "numpy"):
+        use_numpy = True
+        return
 
     directory = os.path.dirname(__file__)
     if (directory == ""):
@@ -41,10 +59,18 @@ def initialize():
     else:
         directory += "/"
 
-    if (sys.platform == "win32"):
-        lmmoment = cdll.LoadLibrary(directory + "LMMoment.dll")
-    else:
-        lmmoment = cdll.LoadLibrary(directory + "LMMoment.so")
+    try:
+        if (sys.platform == "win32"):
+            lmmoment = cdll.LoadLibrary(directory + "LMMoment.dll")
+        else:
+            lmmoment = cdll.LoadLibrary(directory + "LMMoment.so")
+    except OSError:
+        if (implementation == "c"):
+            raise
+        print "LMMoment library not available, using the numpy object finder."
+        lmmoment = False
+        use_numpy = True
+        return
 
     lmmoment.initialize.argtypes = []
     lmmoment.cleanup.argtypes = []
@@ -69,6 +95,8 @@ def initialize():
 # @return [[peak x positions], [peak y positions], number of peaks].
 # 
 def findObjects(np_image, image_x, image_y, threshold):
+        if use_numpy:
+            return numpyObjectFinder.lmmFindObjects(np_image, image_x, image_y, threshold)
         x = numpy.zeros((max_locs), dtype = numpy.float32)
         y = numpy.zeros((max_locs), dtype = numpy.float32)
         n = c_int(max_locs)
@@ -88,7 +116,10 @@ if __name__ == "__main__":
     import numpy
     import time
 
-    initialize()
+    if (len(sys.argv) > 1):
+        initialize(sys.argv[1])
+    else:
+        initialize()
 
     image_x = 1024
     image_y = 1024
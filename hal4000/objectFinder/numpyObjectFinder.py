@@ -0,0 +1,275 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Numpy (and scipy) versions of the object finders in LMMoment.c
+# and MedianCounter.c. These are used when the C libraries are not
+# available. The results are meant to be the same as those of the
+# C versions, including the signed 16 bit treatment of the pixel
+# values and the order in which the objects are returned.
+#
+
+import numpy
+
+max_locs = 1000
+
+#
+# Peak definition for the local maxima / moment finder (see LMMoment.c).
+#
+# 1 in the peak definition means boundary.
+# 2 in the peak definition means center.
+#
+bsize = 5
+peak = numpy.array([[0, 0, 0, 1, 1, 1, 0, 0, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [1, 2, 2, 2, 2, 2, 2, 2, 1],
+                    [0, 1, 2, 2, 2, 2, 2, 1, 0],
+                    [0, 0, 1, 2, 2, 2, 1, 0, 0],
+                    [0, 0, 0, 1, 1, 1, 0, 0, 0]])
+[bdy_dy, bdy_dx] = numpy.nonzero(peak == 1)
+bdy_dy -= bsize - 1
+bdy_dx -= bsize - 1
+[cnt_dy, cnt_dx] = numpy.nonzero(peak == 2)
+cnt_dy -= bsize - 1
+cnt_dx -= bsize - 1
+
+## asShortImage
+#
+# Converts an image to a 2D numpy.int16 array (which is how the C code
+# treats the pixel values).
+#
+# @param image The image as a numpy array (or a ctypes array).
+# @param image_x The size of the image in x in pixels.
+# @param image_y The size of the image in y in pixels.
+#
+# @return A (image_y, image_x) numpy.int16 array.
+#
+def asShortImage(image, image_x, image_y):
+    image = numpy.asarray(image).ravel()[:image_x*image_y]
+    if (image.dtype == numpy.uint16):
+        image = numpy.ascontiguousarray(image).view(numpy.int16)
+    else:
+        image = image.astype(numpy.int16)
+    return image.reshape((image_y, image_x))
+
+## lmmFindObjects
+#
+# Find the objects in the image using local maxima and first moments. This
+# has the same inputs and outputs as lmmObjectFinder.findObjects().
+#
+# @param np_image The image as a numpy.uint16 array.
+# @param image_x The size of the image in x in pixels.
+# @param image_y The size of the image in y in pixels.
+# @param threshold The minimum height difference between the local maxima and the pixels on the edge of the peak.
+#
+# @return [[peak x positions], [peak y positions], number of peaks].
+#
+def lmmFindObjects(np_image, image_x, image_y, threshold):
+    x = numpy.zeros((max_locs), dtype = numpy.float32)
+    y = numpy.zeros((max_locs), dtype = numpy.float32)
+    if (image_x <= 2*bsize) or (image_y <= 2*bsize):
+        return [x, y, 0]
+
+    image = asShortImage(np_image, image_x, image_y)
+    threshold = int(threshold)
+
+    # Find the local maxima (away from the edges of the image). Note that
+    # the comparisons are not symmetric, this is so that only one pixel of
+    # a flat topped peak is a maxima.
+    def shifted(dy, dx):
+        return image[bsize+dy:image_y-bsize+dy, bsize+dx:image_x-bsize+dx]
+    center = shifted(0, 0)
+    mask = (center > shifted(-1, -1))
+    mask &= (center > shifted(-1, 0))
+    mask &= (center > shifted(-1, 1))
+    mask &= (center > shifted(0, -1))
+    mask &= (center >= shifted(0, 1))
+    mask &= (center > shifted(1, -1))
+    mask &= (center >= shifted(1, 0))
+    mask &= (center >= shifted(1, 1))
+
+    [py, px] = numpy.nonzero(mask)
+    index = (py + bsize) * image_x + (px + bsize)
+
+    # Check that the maxima are higher than all the boundary pixels
+    # by at least threshold. Each boundary pixel removes candidates so
+    # the arrays get smaller as we go.
+    flat = image.ravel()
+    cur = flat[index].astype(numpy.int32)
+    bdy_sum = numpy.zeros(index.size, dtype = numpy.int32)
+    for i in range(bdy_dx.size):
+        tmp = flat[index + bdy_dy[i] * image_x + bdy_dx[i]].astype(numpy.int32)
+        keep = (cur >= (tmp + threshold))
+        index = index[keep]
+        cur = cur[keep]
+        bdy_sum = bdy_sum[keep] + tmp[keep]
+
+    # C style (truncating) integer division.
+    mean = numpy.abs(bdy_sum)/bdy_dx.size
+    mean[(bdy_sum < 0)] *= -1
+    keep = (mean > 0)
+    index = index[keep][:max_locs]
+    mean = mean[keep][:max_locs]
+
+    # Peak positions from the first moment.
+    n = index.size
+    total = numpy.zeros(n, dtype = numpy.int32)
+    sum_x = numpy.zeros(n, dtype = numpy.int32)
+    sum_y = numpy.zeros(n, dtype = numpy.int32)
+    for i in range(cnt_dx.size):
+        tmp = flat[index + cnt_dy[i] * image_x + cnt_dx[i]].astype(numpy.int32) - mean
+        total += tmp
+        sum_x += tmp * cnt_dx[i]
+        sum_y += tmp * cnt_dy[i]
+
+    good = (total > 0)
+    total[~good] = 1
+    x[:n] = (index % image_x).astype(numpy.float32) + sum_x.astype(numpy.float32)/total.astype(numpy.float32)
+    y[:n] = (index / image_x).astype(numpy.float32) + sum_y.astype(numpy.float32)/total.astype(numpy.float32)
+    x[:n][~good] = -1.0
+    y[:n][~good] = -1.0
+    return [x, y, n]
+
+## medianThresholdImage
+#
+# Thresholds the image using the median of each cell (see MedianCounter.c).
+# Pixels that are not part of a complete cell are set to zero.
+#
+# @param image A 2D numpy.int16 array.
+# @param cell_size The size of a cell in pixels.
+# @param threshold Pixels more than this above the cell median are kept.
+#
+# @return A 2D numpy.int16 array with the pixels below threshold set to zero.
+#
+def medianThresholdImage(image, cell_size, threshold):
+    [image_y, image_x] = image.shape
+    cells_y = image_y/cell_size
+    cells_x = image_x/cell_size
+    size_y = cells_y * cell_size
+    size_x = cells_x * cell_size
+
+    # Median of each cell (quick_select() returns the lower median).
+    cells = image[:size_y,:size_x].reshape(cells_y, cell_size, cells_x, cell_size)
+    cells = cells.swapaxes(1,2).reshape(cells_y, cells_x, cell_size * cell_size)
+    k = (cell_size * cell_size - 1)/2
+    median = numpy.partition(cells, k, axis = 2)[:,:,k]
+
+    thresh = (median + numpy.int16(int(threshold))).astype(numpy.int16)
+    thresh = numpy.repeat(numpy.repeat(thresh, cell_size, axis = 0), cell_size, axis = 1)
+
+    t_image = numpy.zeros(image.shape, dtype = numpy.int16)
+    region = image[:size_y,:size_x]
+    t_image[:size_y,:size_x] = numpy.where(region > thresh, region, 0)
+    return t_image
+
+## medianLabelObjects
+#
+# Labels the contiguous (4-connected) objects in a thresholded image. The
+# labels are in the order in which the objects are first encountered
+# scanning the image row by row, which is the order used by the C code.
+#
+# @param t_image A thresholded image.
+#
+# @return [labels, number of objects].
+#
+def medianLabelObjects(t_image):
+    import scipy.ndimage
+    return scipy.ndimage.label(t_image > 0)
+
+## medianCountObjects
+#
+# Counts the number of objects (with at least 2 pixels) in the image.
+# This has the same inputs and outputs as number_objects() in MedianCounter.c.
+#
+# @param image The image.
+# @param image_x The size of the image in x in pixels.
+# @param image_y The size of the image in y in pixels.
+# @param cell_size The size of a cell in pixels.
+# @param threshold The threshold above the cell median.
+#
+# @return The number of objects.
+#
+def medianCountObjects(image, image_x, image_y, cell_size, threshold):
+    t_image = medianThresholdImage(asShortImage(image, image_x, image_y), cell_size, threshold)
+    [labels, n_objects] = medianLabelObjects(t_image)
+    sizes = numpy.bincount(labels.ravel(), minlength = n_objects + 1)
+    return int(numpy.sum(sizes[1:] >= 2))
+
+## medianFindObjects
+#
+# Finds the center of mass of the objects (with at least 3 pixels) in the image.
+# This has the same inputs and outputs as number_and_loc_objects() in MedianCounter.c.
+#
+# @param image The image.
+# @param image_x The size of the image in x in pixels.
+# @param image_y The size of the image in y in pixels.
+# @param cell_size The size of a cell in pixels.
+# @param threshold The threshold above the cell median.
+# @param counts (Optional) The maximum number of objects to return, default is max_locs.
+#
+# @return [[object x positions], [object y positions], number of objects].
+#
+def medianFindObjects(image, image_x, image_y, cell_size, threshold, counts = max_locs):
+    x = numpy.zeros((counts), dtype = numpy.float32)
+    y = numpy.zeros((counts), dtype = numpy.float32)
+
+    t_image = medianThresholdImage(asShortImage(image, image_x, image_y), cell_size, threshold)
+    [labels, n_objects] = medianLabelObjects(t_image)
+    if (n_objects == 0):
+        return [x, y, 0]
+
+    labels = labels.ravel()
+    values = t_image.ravel().astype(numpy.int64)
+    [rows, cols] = numpy.indices(t_image.shape)
+    sizes = numpy.bincount(labels, minlength = n_objects + 1)[1:]
+    totals = numpy.bincount(labels, weights = values, minlength = n_objects + 1)[1:]
+    sum_x = numpy.bincount(labels, weights = values * cols.ravel(), minlength = n_objects + 1)[1:]
+    sum_y = numpy.bincount(labels, weights = values * rows.ravel(), minlength = n_objects + 1)[1:]
+
+    # The first pixel of each object, the C code computes the center
+    # relative to this pixel.
+    [unique, first] = numpy.unique(labels, return_index = True)
+    first = first[1:]
+    first_x = first % image_x
+    first_y = first / image_x
+
+    totals = totals.astype(numpy.int64)
+    keep = (sizes > 2) & (totals > 0)
+    first_x = first_x[keep][:counts]
+    first_y = first_y[keep][:counts]
+    dx = (sum_x[keep][:counts].astype(numpy.int64) - first_x * totals[keep][:counts])
+    dy = (sum_y[keep][:counts].astype(numpy.int64) - first_y * totals[keep][:counts])
+    totals = totals[keep][:counts]
+
+    n = totals.size
+    x[:n] = first_x.astype(numpy.float32) + dx.astype(numpy.float32)/totals.astype(numpy.float32)
+    y[:n] = first_y.astype(numpy.float32) + dy.astype(numpy.float32)/totals.astype(numpy.float32)
+    return [x, y, n]
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
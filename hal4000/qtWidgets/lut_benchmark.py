@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+## @file
+#
+# For testing how long it takes to convert a 2048 x 2048 sCMOS frame
+# into an image for display. This compares the original floating
+# point version of QCameraWidget.updateImageWithFrame() with the
+# look up table version.
+#
+# Run from the hal4000 directory:
+#
+#   python qtWidgets/lut_benchmark.py
+#
+
+import numpy
+import time
+
+import qtWidgets.qtCameraWidget as qtCameraWidget
+
+## floatRescale
+#
+# The original (floating point) version of the rescaling.
+#
+# @param image_data A 2D numpy.uint16 array.
+# @param display_range [minimum, maximum].
+# @param max_intensity The intensity at which pixels are saturated.
+# @param flip_horizontal True/False.
+# @param flip_vertical True/False.
+# @param transpose True/False.
+#
+# @return [rescaled image, image minimum, image maximum]
+#
+def floatRescale(image_data, display_range, max_intensity, flip_horizontal, flip_vertical, transpose):
+    image_min = numpy.min(image_data)
+    image_max = numpy.max(image_data)
+
+    reoriented = False
+    if flip_horizontal:
+        reoriented = True
+        image_data = numpy.fliplr(image_data)
+    if flip_vertical:
+        reoriented = True
+        image_data = numpy.flipud(image_data)
+    if transpose:
+        reoriented = True
+        image_data = numpy.transpose(image_data)
+    if reoriented:
+        image_data = numpy.ascontiguousarray(image_data)
+
+    max_range = 254.0
+    temp = image_data.astype(numpy.float32)
+    temp = max_range *(temp - display_range[0])/(display_range[1] - display_range[0])
+    temp[(temp > max_range )] = max_range
+    temp[(temp < 0.0)] = 0.0
+    temp[image_data >= max_intensity] = 255.0
+    return [temp.astype(numpy.uint8), image_min, image_max]
+
+## lutRescale
+#
+# The look up table version of the rescaling.
+#
+# @param image_data A 2D numpy.uint16 array.
+# @param lut The look up table.
+# @param flip_horizontal True/False.
+# @param flip_vertical True/False.
+# @param transpose True/False.
+#
+# @return [rescaled image, image minimum, image maximum]
+#
+def lutRescale(image_data, lut, flip_horizontal, flip_vertical, transpose):
+    image_min = image_data.min()
+    image_max = image_data.max()
+    if flip_horizontal:
+        image_data = image_data[:,::-1]
+    if flip_vertical:
+        image_data = image_data[::-1,:]
+    if transpose:
+        image_data = image_data.T
+    return [numpy.take(lut, image_data), image_min, image_max]
+
+
+if __name__ == "__main__":
+
+    repeats = 20
+    display_range = [100, 2000]
+    max_intensity = 60000
+
+    # Simulated sCMOS frame, offset 100 with some bright spots.
+    frame = numpy.random.poisson(110.0, size = (2048, 2048)).astype(numpy.uint16)
+    frame[::97,::89] = 65000
+
+    for orientation in [[False, False, False], [True, False, False], [True, True, True]]:
+
+        start_time = time.time()
+        for i in range(repeats):
+            [old_image, old_min, old_max] = floatRescale(frame, display_range, max_intensity, *orientation)
+        old_time = (time.time() - start_time)/float(repeats)
+
+        start_time = time.time()
+        lut = qtCameraWidget.createLUT(display_range, max_intensity)
+        for i in range(repeats):
+            [new_image, new_min, new_max] = lutRescale(frame, lut, *orientation)
+        new_time = (time.time() - start_time)/float(repeats)
+
+        same = (old_image == new_image).all() and (old_min == new_min) and (old_max == new_max)
+        print "flip h, flip v, transpose", orientation
+        print "  float: {0:.2f} ms, lut: {1:.2f} ms, speed up {2:.1f}x, identical {3:s}".format(1000.0 * old_time,
+                                                                                              1000.0 * new_time,
+                                                                                              old_time/new_time,
+                                                                                              str(same))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
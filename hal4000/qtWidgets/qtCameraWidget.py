@@ -12,6 +12,71 @@ from PyQt4 import QtCore, QtGui
 import numpy
 import sys
 
+## binImage
+#
+# Reduces the size of an image by averaging blocks of factor x factor
+# pixels. This works on (strided) views of the image so that there is
+# no full size copy of the image. Any pixels left over at the right
+# or bottom edge are ignored.
+#
+# If max_intensity is specified then blocks that contain a saturated
+# pixel are set to the maximum value so that they are still shown as
+# saturated after binning.
+#
+# @param image_data A 2D numpy.uint16 array (or view).
+# @param factor The (integer) binning factor.
+# @param max_intensity (Optional) The intensity at which pixels are saturated.
+#
+# @return A 2D numpy.uint16 array.
+#
+def binImage(image_data, factor, max_intensity = None):
+    rows = image_data.shape[0]/factor
+    cols = image_data.shape[1]/factor
+    binned = numpy.zeros((rows, cols), dtype = numpy.uint32)
+    if max_intensity is not None:
+        block_max = numpy.zeros((rows, cols), dtype = image_data.dtype)
+    for i in range(factor):
+        for j in range(factor):
+            block = image_data[i:rows*factor:factor, j:cols*factor:factor]
+            binned += block
+            if max_intensity is not None:
+                numpy.maximum(block_max, block, block_max)
+    binned /= factor * factor
+    binned = binned.astype(numpy.uint16)
+    if max_intensity is not None:
+        binned[(block_max >= max_intensity)] = 65535
+    return binned
+
+## createLUT
+#
+# Creates a look up table for converting (uint16) camera data into
+# (uint8) display values. Values below the minimum of the display
+# range map to 0 and values above the maximum to 255 (or 254 if
+# saturated pixels are displayed, in which case pixels at or above
+# max_intensity map to 255).
+#
+# @param display_range [minimum, maximum].
+# @param max_intensity (Optional) The intensity at which pixels are saturated, None to not show saturated pixels.
+#
+# @return A numpy.uint8 array with 65536 elements.
+#
+def createLUT(display_range, max_intensity = None):
+    if max_intensity is None:
+        max_range = 255.0
+    else:
+        max_range = 254.0
+
+    range_size = display_range[1] - display_range[0]
+    if (range_size == 0):
+        range_size = 1
+    lut = numpy.arange(65536, dtype = numpy.float32)
+    lut = max_range * (lut - display_range[0])/range_size
+    lut = numpy.clip(lut, 0.0, max_range).astype(numpy.uint8)
+
+    if max_intensity is not None:
+        lut[max(0, min(int(max_intensity), 65536)):] = 255
+    return lut
+
 ## QCameraWidget
 #
 # The base class for displaying data from a camera.
@@ -53,6 +118,10 @@ class QCameraWidget(QtGui.QWidget):
         self.image_min = 0
         self.image_max = 1
 
+        # This is the look up table for converting camera data to display
+        # values. It is re-created when the display settings change.
+        self.lut = False
+
         # This is the amount of image magnification.
         # Only integer values are allowed.
         self.magnification = 1
@@ -283,6 +352,7 @@ class QCameraWidget(QtGui.QWidget):
         else:
             self.display_saturated_pixels = False
 
+        self.lut = False
         self.calcFinalSize()
 
     ## newRange
@@ -291,6 +361,7 @@ class QCameraWidget(QtGui.QWidget):
     #
     def newRange(self, range):
         self.display_range = range
+        self.lut = False
 
     ## paintEvent
     #
@@ -399,6 +470,12 @@ class QCameraWidget(QtGui.QWidget):
     # into a QImage that can be drawn in the display. It also emits the intensityInfo
     # signal with the current intensity of the pixel of interest.
     #
+    # The scaling is done with a look up table. The flips and the transpose
+    # are just (strided) views of the camera data so the look up is the only
+    # place where the image is copied. If the image is displayed at less
+    # than half of its actual size it is first binned down to (about) the
+    # display size so that only the pixels that will be seen are scaled.
+    #
     # @param frame A frame object.
     #
     def updateImageWithFrame(self, frame):
@@ -407,48 +484,44 @@ class QCameraWidget(QtGui.QWidget):
             h = frame.image_y
             image_data = frame.getData()
             image_data = image_data.reshape((h,w))
-            self.image_min = numpy.min(image_data)
-            self.image_max = numpy.max(image_data)
+            self.image_min = image_data.min()
+            self.image_max = image_data.max()
 
-            reoriented = False
             if self.flip_horizontal:
-                reoriented = True
-                image_data = numpy.fliplr(image_data)
+                image_data = image_data[:,::-1]
 
             if self.flip_vertical:
-                reoriented = True
-                image_data = numpy.flipud(image_data)
+                image_data = image_data[::-1,:]
 
             if self.transpose:
-                reoriented = True
-                image_data = numpy.transpose(image_data)
-        
-            if reoriented:
-                image_data = numpy.ascontiguousarray(image_data)
-
-            if self.display_saturated_pixels:
-                max_range = 254.0
+                image_data = image_data.T
+                [screen_x, screen_y] = [self.y_final, self.x_final]
             else:
-                max_range = 255.0
+                [screen_x, screen_y] = [self.x_final, self.y_final]
+
+            display_data = image_data
+            factor = min(image_data.shape[1]/max(1, screen_x), image_data.shape[0]/max(1, screen_y))
+            if (factor > 1):
+                if self.display_saturated_pixels:
+                    display_data = binImage(image_data, factor, self.max_intensity)
+                else:
+                    display_data = binImage(image_data, factor)
 
-            temp = image_data.astype(numpy.float32)
-            temp = max_range *(temp - self.display_range[0])/(self.display_range[1] - self.display_range[0])
-            temp[(temp > max_range )] = max_range 
-            temp[(temp < 0.0)] = 0.0
+            if self.lut is False:
+                if self.display_saturated_pixels:
+                    self.lut = createLUT(self.display_range, self.max_intensity)
+                else:
+                    self.lut = createLUT(self.display_range)
 
-            # Check for saturated pixels
-            if self.display_saturated_pixels:
-                temp[image_data >= self.max_intensity] = 255.0
-            
-            temp = temp.astype(numpy.uint8)
+            temp = numpy.take(self.lut, display_data)
 
             # Create QImage & draw at final magnification.
-            if self.transpose:
-                temp_image = QtGui.QImage(temp.data, h, w, QtGui.QImage.Format_Indexed8)
-                self.image = temp_image.scaled(self.y_final, self.x_final)
-            else:
-                temp_image = QtGui.QImage(temp.data, w, h, QtGui.QImage.Format_Indexed8)
-                self.image = temp_image.scaled(self.x_final, self.y_final)
+            temp_image = QtGui.QImage(temp.data,
+                                      temp.shape[1],
+                                      temp.shape[0],
+                                      temp.shape[1],
+                                      QtGui.QImage.Format_Indexed8)
+            self.image = temp_image.scaled(screen_x, screen_y)
             self.image.ndarray = temp
 
             # Set the images color table.
@@ -5,9 +5,22 @@
 # Qt Thread for counting the number of spots 
 # in a frame and graphing the results.
 #
+# There are two backends. QObjectCounter uses a pool of threads,
+# QObjectCounterMP uses a pool of processes. The process version
+# passes the frame data to the worker processes through shared
+# memory so only the frame meta-data and the localizations are
+# pickled.
+#
 # Hazen 09/13
 #
 
+import ctypes
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy
+import Queue
+import time
+
 from PyQt4 import QtCore, QtGui
 
 try:
@@ -42,11 +55,13 @@ class QObjectCounterThread(QtCore.QThread):
 
     ## newImage
     #
-    # A new image for this thread to analyze.
+    # A new image for this thread to analyze. The thread keeps a
+    # reference to the frame until it has finished with it.
     #
     # @param frame A frame object.
     #
     def newImage(self, frame):
+        frame.hold()
         self.mutex.lock()
         self.frame = frame
         self.mutex.unlock()
@@ -78,6 +93,7 @@ class QObjectCounterThread(QtCore.QThread):
                                           x_locs,
                                           y_locs,
                                           spots)
+                 self.frame.release()
                  self.frame = False
                      
              self.mutex.unlock()
@@ -91,6 +107,78 @@ class QObjectCounterThread(QtCore.QThread):
         self.running = False
 
 
+## objectCounterWorker
+#
+# The worker process function. This waits for a task (the index of the
+# data slot and the frame meta-data), finds the objects in the frame
+# and puts the results in the results queue. Sending None stops the
+# worker.
+#
+# @param worker_index The index of the worker.
+# @param shared_data The multiprocessing.sharedctypes.RawArray that frames are passed in.
+# @param task_queue A multiprocessing.Queue for tasks.
+# @param results_queue A multiprocessing.Queue for results.
+# @param finder The object finder implementation ("auto", "c" or "numpy").
+#
+def objectCounterWorker(worker_index, shared_data, task_queue, results_queue, finder):
+    lmmObjectFinder.initialize(finder)
+    np_data = numpy.frombuffer(shared_data, dtype = numpy.uint16)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        [which_camera, frame_number, image_x, image_y, threshold, start_time] = task
+        [x_locs, y_locs, spots] = lmmObjectFinder.findObjects(np_data[:image_x*image_y],
+                                                              image_x,
+                                                              image_y,
+                                                              threshold)
+        results_queue.put([worker_index,
+                           which_camera,
+                           frame_number,
+                           x_locs[:spots],
+                           y_locs[:spots],
+                           spots,
+                           start_time])
+    lmmObjectFinder.cleanup()
+
+
+## QObjectCounterResultsThread
+#
+# Waits for results from the worker processes and emits them as a Qt signal.
+#
+class QObjectCounterResultsThread(QtCore.QThread):
+    imageProcessed = QtCore.pyqtSignal(int, object, int, object, object, int, float)
+
+    ## __init__
+    #
+    # @param results_queue A multiprocessing.Queue for results.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, results_queue, parent = None):
+        QtCore.QThread.__init__(self, parent)
+        self.results_queue = results_queue
+        self.running = True
+
+    ## run
+    #
+    # The thread loop.
+    #
+    def run(self):
+        while (self.running):
+            try:
+                result = self.results_queue.get(True, 0.1)
+            except Queue.Empty:
+                continue
+            self.imageProcessed.emit(*result)
+
+    ## stopThread
+    #
+    # Tells the thread loop to stop running.
+    #
+    def stopThread(self):
+        self.running = False
+
+
 ## QObjectCounter
 #
 # The front end.
@@ -107,12 +195,12 @@ class QObjectCounter(QtGui.QWidget):
     def __init__(self, parameters, number_threads = 16, parent = None):
         QtGui.QWidget.__init__(self, parent)
 
-        self.dropped = 0
         self.number_threads = number_threads
-        self.total = 0
+        self.start_times = []
+        self.resetStatistics()
 
         # Initialize object finder.
-        lmmObjectFinder.initialize()
+        lmmObjectFinder.initialize(parameters.get("finder", "auto"))
 
         # Initialize threads.
         self.idle = []
@@ -120,6 +208,7 @@ class QObjectCounter(QtGui.QWidget):
         for i in range(self.number_threads):
             self.threads.append(QObjectCounterThread(parameters, i))
             self.idle.append(True)
+            self.start_times.append(0.0)
             
         for thread in self.threads:
             thread.start(QtCore.QThread.NormalPriority)
@@ -139,6 +228,7 @@ class QObjectCounter(QtGui.QWidget):
             not_found = True
             while (i < self.number_threads) and not_found:
                 if self.idle[i]:
+                    self.start_times[i] = time.time()
                     self.threads[i].newImage(frame)
                     self.idle[i] = False
                     not_found = False
@@ -168,6 +258,7 @@ class QObjectCounter(QtGui.QWidget):
     #
     def returnResults(self, thread_index, which_camera, frame_number, x_locs, y_locs, spots):
         self.idle[thread_index] = True
+        self.updateLatency(self.start_times[thread_index])
         self.imageProcessed.emit(which_camera,
                                  frame_number,
                                  x_locs,
@@ -188,7 +279,202 @@ class QObjectCounter(QtGui.QWidget):
         for thread in self.threads:
             thread.stopThread()
             thread.wait()
-        print "Spot counter dropped", self.dropped, "images out of", self.total, "total images"
+        self.printStatistics()
+
+    ## getStatistics
+    #
+    # @return [total images, dropped images, analyzed images, mean latency (ms), max latency (ms)].
+    #
+    def getStatistics(self):
+        mean_latency = 0.0
+        if (self.analyzed > 0):
+            mean_latency = self.total_latency/float(self.analyzed)
+        return [self.total, self.dropped, self.analyzed, 1000.0 * mean_latency, 1000.0 * self.max_latency]
+
+    ## printStatistics
+    #
+    # Print how many images were analyzed and how long it took.
+    #
+    def printStatistics(self):
+        [total, dropped, analyzed, mean_latency, max_latency] = self.getStatistics()
+        print "Spot counter dropped", dropped, "images out of", total, "total images"
+        print "Spot counter latency was {0:.1f} ms (mean), {1:.1f} ms (max) for {2:d} images".format(mean_latency, max_latency, analyzed)
+
+    ## resetStatistics
+    #
+    # Reset the counters.
+    #
+    def resetStatistics(self):
+        self.analyzed = 0
+        self.dropped = 0
+        self.max_latency = 0.0
+        self.total = 0
+        self.total_latency = 0.0
+
+    ## updateLatency
+    #
+    # Update the latency statistics with the time for one image.
+    #
+    # @param start_time The time when the image was given to the spot counter.
+    #
+    def updateLatency(self, start_time):
+        latency = time.time() - start_time
+        self.analyzed += 1
+        self.total_latency += latency
+        if (latency > self.max_latency):
+            self.max_latency = latency
+
+
+## QObjectCounterMP
+#
+# The multi-process front end. This has the same interface as QObjectCounter.
+#
+# Each worker process has its own block of shared memory. Frames are copied
+# into the shared memory of an idle worker, then the worker is sent the frame
+# meta-data. The shared memory is (re)allocated, and the workers (re)started,
+# when a frame arrives that is larger than the current blocks.
+#
+class QObjectCounterMP(QObjectCounter):
+
+    ## __init__
+    #
+    # @param parameters A parameters object.
+    # @param number_workers (Optional) The number of worker processes, default is the number of cores.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parameters, number_workers = 0, parent = None):
+        QtGui.QWidget.__init__(self, parent)
+
+        if (number_workers <= 0):
+            number_workers = multiprocessing.cpu_count()
+
+        self.finder = parameters.get("finder", "auto")
+        self.idle = []
+        self.max_pixels = 0
+        self.number_threads = number_workers
+        self.results_queue = multiprocessing.Queue()
+        self.shared_data = []
+        self.start_times = []
+        self.task_queues = []
+        self.threshold = parameters.get("threshold")
+        self.workers = []
+        self.resetStatistics()
+
+        self.results_thread = QObjectCounterResultsThread(self.results_queue)
+        self.results_thread.imageProcessed.connect(self.returnResults)
+        self.results_thread.start(QtCore.QThread.NormalPriority)
+
+    ## newImageToCount
+    #
+    # Copies the image into the shared memory of the first available worker
+    # and tells the worker to analyze it. If no workers are available then
+    # the image is considered to have been dropped.
+    #
+    # @param frame A frame object.
+    #
+    def newImageToCount(self, frame):
+        self.total += 1
+        if frame:
+            n_pixels = frame.image_x * frame.image_y
+            if (n_pixels > self.max_pixels):
+                self.startWorkers(n_pixels)
+
+            for i in range(self.number_threads):
+                if self.idle[i]:
+                    self.shared_data[i][:n_pixels] = frame.getData().ravel()[:n_pixels]
+                    self.idle[i] = False
+                    self.start_times[i] = time.time()
+                    self.task_queues[i].put([frame.which_camera,
+                                             frame.number,
+                                             frame.image_x,
+                                             frame.image_y,
+                                             self.threshold,
+                                             self.start_times[i]])
+                    return
+            self.dropped += 1
+
+    ## newParameters
+    #
+    # @param parameters A parameters object.
+    #
+    def newParameters(self, parameters):
+        self.threshold = parameters.get("threshold")
+
+    ## returnResults
+    #
+    # Handles the results from the worker processes.
+    #
+    # @param worker_index The index of the worker that did the processing.
+    # @param which_camera The camera that the image that was processed came from.
+    # @param frame_number The frame number of the image that was processed.
+    # @param x_locs A numpy array of localization x positions.
+    # @param y_locs A numpy array of localization y positions.
+    # @param spots The number of spots in the x_locs, y_locs arrays.
+    # @param start_time The time when the image was sent to the worker.
+    #
+    def returnResults(self, worker_index, which_camera, frame_number, x_locs, y_locs, spots, start_time):
+
+        # Ignore results from workers that were stopped.
+        if (worker_index >= len(self.idle)) or (start_time != self.start_times[worker_index]):
+            return
+
+        self.idle[worker_index] = True
+        self.updateLatency(start_time)
+        self.imageProcessed.emit(which_camera,
+                                 frame_number,
+                                 x_locs,
+                                 y_locs,
+                                 spots)
+
+    ## shutDown
+    #
+    # Stop the worker processes and the results thread.
+    #
+    def shutDown(self):
+        self.stopWorkers()
+        self.results_thread.stopThread()
+        self.results_thread.wait()
+        self.printStatistics()
+
+    ## startWorkers
+    #
+    # (Re)start the worker processes with shared memory blocks that are
+    # large enough for frames with n_pixels pixels.
+    #
+    # @param n_pixels The number of pixels in a frame.
+    #
+    def startWorkers(self, n_pixels):
+        self.stopWorkers()
+        self.max_pixels = n_pixels
+        for i in range(self.number_threads):
+            shared_data = multiprocessing.sharedctypes.RawArray(ctypes.c_uint16, n_pixels)
+            task_queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target = objectCounterWorker,
+                                             args = (i, shared_data, task_queue, self.results_queue, self.finder))
+            worker.daemon = True
+            worker.start()
+
+            self.idle.append(True)
+            self.shared_data.append(numpy.frombuffer(shared_data, dtype = numpy.uint16))
+            self.start_times.append(0.0)
+            self.task_queues.append(task_queue)
+            self.workers.append(worker)
+
+    ## stopWorkers
+    #
+    # Stop the worker processes.
+    #
+    def stopWorkers(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.idle = []
+        self.max_pixels = 0
+        self.shared_data = []
+        self.start_times = []
+        self.task_queues = []
+        self.workers = []
 
 
 #
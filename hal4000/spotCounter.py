@@ -10,6 +10,7 @@
 # Hazen 08/13
 #
 
+import os
 import sys
 from PyQt4 import QtCore, QtGui
 import sip
@@ -480,7 +481,17 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
                              Counter(self.ui.countsLabel3, self.ui.countsLabel4)]
 
         # Setup spot counter.
-        self.spot_counter = qtSpotCounter.QObjectCounter(parameters.get("spotcounter"))
+        #
+        # The spot counter can use either threads (the default) or processes.
+        spotc_params = parameters.get("spotcounter")
+        if (spotc_params.get("backend", "thread") == "process"):
+            self.spot_counter = qtSpotCounter.QObjectCounterMP(spotc_params,
+                                                               number_workers = spotc_params.get("workers", 0))
+        elif (spotc_params.get("workers", 0) > 0):
+            self.spot_counter = qtSpotCounter.QObjectCounter(spotc_params,
+                                                             number_threads = spotc_params.get("workers"))
+        else:
+            self.spot_counter = qtSpotCounter.QObjectCounter(spotc_params)
         self.spot_counter.imageProcessed.connect(self.updateCounts)
 
         # Setup spot counts graph(s).
@@ -568,6 +579,16 @@ class SpotCounter(QtGui.QDialog, halModule.HalModule):
     #def getCounts(self):
     #    return self.counters[0].getCounts()
 
+    ## getFrameSubscription
+    #
+    # The spot counter only needs the most recent frame.
+    #
+    # @return ["latest", 1, 1].
+    #
+    @hdebug.debug
+    def getFrameSubscription(self):
+        return ["latest", 1, 1]
+
     ## handleMaxChange
     #
     # Handles changing the maximum of the spot graph.
@@ -789,15 +810,19 @@ if __name__ == "__main__":
 
     import camera.frame as frame
 
-    # This file is available in the ZhuangLab storm-analysis project on github.
-    import sa_library.datareader as datareader
-
     if (len(sys.argv) != 4):
         print "usage: <settings> <movie_in> <png_out>"
         exit()
 
-    # Open movie & get size.
-    data_file = datareader.inferReader(sys.argv[2])
+    # Open movie & get size. Movies taken with HAL (i.e. that have
+    # a .xml file) are memory mapped, otherwise we use the reader
+    # from the ZhuangLab storm-analysis project on github.
+    if os.path.exists(os.path.splitext(sys.argv[2])[0] + ".xml"):
+        import sc_library.datareader as datareader
+        data_file = datareader.reader(sys.argv[2], use_mmap = True)
+    else:
+        import sa_library.datareader as datareader
+        data_file = datareader.inferReader(sys.argv[2])
     [width, height, length] = data_file.filmSize()
 
     # Start spotCounter as a stand-alone application.
@@ -361,7 +361,7 @@ class DaqModulation(IlluminationHardware):
     # Convert a power (0.0 - 1.0) to the appropriate voltage based on channel settings.
     #
     # @param channel_id The channel id.
-    # @param power The power (0.0 - 1.0)
+    # @param power The power (0.0 - 1.0), this can also be a numpy array of powers.
     #
     # @return The voltage the corresponds to this power.
     #
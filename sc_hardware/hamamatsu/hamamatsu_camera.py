@@ -20,6 +20,7 @@
 import ctypes
 import ctypes.util
 import numpy
+import threading
 
 # Hamamatsu constants.
 DCAMCAP_EVENT_FRAMEREADY = int("0x0002", 0)
@@ -139,9 +140,13 @@ class HCamData():
     # Create a data object of the appropriate size.
     #
     # @param size The size of the data object in bytes.
+    # @param pool (Optional) The HCamDataPool that this object belongs to.
     #
-    def __init__(self, size):
+    def __init__(self, size, pool = None):
+        self.lock = threading.Lock()
         self.np_array = numpy.ascontiguousarray(numpy.empty(size/2, dtype=numpy.uint16))
+        self.pool = pool
+        self.ref_count = 0
         self.size = size
 
     ## __getitem__
@@ -175,14 +180,139 @@ class HCamData():
     def getDataPtr(self):
         return self.np_array.ctypes.data
 
+    ## hold
+    #
+    # Add a reference to this object. Consumers that need the data
+    # to stay valid after they return (the display, the film writer
+    # thread, the spot counter, etc.) should call this, then call
+    # release() when they are done with the data.
+    #
+    def hold(self):
+        self.lock.acquire()
+        self.ref_count += 1
+        self.lock.release()
+
+    ## release
+    #
+    # Remove a reference to this object. When there are no more
+    # references the object is returned to its pool (if any).
+    #
+    def release(self):
+        self.lock.acquire()
+        self.ref_count -= 1
+        free = (self.ref_count == 0)
+        self.lock.release()
+        if free and self.pool:
+            self.pool.putData(self)
+
+
+## HCamDataPool
+#
+# A pool of HCamData objects of the same size. Objects are taken
+# out of the pool with a single reference (the camera's) and go
+# back into the pool when the last reference is released, so once
+# the pool has warmed up no memory is allocated per frame.
+#
+# If all the objects are in use the pool is "exhausted". In this
+# case the behavior depends on the never_drop flag. If it is True
+# (filming) a new object is allocated even though this takes the
+# pool past its maximum size. If it is False the pool will wait
+# up to block_timeout seconds for an object to be released and
+# then drop the frame if there is still nothing available.
+#
+class HCamDataPool():
+
+    ## __init__
+    #
+    # @param size The size of the data objects in bytes.
+    # @param max_objects The (nominal) maximum number of objects in the pool.
+    # @param block_timeout (Optional) How long to wait for a free object in seconds, default is 0.01.
+    #
+    def __init__(self, size, max_objects, block_timeout = 0.01):
+        self.block_timeout = block_timeout
+        self.condition = threading.Condition()
+        self.free = []
+        self.max_objects = max_objects
+        self.n_objects = 0
+        self.never_drop = False
+        self.size = size
+        self.resetStatistics()
+
+    ## getData
+    #
+    # Take an object out of the pool.
+    #
+    # @return A HCamData object with a reference count of 1, or None if the frame has to be dropped.
+    #
+    def getData(self):
+        self.condition.acquire()
+        if (len(self.free) == 0) and (self.n_objects >= self.max_objects):
+            self.exhausted += 1
+            if not self.never_drop:
+                self.condition.wait(self.block_timeout)
+
+        hc_data = None
+        if (len(self.free) > 0):
+            hc_data = self.free.pop()
+        elif (self.n_objects < self.max_objects) or self.never_drop:
+            hc_data = HCamData(self.size, pool = self)
+            self.n_objects += 1
+        else:
+            self.dropped += 1
+
+        if hc_data:
+            hc_data.ref_count = 1
+            in_use = self.n_objects - len(self.free)
+            if (in_use > self.peak_in_use):
+                self.peak_in_use = in_use
+        self.condition.release()
+        return hc_data
+
+    ## getStatistics
+    #
+    # @return [number of times the pool was exhausted, number of dropped frames, peak number of objects in use]
+    #
+    def getStatistics(self):
+        return [self.exhausted, self.dropped, self.peak_in_use]
+
+    ## putData
+    #
+    # Return an object to the pool. This is called by HCamData.release().
+    #
+    # @param hc_data A HCamData object.
+    #
+    def putData(self, hc_data):
+        self.condition.acquire()
+        self.free.append(hc_data)
+        self.condition.notify()
+        self.condition.release()
+
+    ## resetStatistics
+    #
+    # Reset the exhaustion & drop counters.
+    #
+    def resetStatistics(self):
+        self.dropped = 0
+        self.exhausted = 0
+        self.peak_in_use = 0
+
+    ## setNeverDrop
+    #
+    # @param never_drop True/False Allocate new objects rather than dropping frames.
+    #
+    def setNeverDrop(self, never_drop):
+        self.condition.acquire()
+        self.never_drop = never_drop
+        self.condition.release()
+
 
 ## HamamatsuCamera
 #
 # Basic camera interface class.
 #
 # This version uses the Hamamatsu library to allocate camera buffers.
-# Storage for the data from the camera is allocated dynamically and
-# copied out of the camera buffers.
+# Storage for the data from the camera comes from a HCamDataPool
+# and the data is copied out of the camera buffers into it.
 #
 class HamamatsuCamera():
 
@@ -199,7 +329,10 @@ class HamamatsuCamera():
         self.camera_id = camera_id
         self.camera_model = self.getModelInfo(camera_id)
         self.debug = False
+        self.filming = False
         self.frame_bytes = 0
+        self.frame_pool = None
+        self.frame_pool_bytes = 512 * 1024 * 1024
         self.frame_x = 0
         self.frame_y = 0
         self.last_frame_number = 0
@@ -335,9 +468,10 @@ class HamamatsuCamera():
                                                 ctypes.c_int32(n)),
                              "dcam_lockdata")
 
-            # Create storage for the frame & copy into this storage.
-            hc_data = HCamData(self.frame_bytes)
-            hc_data.copyData(data_address)
+            # Get storage for the frame from the pool & copy into this storage.
+            hc_data = self.frame_pool.getData()
+            if hc_data:
+                hc_data.copyData(data_address)
 
             # Unlock the frame.
             #
@@ -346,7 +480,8 @@ class HamamatsuCamera():
             self.checkStatus(dcam.dcam_unlockdata(self.camera_handle),
                              "dcam_unlockdata")
 
-            frames.append(hc_data)
+            if hc_data:
+                frames.append(hc_data)
 
         return [frames, [self.frame_x, self.frame_y]]
         
@@ -644,6 +779,25 @@ class HamamatsuCamera():
                          "dcam_setgetpropertyvalue")
         return p_value.value
 
+    ## setFilming
+    #
+    # Tells the camera whether or not the frames are being saved. When
+    # filming the frame pool will grow rather than drop frames.
+    #
+    # @param filming True/False.
+    #
+    def setFilming(self, filming):
+        self.filming = filming
+        if self.frame_pool:
+            self.frame_pool.setNeverDrop(filming)
+
+    ## setFramePoolSize
+    #
+    # @param megabytes The nominal amount of memory to use for the frame pool.
+    #
+    def setFramePoolSize(self, megabytes):
+        self.frame_pool_bytes = int(megabytes * 1024 * 1024)
+
     ## setSubArrayMode
     #
     # This sets the sub-array mode as appropriate based on the current ROI.
@@ -677,6 +831,13 @@ class HamamatsuCamera():
                                               ctypes.c_int32(self.number_image_buffers)),
                          "dcam_allocframe")
 
+        # Create a new frame pool if the frame size has changed.
+        if (not self.frame_pool) or (self.frame_pool.size != self.frame_bytes):
+            self.frame_pool = HCamDataPool(self.frame_bytes,
+                                           max(4, self.frame_pool_bytes/self.frame_bytes))
+        self.frame_pool.resetStatistics()
+        self.frame_pool.setNeverDrop(self.filming)
+
         # Start acquisition.
         self.checkStatus(dcam.dcam_capture(self.camera_handle),
                          "dcam_capture")
@@ -694,6 +855,10 @@ class HamamatsuCamera():
         print "max camera backlog was", self.max_backlog, "of", self.number_image_buffers
         self.max_backlog = 0
 
+        if self.frame_pool:
+            [exhausted, dropped, peak] = self.frame_pool.getStatistics()
+            print "frame pool was exhausted", exhausted, "times, dropped", dropped, "frames, peak use", peak, "of", self.frame_pool.max_objects
+
         # Free image buffers.
         self.number_image_buffers = 0
         self.checkStatus(dcam.dcam_freeframe(self.camera_handle),
@@ -725,9 +890,11 @@ class HamamatsuCamera():
 #   will try and access the same bit of memory at the same time
 #   as the camera and this could end badly.
 #
+# The HCamData reference counts are used to detect (but not prevent)
+# this. If the camera hands out a buffer that downstream code is still
+# holding this is counted as a clash.
+#
 # FIXME: Use lockbits (and unlockbits) to avoid memory clashes?
-#   This would probably also involve some kind of reference counting
-#   scheme.
 #
 class HamamatsuCameraMR(HamamatsuCamera):
 
@@ -738,6 +905,7 @@ class HamamatsuCameraMR(HamamatsuCamera):
     def __init__(self, camera_id):
         HamamatsuCamera.__init__(self, camera_id)
 
+        self.clashes = 0
         self.hcam_data = []
         self.hcam_ptr = False
         self.old_frame_bytes = -1
@@ -759,7 +927,11 @@ class HamamatsuCameraMR(HamamatsuCamera):
     def getFrames(self):
         frames = []
         for n in self.newFrames():
-            frames.append(self.hcam_data[n])
+            hc_data = self.hcam_data[n]
+            if (hc_data.ref_count > 0):
+                self.clashes += 1
+            hc_data.hold()
+            frames.append(hc_data)
 
         return [frames, [self.frame_x, self.frame_y]]
 
@@ -822,6 +994,10 @@ class HamamatsuCameraMR(HamamatsuCamera):
         print "max camera backlog was:", self.max_backlog
         self.max_backlog = 0
 
+        if (self.clashes > 0):
+            print "camera overwrote", self.clashes, "buffers that were still in use"
+        self.clashes = 0
+
 
 #
 # Testing.
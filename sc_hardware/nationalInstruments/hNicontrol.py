@@ -9,6 +9,7 @@
 # Hazen 04/14
 #
 
+import numpy
 import time
 
 # Debugging
@@ -145,9 +146,7 @@ class Nidaq(illuminationHardware.DaqModulation):
             analog_data = sorted(self.analog_data, key = lambda x: (x[0], x[1]))
 
             # Set waveforms.
-            waveform = []
-            for i in range(len(analog_data)):
-                waveform += analog_data[i][2]
+            waveform = numpy.concatenate([x[2] for x in analog_data])
 
             def initAoTask():
 
@@ -176,9 +175,7 @@ class Nidaq(illuminationHardware.DaqModulation):
             digital_data = sorted(self.digital_data, key = lambda x: (x[0], x[1]))
 
             # Set waveforms.
-            waveform = []
-            for i in range(len(digital_data)):
-                waveform += digital_data[i][2]
+            waveform = numpy.concatenate([x[2] for x in digital_data])
 
             def initDoTask():
 
@@ -8,6 +8,8 @@
 #
 
 from ctypes import *
+import numpy
+from numpy.ctypeslib import ndpointer
 import time
 import traceback
 
@@ -34,6 +36,29 @@ DAQmx_Val_Task_Verify = 2
 
 TaskHandle = c_ulong
 
+#
+# Versions of the waveform write functions that take numpy arrays,
+# so that the waveforms are passed to the driver without a copy.
+#
+writeAnalogF64Array = WINFUNCTYPE(c_long,
+                                  TaskHandle,
+                                  c_long,
+                                  c_long,
+                                  c_double,
+                                  c_long,
+                                  ndpointer(dtype = numpy.float64, flags = "C_CONTIGUOUS"),
+                                  POINTER(c_long),
+                                  c_void_p)(("DAQmxWriteAnalogF64", nidaqmx))
+writeDigitalLinesArray = WINFUNCTYPE(c_long,
+                                     TaskHandle,
+                                     c_long,
+                                     c_long,
+                                     c_double,
+                                     c_long,
+                                     ndpointer(dtype = numpy.uint8, flags = "C_CONTIGUOUS"),
+                                     POINTER(c_long),
+                                     c_void_p)(("DAQmxWriteDigitalLines", nidaqmx))
+
 
 #
 # Utility functions
@@ -360,7 +385,7 @@ class AnalogWaveformOutput(NIDAQTask):
     #
     # You need to add all your channels first before calling this.
     #
-    # @param waveform A python array containing the wave form data.
+    # @param waveform A python or numpy array containing the wave form data.
     # @param sample_rate The update frequency at which the wave form will be output.
     # @param finite (Optional) Output the wave form repeatedly or just once, defaults to repeatedly.
     # @param clock (Optional) The clock signal to use as a time base for the wave form, defaults to ctr0out.
@@ -389,21 +414,20 @@ class AnalogWaveformOutput(NIDAQTask):
                                                   c_long(sample_mode),
                                                   c_ulonglong(waveform_len)))
 
-        # Transfer the waveform data to the DAQ board buffer.
+        # Transfer the waveform data to the DAQ board buffer. This
+        # only copies if the waveform is not already a numpy array
+        # of doubles.
         data_len = len(waveform)
         c_samples_written = c_long(data_len)
-        c_wave_form_type = c_double * data_len
-        self.c_waveform = c_wave_form_type()
-        for i in range(data_len):
-            self.c_waveform[i] = c_double(waveform[i])
-        checkStatus(nidaqmx.DAQmxWriteAnalogF64(self.taskHandle, 
-                                                c_long(waveform_len),
-                                                c_long(0),
-                                                c_double(10.0),
-                                                c_long(DAQmx_Val_GroupByChannel),
-                                                byref(self.c_waveform), 
-                                                byref(c_samples_written), 
-                                                None))
+        self.c_waveform = numpy.ascontiguousarray(waveform, dtype = numpy.float64)
+        checkStatus(writeAnalogF64Array(self.taskHandle, 
+                                        c_long(waveform_len),
+                                        c_long(0),
+                                        c_double(10.0),
+                                        c_long(DAQmx_Val_GroupByChannel),
+                                        self.c_waveform, 
+                                        byref(c_samples_written), 
+                                        None))
 
         if (c_samples_written.value == waveform_len):
             return True
@@ -603,7 +627,7 @@ class DigitalWaveformOutput(NIDAQTask):
     #
     # You need to add all your channels first before calling this.
     #
-    # @param waveform A python array containing the wave form data.
+    # @param waveform A python or numpy array containing the wave form data.
     # @param sample_rate The update rate for wave form output.
     # @param finite (Optional) Output the wave form once or repeatedly, defaults to repeatedly.
     # @param clock (Optional) The clock signal that will drive the wave form output, defaults to "ctr0out".
@@ -634,22 +658,16 @@ class DigitalWaveformOutput(NIDAQTask):
 
         # transfer the waveform data to the DAQ board buffer.
         data_len = len(waveform)
-        c_samples_written = c_int(data_len)
-        c_wave_form_type = c_uint8 * data_len
-        self.c_waveform = c_wave_form_type()
-        for i in range(data_len):
-            if (waveform[i] > 0):
-                self.c_waveform[i] = c_uint8(1)
-            else:
-                self.c_waveform[i] = c_uint8(0)
-        checkStatus(nidaqmx.DAQmxWriteDigitalLines(self.taskHandle,
-                                                   c_int(waveform_len),
-                                                   c_int(0),
-                                                   c_double(10.0),
-                                                   c_int(DAQmx_Val_GroupByChannel),
-                                                   byref(self.c_waveform), 
-                                                   byref(c_samples_written), 
-                                                   None))
+        c_samples_written = c_long(data_len)
+        self.c_waveform = (numpy.asarray(waveform) > 0).astype(numpy.uint8)
+        checkStatus(writeDigitalLinesArray(self.taskHandle,
+                                           c_long(waveform_len),
+                                           c_long(0),
+                                           c_double(10.0),
+                                           c_long(DAQmx_Val_GroupByChannel),
+                                           self.c_waveform, 
+                                           byref(c_samples_written), 
+                                           None))
 
         if (c_samples_written.value == waveform_len):
             return True
@@ -14,11 +14,10 @@ import numpy
 import os
 
 import platform
-import scipy
-import scipy.optimize
 import time
 
 import sc_library.hdebug as hdebug
+import sc_hardware.thorlabs.spotEstimators as spotEstimators
 
 Handle = ctypes.wintypes.HANDLE
 
@@ -116,93 +115,6 @@ def create_camera_list(num_cameras):
     return a_list
 
 
-## fitAFunctionLS
-#
-# Does least squares fitting of a function.
-#
-# @param data The data to fit.
-# @param params The initial values for the fit.
-# @param fn The function to fit.
-#
-def fitAFunctionLS(data, params, fn):
-    result = params
-    errorfunction = lambda p: numpy.ravel(fn(*p)(*numpy.indices(data.shape)) - data)
-    good = True
-    [result, cov_x, infodict, mesg, success] = scipy.optimize.leastsq(errorfunction, params, full_output = 1, maxfev = 500)
-    if (success < 1) or (success > 4):
-        hdebug.logText("Fitting problem: " + mesg)
-        #print "Fitting problem:", mesg
-        good = False
-    return [result, good]
-
-## symmetricGaussian
-#
-# Returns a function that will return the amplitude of a symmetric 2D-gaussian at a given x, y point.
-#
-# @param background The gaussian's background.
-# @param height The gaussian's height.
-# @param center_x The gaussian's center in x.
-# @param center_y The gaussian's center in y.
-# @param width The gaussian's width.
-#
-# @return A function.
-#
-def symmetricGaussian(background, height, center_x, center_y, width):
-    return lambda x,y: background + height*numpy.exp(-(((center_x-x)/width)**2 + ((center_y-y)/width)**2) * 2)
-
-## fixedEllipticalGaussian
-#
-# Returns a function that will return the amplitude of a elliptical gaussian (constrained to be oriented
-# along the XY axis) at a given x, y point.
-#
-# @param background The gaussian's background.
-# @param height The gaussian's height.
-# @param center_x The gaussian's center in x.
-# @param center_y The gaussian's center in y.
-# @param width_x The gaussian's width in x.
-# @param width_y The gaussian's width in y.
-#
-# @return A function.
-#
-def fixedEllipticalGaussian(background, height, center_x, center_y, width_x, width_y):
-    return lambda x,y: background + height*numpy.exp(-(((center_x-x)/width_x)**2 + ((center_y-y)/width_y)**2) * 2)
-
-## fitSymmetricGaussian
-#
-# Fits a symmetric gaussian to the data.
-#
-# @param data The data to fit.
-# @param sigma An initial value for the sigma of the gaussian.
-#
-# @return [[fit results], good (True/False)]
-#
-def fitSymmetricGaussian(data, sigma):
-    params = [numpy.min(data),
-              numpy.max(data),
-              0.5 * data.shape[0],
-              0.5 * data.shape[1],
-              2.0 * sigma]
-    return fitAFunctionLS(data, params, symmetricGaussian)
-
-## fitFixedEllipticalGaussian
-#
-# Fits a fixed-axis elliptical gaussian to the data.
-#
-# @param data The data to fit.
-# @param sigma An initial value for the sigma of the gaussian.
-#
-# @return [[fit results], good (True/False)]
-#
-def fitFixedEllipticalGaussian(data, sigma):
-    params = [numpy.min(data),
-              numpy.max(data),
-              0.5 * data.shape[0],
-              0.5 * data.shape[1],
-              2.0 * sigma,
-              2.0 * sigma]
-    return fitAFunctionLS(data, params, fixedEllipticalGaussian)
-
-
 ## Camera
 #
 # UC480 Camera Interface Class
@@ -446,6 +358,8 @@ class Camera(Handle):
 # zero distance is returned as the focus lock offset. The maximum value of the camera
 # pixels is returned as the focus lock sum.
 #
+# The spot positions are determined using one of the estimators in spotEstimators.py.
+#
 class CameraQPD():
 
     ## __init__
@@ -454,8 +368,11 @@ class CameraQPD():
     # @param fit_mutex (Optional) A QMutex to use for fitting (to avoid thread safety issues with numpy), defaults to False.
     # @param x_width (Optional) AOI size in x, defaults to 200.
     # @param y_width (Optional) AOI size in y, defaults to 200.
+    # @param estimator (Optional) The spot position estimator to use, defaults to "gaussian".
     #
-    def __init__(self, camera_id = 1, fit_mutex = False, x_width = 200, y_width = 200):
+    def __init__(self, camera_id = 1, fit_mutex = False, x_width = 200, y_width = 200, estimator = "gaussian"):
+        assert (estimator in spotEstimators.estimators), "unknown spot estimator " + str(estimator)
+        self.estimator = estimator
         self.file_name = "cam_offsets_" + str(camera_id) + ".txt"
         self.fit_mode = 1
         self.fit_mutex = fit_mutex
@@ -533,16 +450,29 @@ class CameraQPD():
 
     ## changeFitMode
     #
-    # @param mode 1 = gaussian fit, any other value = first moment calculation.
+    # @param mode 1 = fit using the current spot estimator, the name of a spot
+    #    estimator (e.g. "gauss_newton") = fit using this estimator, any other
+    #    value = first moment calculation.
     #
     def changeFitMode(self, mode):
-        self.fit_mode = mode
+        if (mode in spotEstimators.estimators):
+            self.estimator = mode
+            self.fit_mode = 1
+        elif isinstance(mode, basestring):
+            print "unknown spot estimator", mode, "using", self.estimator
+        else:
+            self.fit_mode = mode
 
-    ## fitGaussian
+    ## fitSpot
+    #
+    # Finds the brightest pixel and then estimates the spot
+    # center using the pixels around it.
+    #
+    # @param data The image containing the spot.
     #
-    # @param data The data to fit a gaussian to.
+    # @return [max x, max y, [spot center x, spot center y], good]
     #
-    def fitGaussian(self, data):
+    def fitSpot(self, data):
         if (numpy.max(data) < 25):
             return [False, False, False, False]
         x_width = data.shape[0]
@@ -553,13 +483,13 @@ class CameraQPD():
         if (max_x > (self.fit_size-1)) and (max_x < (x_width - self.fit_size)) and (max_y > (self.fit_size-1)) and (max_y < (y_width - self.fit_size)):
             if self.fit_mutex:
                 self.fit_mutex.lock()
-            #[params, status] = fitSymmetricGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], 8.0)
-            [params, status] = fitFixedEllipticalGaussian(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], 8.0)
+            estimator = spotEstimators.estimators[self.estimator]
+            [center_x, center_y, status] = estimator(data[max_x-self.fit_size:max_x+self.fit_size,max_y-self.fit_size:max_y+self.fit_size], 8.0)
             if self.fit_mutex:
                 self.fit_mutex.unlock()
-            params[2] -= self.fit_size/2
-            params[3] -= self.fit_size/2
-            return [max_x, max_y, params, status]
+            center_x -= self.fit_size/2
+            center_y -= self.fit_size/2
+            return [max_x, max_y, [center_x, center_y], status]
         else:
             return [False, False, False, False]
 
@@ -653,21 +583,21 @@ class CameraQPD():
             self.x_off2 = 0.0
             self.y_off2 = 0.0
 
-            # Fit first gaussian to data in the left half of the picture.
+            # Fit first spot to data in the left half of the picture.
             total_good =0
-            [max_x, max_y, params, status] = self.fitGaussian(data[:,:self.half_x])
+            [max_x, max_y, center, status] = self.fitSpot(data[:,:self.half_x])
             if status:
                 total_good += 1
-                self.x_off1 = float(max_x) + params[2] - self.half_y
-                self.y_off1 = float(max_y) + params[3] - self.half_x
+                self.x_off1 = float(max_x) + center[0] - self.half_y
+                self.y_off1 = float(max_y) + center[1] - self.half_x
                 dist1 = abs(self.y_off1)
 
-            # Fit second gaussian to data in the right half of the picture.
-            [max_x, max_y, params, status] = self.fitGaussian(data[:,-self.half_x:])
+            # Fit second spot to data in the right half of the picture.
+            [max_x, max_y, center, status] = self.fitSpot(data[:,-self.half_x:])
             if status:
                 total_good += 1
-                self.x_off2 = float(max_x) + params[2] - self.half_y
-                self.y_off2 = float(max_y) + params[3]
+                self.x_off2 = float(max_x) + center[0] - self.half_y
+                self.y_off2 = float(max_y) + center[1]
                 dist2 = abs(self.y_off2)
 
             if (total_good == 0):
@@ -733,9 +663,10 @@ class CameraQPD300(CameraQPD):
     #
     # @param camera_id (Optional) The camera id, defaults to 1.
     # @param fit_mutex (Optional) A QMutex to use during fitting, defaults to False.
+    # @param estimator (Optional) The spot position estimator to use, defaults to "gaussian".
     #
-    def __init__(self, camera_id = 1, fit_mutex = False):
-        CameraQPD.__init__(self, camera_id, fit_mutex)
+    def __init__(self, camera_id = 1, fit_mutex = False, estimator = "gaussian"):
+        CameraQPD.__init__(self, camera_id, fit_mutex, estimator = estimator)
 
         # Change initial zero distance to 150.0
         self.zero_dist = 150.0
@@ -764,9 +695,10 @@ class CameraQPD500(CameraQPD):
     #
     # @param camera_id (Optional) The camera id, defaults to 1.
     # @param fit_mutex (Optional) A QMutex to use during fitting, defaults to False.
+    # @param estimator (Optional) The spot position estimator to use, defaults to "gaussian".
     #
-    def __init__(self, camera_id = 1, fit_mutex = False):
-        CameraQPD.__init__(self, camera_id, fit_mutex)
+    def __init__(self, camera_id = 1, fit_mutex = False, estimator = "gaussian"):
+        CameraQPD.__init__(self, camera_id, fit_mutex, estimator = estimator)
 
         # Change initial zero distance to 250.0
         self.zero_dist = 250.0
@@ -796,9 +728,10 @@ class CameraQPD752(CameraQPD):
     #
     # @param camera_id (Optional) The camera id, defaults to 1.
     # @param fit_mutex (Optional) A QMutex to use during fitting, defaults to False.
+    # @param estimator (Optional) The spot position estimator to use, defaults to "gaussian".
     #
-    def __init__(self, camera_id = 1, fit_mutex = False):
-        CameraQPD.__init__(self, camera_id, fit_mutex)
+    def __init__(self, camera_id = 1, fit_mutex = False, estimator = "gaussian"):
+        CameraQPD.__init__(self, camera_id, fit_mutex, estimator = estimator)
 
         # Change initial zero distance to 250.0
         self.zero_dist = 376.0
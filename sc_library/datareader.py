@@ -4,34 +4,127 @@
 # the Steve program and it assumes the existance of an XML file
 # that describes everything that one needs to know about a movie.
 #
+# The memory mapped readers (DaxMapReader, SpeMapReader and
+# TifMapReader) expose the whole movie as a numpy array of shape
+# (frames, y, x). Frames are paged in from the disk by the operating
+# system as they are accessed, and frames & slices are views of
+# the file, not copies.
+#
 # Hazen 07/15
 #
 
+import mmap
 import numpy
 import os
 from PIL import Image
 import re
+import struct
 
 import sc_library.parameters as parameters
 
 #
 # Returns the appropriate object based on the file type as
-# saved in the corresponding XML file.
+# saved in the corresponding XML file. If use_mmap is True
+# then a memory mapped reader is returned.
 #
-def reader(filename):
+def reader(filename, use_mmap = False):
     no_ext_name = os.path.splitext(filename)[0]    
     xml = parameters.parameters(no_ext_name + ".xml")
     file_type = xml.get("film.filetype")
     if (file_type == ".dax"):
+        if use_mmap:
+            return DaxMapReader(filename, xml)
         return DaxReader(filename, xml)
     elif (file_type == ".spe"):
+        if use_mmap:
+            return SpeMapReader(filename, xml)
         return SpeReader(filename, xml)
     elif (file_type == ".tif"): 
+        if use_mmap:
+            return TifMapReader(filename, xml)
         return TifReader(filename, xml)
     else:
         print file_type, "is not a recognized file type"
         raise IOError("only .dax, .spe and .tif are supported (case sensitive..)")
 
+#
+# Returns a list of [offset, width, height] of each of the frames
+# in a tif file and the numpy data type of the pixels. This only
+# supports uncompressed 16 bit single channel images whose data is
+# contiguous in the file, i.e. what halLib.tiffwriter writes. Both
+# classic tif and BigTIFF files are supported.
+#
+def tifStripIndex(filename):
+    with open(filename, "rb") as fp:
+        data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+    try:
+        if (data[:2] == "II"):
+            order = "<"
+        elif (data[:2] == "MM"):
+            order = ">"
+        else:
+            raise IOError(filename + " is not a tif file.")
+
+        magic = struct.unpack_from(order + "H", data, 2)[0]
+        if (magic == 42):
+            [ifd_offset] = struct.unpack_from(order + "I", data, 4)
+            count_fmt = order + "H"
+            entry_fmt = order + "HHI"
+            offset_fmt = order + "I"
+            offset_size = 4
+        elif (magic == 43):
+            [ifd_offset] = struct.unpack_from(order + "Q", data, 8)
+            count_fmt = order + "Q"
+            entry_fmt = order + "HHQ"
+            offset_fmt = order + "Q"
+            offset_size = 8
+        else:
+            raise IOError(filename + " is not a tif file.")
+        count_size = struct.calcsize(count_fmt)
+        entry_size = struct.calcsize(entry_fmt) + offset_size
+
+        # TIFF type number : struct format.
+        type_fmts = {3 : "H", 4 : "I", 16 : "Q"}
+
+        index = []
+        while (ifd_offset != 0):
+            [n_tags] = struct.unpack_from(count_fmt, data, ifd_offset)
+            tags = {}
+            for i in range(n_tags):
+                loc = ifd_offset + count_size + i * entry_size
+                [tag, tag_type, count] = struct.unpack_from(entry_fmt, data, loc)
+                if not tag_type in type_fmts:
+                    continue
+                fmt = order + str(count) + type_fmts[tag_type]
+                value_loc = loc + entry_size - offset_size
+                if (struct.calcsize(fmt) > offset_size):
+                    [value_loc] = struct.unpack_from(offset_fmt, data, value_loc)
+                tags[tag] = struct.unpack_from(fmt, data, value_loc)
+            [ifd_offset] = struct.unpack_from(offset_fmt, data, ifd_offset + count_size + n_tags * entry_size)
+
+            width = tags[256][0]
+            height = tags[257][0]
+            if (tags.get(258, [16])[0] != 16) or (tags.get(259, [1])[0] != 1) or (tags.get(277, [1])[0] != 1):
+                raise IOError(filename + " is not an uncompressed 16 bit single channel tif file.")
+
+            # Check that the strips (if there is more than one) are contiguous.
+            offsets = tags[273]
+            byte_counts = tags[279]
+            for i in range(len(offsets) - 1):
+                if ((offsets[i] + byte_counts[i]) != offsets[i+1]):
+                    raise IOError(filename + " image data is not contiguous.")
+            if (sum(byte_counts) != (2 * width * height)):
+                raise IOError(filename + " image data size does not match the image size.")
+
+            if (len(index) > 0) and ((width != index[0][1]) or (height != index[0][2])):
+                raise IOError(filename + " frames are not all the same size.")
+            index.append([offsets[0], width, height])
+    finally:
+        data.close()
+
+    return [index, numpy.dtype(order + "u2")]
+
 #
 # The superclass containing those functions that 
 # are common to reading a STORM movie file.
@@ -189,6 +282,139 @@ class TifReader(DataReader):
         return image_data
 
 
+#
+# The superclass of the memory mapped readers. This is used together
+# with one of the readers above, which provides the meta-data. The
+# sub-class should set self.movie to a numpy array of shape
+# (frames, y, x), or self.frames to a list of (y, x) numpy arrays if
+# the frames are not evenly spaced in the file. The frames have the
+# same orientation as those returned by the non memory mapped reader.
+#
+class MappedReader:
+
+    # Returns a frame or a numpy array of frames.
+    def __getitem__(self, key):
+        if self.movie is not None:
+            return self.movie[key]
+        elif isinstance(key, slice):
+            return numpy.array(self.frames[key])
+        else:
+            return self.frames[key]
+
+    def __len__(self):
+        return self.number_frames
+
+    # Release the memory map. Frames that were already returned
+    # remain valid as they keep a reference to the map.
+    def closeFilePtr(self):
+        self.frames = []
+        self.movie = None
+        DataReader.closeFilePtr(self)
+
+    # Returns a view of a frame. Unlike the non memory mapped
+    # readers the frame is not cast to int16.
+    def loadAFrame(self, frame_number, cast_to_int16 = False):
+        self.checkFrameNumber(frame_number)
+        if cast_to_int16:
+            return self[frame_number].astype(numpy.int16)
+        return self[frame_number]
+
+    # Returns the movie as a numpy array, this is only a
+    # view of the file if the frames are evenly spaced.
+    def loadMovie(self):
+        return self[:]
+
+    # Map frames of size (w, h) starting at offset and separated
+    # by stride bytes, then transpose them to match the orientation
+    # of loadAFrame(). This raises an IOError if the file is
+    # too small, for example because it is still being written.
+    def mapMovie(self, dtype, offset, stride, w, h):
+        self.frames = []
+        self.movie = None
+        if (self.number_frames > 0):
+            try:
+                data = numpy.memmap(self.filename, dtype = numpy.uint8, mode = "r")
+                movie = numpy.ndarray(shape = (self.number_frames, w, h),
+                                      dtype = dtype,
+                                      buffer = data,
+                                      offset = offset,
+                                      strides = (stride, h * dtype.itemsize, dtype.itemsize))
+            except (TypeError, ValueError) as exception:
+                raise IOError("Could not map " + self.filename + ", " + str(exception))
+            self.movie = numpy.transpose(movie, (0, 2, 1))
+
+
+#
+# Memory mapped dax reader class.
+#
+class DaxMapReader(MappedReader, DaxReader):
+
+    def __init__(self, filename, xml):
+        DaxReader.__init__(self, filename, xml)
+        DataReader.closeFilePtr(self)
+        self.fileptr = False
+
+        if self.bigendian:
+            dtype = numpy.dtype(">i2")
+        else:
+            dtype = numpy.dtype("<i2")
+        frame_size = self.image_width * self.image_height * 2
+        self.mapMovie(dtype, 0, frame_size, self.image_width, self.image_height)
+
+
+#
+# Memory mapped SPE reader class.
+#
+class SpeMapReader(MappedReader, SpeReader):
+
+    def __init__(self, filename, xml):
+        SpeReader.__init__(self, filename, xml)
+        DataReader.closeFilePtr(self)
+        self.fileptr = False
+
+        self.mapMovie(numpy.dtype(self.image_mode),
+                      self.header_size,
+                      self.image_size,
+                      self.image_height,
+                      self.image_width)
+
+
+#
+# Memory mapped TIF reader class. This uses its own index of the
+# image data in the file so it also works for BigTIFF files.
+#
+class TifMapReader(MappedReader, DataReader):
+
+    def __init__(self, filename, xml):
+        DataReader.__init__(self, filename, xml)
+
+        [index, dtype] = tifStripIndex(filename)
+
+        # Same convention as TifReader.
+        self.image_width = index[0][2]
+        self.image_height = index[0][1]
+        self.number_frames = len(index)
+
+        self.frames = []
+        self.movie = None
+        frame_size = 2 * self.image_width * self.image_height
+        offsets = map(lambda(x): x[0], index)
+        strides = map(lambda(x): offsets[x+1] - offsets[x], range(len(offsets) - 1))
+        if (len(strides) == 0) or ((len(set(strides)) == 1) and (strides[0] >= frame_size)):
+            stride = frame_size
+            if (len(strides) > 0):
+                stride = strides[0]
+            self.mapMovie(dtype, offsets[0], stride, self.image_width, self.image_height)
+        else:
+            data = numpy.memmap(self.filename, dtype = numpy.uint8, mode = "r")
+            for offset in offsets:
+                image_data = numpy.ndarray(shape = (self.image_width, self.image_height),
+                                           dtype = dtype,
+                                           buffer = data,
+                                           offset = offset)
+                self.frames.append(numpy.transpose(image_data))
+
+
 #
 # The MIT License
 #
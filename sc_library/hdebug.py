@@ -6,6 +6,10 @@
 #
 # Hazen 01/14
 #
+# If tracing is started (see startLogging()) the debug decorator
+# records the time spent in each function in a binary trace file
+# (see htrace.py) instead of logging the arguments.
+#
 
 import functools
 import logging
@@ -13,6 +17,8 @@ import logging.handlers
 
 from PyQt4 import QtCore
 
+import sc_library.htrace as htrace
+
 a_logger = False
 logging_mutex = QtCore.QMutex()
 
@@ -29,14 +35,25 @@ def objectToString(a_object, a_name, a_attrs):
 ## debug
 #
 # Function decorator. This logs all the arguments to a function that it decorates
-# if logging has been started.
+# if logging has been started, or records the start and end time of the function
+# if tracing has been started.
+#
+# The name of the function in the trace file includes the line number,
+# as the class of a method is not known when it is decorated and methods
+# of different classes in the same module can have the same name.
 #
 # @param fn The function to decorate.
 #
 def debug(fn):
     global a_logger, logging_mutex
+    fn_id = htrace.registerFunction(fn.__module__ + "." + fn.__name__ + ":" + str(fn.func_code.co_firstlineno))
     @functools.wraps(fn)
     def __wrapper(*args, **kw):
+        if htrace.tracer:
+            start = htrace.clock()
+            temp = fn(*args, **kw)
+            htrace.addSpan(fn_id, start)
+            return temp
         if a_logger:
             logging_mutex.lock()
             if fn.__module__ == "__main__":
@@ -97,8 +114,9 @@ def logText(a_string, to_console = False):
 #
 # @param directory The directory to save the log files in.
 # @param program_name The name of the program that is doing the logging.
+# @param trace (Optional) True/False save a trace file instead of logging the function calls, defaults to False.
 #
-def startLogging(directory, program_name):
+def startLogging(directory, program_name, trace = False):
     global a_logger
 
     # Get logger index (to allow logging from several programs with the same name).
@@ -131,6 +149,10 @@ def startLogging(directory, program_name):
         rf_handler.setFormatter(rt_formatter)
         a_logger.addHandler(rf_handler)
 
+    # Start tracing.
+    if a_logger and trace:
+        htrace.startTracing(directory + program_name + "_" + str(index) + ".trace")
+
 #
 # The MIT License
 #
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Low overhead tracing of function calls, this is used by the
+# hdebug.debug decorator when tracing is started.
+#
+# Each call is recorded as a span (function id, start time, end time)
+# in a ring buffer that belongs to the thread that made the call, so
+# recording a span does not need a lock and does not format any
+# strings. A background thread writes the spans to a binary trace
+# file once per second. If a thread records more than buffer_size
+# spans between writes the oldest spans are lost.
+#
+# The trace file starts with the magic string, followed by blocks.
+# Each block starts with the number of names and the number of spans
+# ("<II"). A name is "<BIH" (kind, id, length) followed by the name,
+# kind is 0 for functions and 1 for threads. The spans follow as
+# span_dtype records. Use trace_analysis.py to analyze trace files.
+#
+
+import atexit
+import collections
+import ctypes
+import numpy
+import struct
+import sys
+import threading
+import time
+
+magic = "SCTRACE1"
+
+span_dtype = numpy.dtype([("function", numpy.uint32),
+                          ("thread", numpy.uint32),
+                          ("start", numpy.float64),
+                          ("end", numpy.float64)])
+
+buffer_size = 100000
+
+buffers = []
+buffers_lock = threading.Lock()
+functions = []
+local = threading.local()
+tracer = False
+
+
+## createClock
+#
+# Returns a monotonic clock function. This is time.clock() on windows
+# (QueryPerformanceCounter()) and clock_gettime(CLOCK_MONOTONIC) on
+# linux. If neither is available it is time.time().
+#
+# @return A function (without arguments) that returns the time in seconds.
+#
+def createClock():
+    if (sys.platform == "win32"):
+        return time.clock
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long),
+                    ("tv_nsec", ctypes.c_long)]
+
+    try:
+        clock_gettime = ctypes.CDLL("librt.so.1").clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+
+    def monotonic():
+        ts = timespec()
+        clock_gettime(1, ctypes.byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1.0e-9
+    return monotonic
+
+clock = createClock()
+
+
+## addSpan
+#
+# Record a span in the ring buffer of the current thread.
+#
+# @param function_id The id of the function (from registerFunction()).
+# @param start The start time of the span (from clock()).
+#
+def addSpan(function_id, start):
+    end = clock()
+    try:
+        local.buffer.append((function_id, start, end))
+    except AttributeError:
+        newBuffer().append((function_id, start, end))
+
+## newBuffer
+#
+# Creates the ring buffer for the current thread.
+#
+# @return The ring buffer (a collections.deque).
+#
+def newBuffer():
+    local.buffer = collections.deque(maxlen = buffer_size)
+    with buffers_lock:
+        buffers.append([len(buffers), threading.current_thread().name, local.buffer])
+    return local.buffer
+
+## registerFunction
+#
+# @param name The name of a function, e.g. "focusLockZ.startFilm:430" (see hdebug.debug()).
+#
+# @return The id of the function.
+#
+def registerFunction(name):
+    with buffers_lock:
+        functions.append(name)
+        return len(functions) - 1
+
+## startTracing
+#
+# Start writing the spans to a trace file.
+#
+# @param filename The name of the trace file.
+#
+def startTracing(filename):
+    global tracer
+    if not tracer:
+        tracer = TraceWriter(filename)
+        atexit.register(stopTracing)
+
+## stopTracing
+#
+# Writes any remaining spans and closes the trace file.
+#
+def stopTracing():
+    global tracer
+    if tracer:
+        a_tracer = tracer
+        tracer = False
+        a_tracer.close()
+
+
+## TraceWriter
+#
+# Periodically writes the spans in the ring buffers to the trace file.
+#
+class TraceWriter(threading.Thread):
+
+    ## __init__
+    #
+    # @param filename The name of the trace file.
+    # @param interval (Optional) The time between writes in seconds, defaults to 1.0.
+    #
+    def __init__(self, filename, interval = 1.0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.interval = interval
+        self.n_functions = 0
+        self.n_threads = 0
+        self.stopped = threading.Event()
+
+        self.fp = open(filename, "wb")
+        self.fp.write(magic)
+        self.start()
+
+    ## close
+    #
+    # Stops the thread, writes any remaining spans and closes the file.
+    #
+    def close(self):
+        self.stopped.set()
+        self.join()
+        self.flush()
+        self.fp.close()
+
+    ## flush
+    #
+    # Writes the names that are new since the last call and the spans
+    # that are in the ring buffers.
+    #
+    def flush(self):
+        with buffers_lock:
+            new_functions = functions[self.n_functions:]
+            new_threads = buffers[self.n_threads:]
+            thread_buffers = buffers[:]
+
+        names = ""
+        for i, name in enumerate(new_functions):
+            names += struct.pack("<BIH", 0, self.n_functions + i, len(name)) + name
+        for [index, name, buffer] in new_threads:
+            names += struct.pack("<BIH", 1, index, len(name)) + name
+        self.n_functions += len(new_functions)
+        self.n_threads += len(new_threads)
+
+        # popleft() is atomic, so the threads can keep adding spans.
+        spans = []
+        for [index, name, buffer] in thread_buffers:
+            for i in range(len(buffer)):
+                [function_id, start, end] = buffer.popleft()
+                spans.append((function_id, index, start, end))
+
+        if (len(names) > 0) or (len(spans) > 0):
+            self.fp.write(struct.pack("<II", len(new_functions) + len(new_threads), len(spans)))
+            self.fp.write(names)
+            numpy.array(spans, dtype = span_dtype).tofile(self.fp)
+            self.fp.flush()
+
+    ## run
+    #
+    # Write the spans every interval seconds until we are told to stop.
+    #
+    def run(self):
+        while not self.stopped.is_set():
+            self.stopped.wait(self.interval)
+            self.flush()
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2015 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
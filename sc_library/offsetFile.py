@@ -0,0 +1,304 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Reading and writing of focus lock offset files.
+#
+# The original format is text (.off files), one line per frame
+# with the frame number, offset, sum (power) and stage z. The
+# binary format (.offb files) is a 16 byte header followed by one
+# offset_dtype record per frame. The records are written in
+# batches by a separate thread so that HAL does not have to wait
+# on the file system when it gets a new frame.
+#
+# readOffsetFile() can read both formats. The binary format has
+# its own extension so that programs that read .off files as text
+# (e.g. with numpy.loadtxt()) are not given binary files.
+#
+
+import collections
+import numpy
+import os
+import struct
+import sys
+import threading
+import time
+
+binary_extension = ".offb"
+magic = "SCOFFSET"
+text_extension = ".off"
+version = 1
+
+offset_dtype = numpy.dtype([("frame", numpy.int32),
+                            ("time", numpy.float64),
+                            ("offset", numpy.float32),
+                            ("power", numpy.float32),
+                            ("stage_z", numpy.float32),
+                            ("is_locked", numpy.uint8)])
+
+header_size = len(magic) + 8
+
+
+## OffsetFileException
+#
+# Offset file exception.
+#
+class OffsetFileException(Exception):
+
+    ## __init__
+    #
+    # @param message The exception message.
+    #
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+## BinaryOffsetFile
+#
+# Writes the offset data in the binary format. The samples are
+# collected into batches which are then written by the thread.
+#
+class BinaryOffsetFile(threading.Thread):
+
+    ## __init__
+    #
+    # @param filename The name of the file (including the extension).
+    # @param batch_size (Optional) The number of samples in a batch.
+    #
+    def __init__(self, filename, batch_size = 100):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.batch = []
+        self.batch_size = batch_size
+        self.batches = collections.deque()
+        self.condition = threading.Condition()
+        self.filename = filename
+        self.running = True
+        self.written = 0
+
+        self.fp = open(filename, "wb")
+        self.fp.write(magic)
+        self.fp.write(struct.pack("<II", version, offset_dtype.itemsize))
+        self.start()
+
+    ## addSample
+    #
+    # This is called by HAL for each new frame while filming.
+    #
+    # @param frame The frame number.
+    # @param offset The focus lock offset.
+    # @param power The focus lock sum signal.
+    # @param stage_z The z position of the piezo stage.
+    # @param is_locked True/False the focus lock is locked.
+    # @param timestamp (Optional) The time of the sample, defaults to now.
+    #
+    def addSample(self, frame, offset, power, stage_z, is_locked, timestamp = None):
+        if timestamp is None:
+            timestamp = time.time()
+        self.batch.append((frame, timestamp, offset, power, stage_z, is_locked))
+        if (len(self.batch) >= self.batch_size):
+            self.flush()
+
+    ## close
+    #
+    # Writes any remaining samples, stops the thread and closes the file.
+    #
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.join()
+        self.fp.close()
+
+    ## flush
+    #
+    # Passes the current batch to the writer thread.
+    #
+    def flush(self):
+        if (len(self.batch) > 0):
+            with self.condition:
+                self.batches.append(self.batch)
+                self.condition.notify_all()
+            self.batch = []
+
+    ## run
+    #
+    # Write batches until we are told to stop and there are no more batches.
+    #
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (len(self.batches) == 0):
+                    self.condition.wait()
+                if (len(self.batches) == 0):
+                    return
+                batch = self.batches.popleft()
+            numpy.array(batch, dtype = offset_dtype).tofile(self.fp)
+            self.written += len(batch)
+
+
+## TextOffsetFile
+#
+# Writes the offset data in the original text format. This has
+# the same interface as BinaryOffsetFile.
+#
+class TextOffsetFile(object):
+
+    ## __init__
+    #
+    # @param filename The name of the file (including the extension).
+    #
+    def __init__(self, filename):
+        self.filename = filename
+        self.fp = open(filename, "w")
+        self.fp.write("frame offset power stage-z\n")
+
+    ## addSample
+    #
+    # @param frame The frame number.
+    # @param offset The focus lock offset.
+    # @param power The focus lock sum signal.
+    # @param stage_z The z position of the piezo stage.
+    # @param is_locked This is not saved.
+    # @param timestamp This is not saved.
+    #
+    def addSample(self, frame, offset, power, stage_z, is_locked, timestamp = None):
+        self.fp.write("{0:d} {1:.6f} {2:.6f} {3:.6f}\n".format(frame, offset, power, stage_z))
+
+    ## close
+    #
+    def close(self):
+        self.fp.close()
+
+
+## findOffsetFile
+#
+# @param basename The name of the offset file without the extension, e.g. the movie name.
+#
+# @return The name of the text or the binary offset file, or None if neither exists.
+#
+def findOffsetFile(basename):
+    for binary in [False, True]:
+        if os.path.exists(offsetFileName(basename, binary)):
+            return offsetFileName(basename, binary)
+    return None
+
+## isBinaryOffsetFile
+#
+# @param filename The name of the offset file.
+#
+# @return True/False the file is a binary offset file.
+#
+def isBinaryOffsetFile(filename):
+    with open(filename, "rb") as fp:
+        return (fp.read(len(magic)) == magic)
+
+## offsetFileName
+#
+# @param basename The name of the offset file without the extension, e.g. the movie name.
+# @param binary (Optional) True/False the file is in the binary format, defaults to True.
+#
+# @return The name of the offset file, with the extension of the format.
+#
+def offsetFileName(basename, binary = True):
+    if binary:
+        return basename + binary_extension
+    else:
+        return basename + text_extension
+
+## openOffsetFile
+#
+# @param filename The name of the file (including the extension).
+# @param binary (Optional) True/False use the binary format, defaults to True.
+#
+# @return A BinaryOffsetFile or a TextOffsetFile object.
+#
+def openOffsetFile(filename, binary = True):
+    if binary:
+        return BinaryOffsetFile(filename)
+    else:
+        return TextOffsetFile(filename)
+
+## readOffsetFile
+#
+# Reads a binary or a text offset file. For text files the time
+# field is set to NaN and the is_locked field is set to 0.
+#
+# @param filename The name of the offset file.
+#
+# @return A numpy array with dtype offset_dtype.
+#
+def readOffsetFile(filename):
+    if isBinaryOffsetFile(filename):
+        with open(filename, "rb") as fp:
+            fp.read(len(magic))
+            [file_version, record_size] = struct.unpack("<II", fp.read(8))
+            if (file_version != version) or (record_size != offset_dtype.itemsize):
+                raise OffsetFileException("Unknown offset file version " + str(file_version))
+            data = fp.read()
+
+        # Ignore a partially written last record.
+        n_records = len(data)/record_size
+        return numpy.frombuffer(data[:n_records * record_size], dtype = offset_dtype).copy()
+
+    text_data = numpy.loadtxt(filename, skiprows = 1, ndmin = 2)
+    data = numpy.zeros(text_data.shape[0], dtype = offset_dtype)
+    data["frame"] = text_data[:,0]
+    data["time"] = numpy.nan
+    data["offset"] = text_data[:,1]
+    data["power"] = text_data[:,2]
+    data["stage_z"] = text_data[:,3]
+    return data
+
+## writeTextOffsetFile
+#
+# Saves offset data in the text format, for programs that only
+# understand the text format.
+#
+# @param filename The name of the text file.
+# @param data A numpy array with dtype offset_dtype.
+#
+def writeTextOffsetFile(filename, data):
+    fp = TextOffsetFile(filename)
+    for sample in data:
+        fp.addSample(int(sample["frame"]), sample["offset"], sample["power"], sample["stage_z"], sample["is_locked"])
+    fp.close()
+
+
+#
+# Converts a binary offset file to a text offset file.
+#
+if __name__ == "__main__":
+
+    if (len(sys.argv) != 3):
+        print "usage: <binary .offb file> <text .off file>"
+        exit()
+
+    writeTextOffsetFile(sys.argv[2], readOffsetFile(sys.argv[1]))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2014 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -8,10 +8,22 @@
 #
 # Hazen 06/15
 #
+# get() is convenient but it is slow, so for properties that are
+# read often (e.g. once per frame) use getter() to resolve the name
+# once, or freeze() to create an immutable snapshot with a flat
+# dictionary of all the properties.
+#
+# copy() is copy-on-write, the copy shares the sub-objects (i.e. the
+# "film" block) with the original until one of them changes. Shared
+# sub-objects are skipped by diff(), so comparing two parameters
+# objects costs time proportional to the number of blocks that differ.
+#
 
 import copy
+import numpy
 import os
 import traceback
+import weakref
 
 from xml.dom import minidom
 from xml.etree import ElementTree
@@ -32,13 +44,14 @@ default_params = 0
 # @param duplicate The duplicate settings.
 #
 def copySettings(original, duplicate):
-    settings = copy.deepcopy(original)
+    settings = original.copy()
 
     for attr in settings.getAttrs():
 
-        # Sub block parameter.
-        if isinstance(settings.get(attr), StormXMLObject):
-            sub_settings = settings.get(attr)
+        # Sub block parameter. This is only copied (from original) if
+        # duplicate changes some of its properties.
+        if isinstance(settings.__dict__[attr], StormXMLObject):
+            sub_settings = settings.__dict__[attr]
 
             # Duplicate also has sub blocks, only look in the same sub block.
             sub_duplicate = False
@@ -51,7 +64,7 @@ def copySettings(original, duplicate):
             if sub_duplicate:
                 for sub_attr in sub_settings.getAttrs():
                     if sub_duplicate.has(sub_attr):
-                        sub_settings.set(sub_attr, sub_duplicate.get(sub_attr))
+                        settings.get(attr).set(sub_attr, sub_duplicate.get(sub_attr))
 
         # Main block parameter.
         else:
@@ -108,7 +121,7 @@ def halParameters(parameters_file):
         xml_object = copySettings(default_params, xml_object)
 
     if use_as_default or (not default_params):
-        default_params = copy.deepcopy(xml_object)
+        default_params = xml_object.copy()
     else:
         xml_object.set("use_as_default", False)
     
@@ -182,6 +195,29 @@ def hardware(hardware_file):
 
     return xml_object
 
+## isDifferent
+#
+# Compares two property values. Lists are compared item by item as
+# they can contain numpy arrays (i.e. illumination.shutter_data) and
+# comparing those with != does not give a single True or False.
+#
+# @param value The first value.
+# @param other_value The second value.
+#
+# @return True if the values are different.
+#
+def isDifferent(value, other_value):
+    if isinstance(value, numpy.ndarray) or isinstance(other_value, numpy.ndarray):
+        return not numpy.array_equal(value, other_value)
+    if isinstance(value, list) and isinstance(other_value, list):
+        if (len(value) != len(other_value)):
+            return True
+        for i in range(len(value)):
+            if isDifferent(value[i], other_value[i]):
+                return True
+        return False
+    return (value != other_value)
+
 ## parameters
 #
 # Parses a parameters file to create a parameters object.
@@ -264,6 +300,74 @@ class ParametersException(Exception):
     def __init__(self, message):
         Exception.__init__(self, message)
 
+
+## FrozenParameters
+#
+# An immutable snapshot of a StormXMLObject. The properties (including
+# those of the sub-objects) are stored in a single dictionary by their
+# full name (i.e. "film.frames"), so get() is a single dictionary look up.
+#
+class FrozenParameters(object):
+
+    ## __init__
+    #
+    # @param xml_object The StormXMLObject to take the snapshot of.
+    #
+    def __init__(self, xml_object):
+        self._values_ = {}
+        for attr in xml_object.getAttrs():
+            value = xml_object.__dict__[attr]
+            if isinstance(value, StormXMLObject):
+                sub_object = FrozenParameters(value)
+                self._values_[attr] = sub_object
+                for pname in sub_object._values_:
+                    self._values_[attr + "." + pname] = sub_object._values_[pname]
+            else:
+                self._values_[attr] = copy.deepcopy(value)
+
+    ## get
+    #
+    # @param pname A string containing the property name.
+    # @param default (Optional) The value to use if the property is not found.
+    #
+    # @return The property if found, otherwise default.
+    #
+    def get(self, pname, default = None):
+        try:
+            return self._values_[pname]
+        except KeyError:
+            if default is not None:
+                return default
+            else:
+                raise ParametersException("Requested property " + pname + " not found and no default was specified.")
+
+    ## getter
+    #
+    # @param pname A string containing the property name.
+    # @param default (Optional) The value to use if the property is not found.
+    #
+    # @return A function (without arguments) that returns the property.
+    #
+    def getter(self, pname, default = None):
+        value = self.get(pname, default)
+        return lambda: value
+
+    ## has
+    #
+    # @param pname A string containing the property name.
+    #
+    # @return True if found, otherwise False.
+    #
+    def has(self, pname):
+        return (pname in self._values_)
+
+    ## set
+    #
+    # Frozen parameters cannot be changed.
+    #
+    def set(self, pname, value):
+        raise ParametersException("Cannot set " + str(pname) + ", these parameters are frozen.")
+
         
 ## StormXMLObject
 #
@@ -281,6 +385,7 @@ class StormXMLObject(object):
     #
     def __init__(self, nodes, recurse = False):
 
+        self._borrowers_ = []
         self._recursed_ = False
         self._unused_ = {}
         self._warned_ = False
@@ -357,12 +462,40 @@ class StormXMLObject(object):
                 setattr(self, node.tag, StormXMLObject(node, True))
                 self._recursed_ = True
 
+    ## addBorrower
+    #
+    # Record that this object is also a sub-object of a copy of its parent,
+    # see copy().
+    #
+    # @param parent The StormXMLObject that is sharing this object.
+    # @param pname The name of this object in parent.
+    #
+    def addBorrower(self, parent, pname):
+        self._borrowers_ = filter(lambda(x): x[0]() is not None, self._borrowers_)
+        self._borrowers_.append([weakref.ref(parent), pname])
+
     ## copy()
     #
-    # @return A deep copy of this object.
+    # This is a copy-on-write copy. The sub-objects are shared with the copy
+    # until either of them changes (or gets) the sub-object, at which point
+    # it gets its own copy of the sub-object (see get() and unshare()). The
+    # lists in this object are deep copied.
+    #
+    # @return A copy of this object.
     #
     def copy(self):
-        return copy.deepcopy(self)
+        new_object = StormXMLObject([])
+        new_object._recursed_ = self._recursed_
+        new_object._unused_ = self._unused_.copy()
+        new_object._warned_ = self._warned_
+        for pname in self.getAttrs():
+            value = self.__dict__[pname]
+            if isinstance(value, StormXMLObject):
+                value.addBorrower(new_object, pname)
+            elif isinstance(value, list) or isinstance(value, dict):
+                value = copy.deepcopy(value)
+            new_object.__dict__[pname] = value
+        return new_object
 
     ## create
     #
@@ -379,19 +512,43 @@ class StormXMLObject(object):
     ## diff
     #
     # Return the parameters that are different in another StormXMLObject from
-    # those in the current object. This does not check recursively.
+    # those in the current object, including the properties that only exist
+    # in one of the objects. Sub-objects are checked recursively, unless they
+    # are shared by the two objects (see copy()).
     #
     # @param other The other StormXMLObject.
+    # @param prefix (Optional) The string to add to the front of the property names.
     #
-    # @return The names of the properties that are different.
+    # @return The full names (i.e. "film.frames") of the properties that are different.
     #
-    def diff(self, other):
+    def diff(self, other, prefix = ""):
         diffs = []
-        for pname in filter(lambda(x): not isinstance(self.get(x, mark_used = False), StormXMLObject), self.getAttrs()):
-            if (self.get(pname) != other.get(pname)):
-                diffs.append(pname)
+        for pname in self.getAttrs():
+            value = self.__dict__[pname]
+            if not (pname in other.__dict__):
+                diffs.append(prefix + pname)
+                continue
+
+            other_value = other.__dict__[pname]
+            if value is other_value:
+                continue
+            if isinstance(value, StormXMLObject) and isinstance(other_value, StormXMLObject):
+                diffs += value.diff(other_value, prefix + pname + ".")
+            elif isDifferent(value, other_value):
+                diffs.append(prefix + pname)
+
+        for pname in other.getAttrs():
+            if not (pname in self.__dict__):
+                diffs.append(prefix + pname)
         return diffs
                         
+    ## freeze
+    #
+    # @return An immutable snapshot (a FrozenParameters object) of this object.
+    #
+    def freeze(self):
+        return FrozenParameters(self)
+
     ## get
     #
     # Get a property of this object.
@@ -412,7 +569,17 @@ class StormXMLObject(object):
         if hasattr(self, pname):
             if mark_used:
                 self.isUsed(pname)
-            return getattr(self, pname)
+            value = getattr(self, pname)
+
+            # Get our own copy of a shared sub-object before returning it.
+            if isinstance(value, StormXMLObject) and value._borrowers_:
+                value = value.lend(self, pname)
+
+            # The caller could change a list, so first give the objects that
+            # share this object their own copy.
+            elif self._borrowers_ and (isinstance(value, list) or isinstance(value, dict)):
+                self.unshare()
+            return value
         else:
             if default is not None:
                 return default
@@ -427,8 +594,48 @@ class StormXMLObject(object):
     # @return A list of attributes.
     #
     def getAttrs(self):
-        attrs = filter(lambda(x): x[0] != "_", sorted(dir(self)))
-        return filter(lambda(x): not callable(self.get(x, mark_used = False)), attrs)
+        attrs = filter(lambda(x): x[0] != "_", sorted(self.__dict__.keys()))
+        return filter(lambda(x): not callable(self.__dict__[x]), attrs)
+
+    ## getter
+    #
+    # Resolve the name of a property once and return a function that returns
+    # the current value of the property. This is much faster than get() for
+    # properties that are read often. Note that the property is only marked
+    # as used once, when the getter is created.
+    #
+    # @param pname A string containing the property name.
+    # @param default (Optional) The value to use if the property is not found.
+    #
+    # @return A function (without arguments) that returns the property if found, otherwise default.
+    #
+    def getter(self, pname, default = None):
+
+        # Check that the property exists (or that there is a default).
+        try:
+            self.get(pname, default)
+        except ParametersException:
+            if default is None:
+                raise
+
+        pnames = pname.split(".")
+        if (len(pnames) == 1):
+            values = self.__dict__
+            return lambda: values.get(pname, default)
+
+        # The sub-objects are looked up every time as they can be replaced.
+        path = pnames[:-1]
+        name = pnames[-1]
+        def getValue():
+            xml_object = self
+            for sub_name in path:
+                xml_object = xml_object.__dict__.get(sub_name)
+                if not isinstance(xml_object, StormXMLObject):
+                    if default is not None:
+                        return default
+                    raise ParametersException("Requested property " + pname + " not found and no default was specified.")
+            return xml_object.__dict__.get(name, default)
+        return getValue
 
     ## getSubXMLObjects
     #
@@ -503,6 +710,28 @@ class StormXMLObject(object):
         if pname in self._unused_:
             self._unused_[pname] = False
 
+    ## lend
+    #
+    # If this object is shared with parent (see copy()), then parent gets its
+    # own copy of this object. Otherwise parent is the owner of this object,
+    # and the objects that share it get their own copy, as the caller could
+    # change this object or one of its sub-objects.
+    #
+    # @param parent The StormXMLObject that is getting this object.
+    # @param pname The name of this object in parent.
+    #
+    # @return This object, or the copy of this object that now belongs to parent.
+    #
+    def lend(self, parent, pname):
+        for i, [parent_ref, name] in enumerate(self._borrowers_):
+            if (parent_ref() is parent) and (name == pname):
+                del self._borrowers_[i]
+                new_object = self.copy()
+                parent.__dict__[pname] = new_object
+                return new_object
+        self.unshare()
+        return self
+
     ## saveToFile
     #
     # Save the settings as XML in a file.
@@ -538,6 +767,8 @@ class StormXMLObject(object):
         if (len(pnames) > 1):
             self.get(pnames[0]).set(".".join(pnames[1:]), value)
         else:
+            if self._borrowers_:
+                self.unshare()
             setattr(self, pname, value)
 
     ## toXML
@@ -601,6 +832,19 @@ class StormXMLObject(object):
 
         return xml
 
+    ## unshare
+    #
+    # This is called before this object is changed. The objects that are
+    # sharing this object (see copy()) get their own (unchanged) copy of it.
+    #
+    def unshare(self):
+        borrowers = self._borrowers_
+        self._borrowers_ = []
+        for [parent_ref, name] in borrowers:
+            parent = parent_ref()
+            if parent is not None and (parent.__dict__.get(name) is self):
+                parent.__dict__[name] = self.copy()
+
     ## unused
     #
     # @return A list of the attributes in the instance that were never used.
@@ -635,11 +879,47 @@ if __name__ == "__main__":
                 print k,v
             print ""
 
+    # Check that diff() works with the numpy arrays in illumination.shutter_data.
+    if 1:
+        p1 = StormXMLObject([])
+        p1.set("shutter_data", [numpy.zeros(10), numpy.ones(10)])
+        p2 = p1.copy()
+        p2.set("shutter_data", [numpy.zeros(10), numpy.ones(10)])
+        assert (p2.diff(p1) == [])
+        p2.set("shutter_data", [numpy.zeros(10), numpy.zeros(10)])
+        assert (p2.diff(p1) == ["shutter_data"])
+        p2.set("shutter_data", [numpy.zeros(10)])
+        assert (p2.diff(p1) == ["shutter_data"])
+
+    # Check that a getter returns the default if a sub-object is missing.
+    if 1:
+        p1 = StormXMLObject([])
+        p1.set("x", StormXMLObject([]))
+        p1.set("x.y", 1)
+        getter = p1.getter("x.y", 2)
+        assert (getter() == 1)
+        del p1.x
+        assert (getter() == 2)
+        assert (p1.getter("z.y", 3)() == 3)
+
+    # Check that changing a sub-object of a sub-object does not change a copy.
     if 1:
-        p1 = halParameters(sys.argv[1]).get("camera1")
-        p2 = halParameters(sys.argv[2]).get("camera1")
+        p1 = StormXMLObject([])
+        p1.set("x", StormXMLObject([]))
+        p1.set("x.y", StormXMLObject([]))
+        p1.set("x.y.z", 1)
+        p2 = p1.copy()
+        p1.set("x.y.z", 2)
+        assert (p2.get("x.y.z") == 1)
+        p2.set("x.y.z", 3)
+        assert (p1.get("x.y.z") == 2)
+        assert (p2.diff(p1) == ["x.y.z"])
+
+    if (len(sys.argv) == 3):
+        p1 = halParameters(sys.argv[1])
+        p2 = halParameters(sys.argv[2])
         for diff in p2.diff(p1):
-            print diff, p1.get(diff), p2.get(diff)
+            print diff, p1.get(diff, "NA"), p2.get(diff, "NA")
 
 #        string = ElementTree.tostring(p2.toXML(), 'utf-8')
 #        reparsed = minidom.parseString(string)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Compares the time per access of StormXMLObject.get(), of the
+# getters returned by StormXMLObject.getter() and of a frozen
+# (FrozenParameters) snapshot.
+#
+# Run from the storm-control directory:
+#
+#   python sc_library/parameters_benchmark.py hal4000/xml/none_default.xml
+#
+
+import sys
+import time
+
+import sc_library.parameters as params
+
+## timeIt
+#
+# @param function The function to call.
+# @param repeats The number of times to call the function.
+#
+# @return The mean time per call in microseconds.
+#
+def timeIt(function, repeats):
+    start_time = time.time()
+    for i in xrange(repeats):
+        function()
+    return 1.0e6 * (time.time() - start_time)/float(repeats)
+
+
+if __name__ == "__main__":
+
+    if (len(sys.argv) < 2):
+        print "usage: <settings.xml> [property name 1] [property name 2] .."
+        exit()
+
+    repeats = 100000
+    parameters = params.parameters(sys.argv[1])
+    pnames = sys.argv[2:]
+    if (len(pnames) == 0):
+        pnames = ["film.want_big_endian", "parameters_file"]
+
+    frozen = parameters.freeze()
+    print "freeze: {0:.1f} us".format(timeIt(parameters.freeze, 100))
+    for pname in pnames:
+        getter = parameters.getter(pname)
+        frozen_getter = frozen.getter(pname)
+        print pname
+        print "  get:           {0:.3f} us".format(timeIt(lambda: parameters.get(pname), repeats))
+        print "  getter:        {0:.3f} us".format(timeIt(getter, repeats))
+        print "  frozen get:    {0:.3f} us".format(timeIt(lambda: frozen.get(pname), repeats))
+        print "  frozen getter: {0:.3f} us".format(timeIt(frozen_getter, repeats))
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2015 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
@@ -8,6 +8,11 @@
 # Jeffrey Moffitt
 # 3/8/14
 # jeffmoffitt@gmail.com
+#
+# More than one message can be sent without waiting for the replies.
+# The messages that have been sent but not answered are kept in
+# pending (by message ID) until the reply is received.
+#
 
 # 
 # Import
@@ -34,19 +39,23 @@ class TCPClient(tcpCommunications.TCPCommunications):
     # @param server_name A string name for the communication server.
     # @param address An address for the TCP/IP communication.
     # @param verbose A boolean controlling the verbosity of the class
+    # @param framed (Optional) True/False always send messages in the framed format.
     #
     def __init__(self,
                  parent = None,
                  port=9500,
                  server_name = "default",
                  address = QtNetwork.QHostAddress(QtNetwork.QHostAddress.LocalHost),
-                 verbose = False):
+                 verbose = False,
+                 framed = False):
         tcpCommunications.TCPCommunications.__init__(self,
                                                      parent = parent,
                                                      port = port,
                                                      server_name = server_name,
                                                      address = address,
-                                                     verbose = verbose)
+                                                     verbose = verbose,
+                                                     framed = framed)
+        self.pending = {}
         
         # Create instance of TCP socket
         self.socket = QtNetwork.QTcpSocket()
@@ -66,6 +75,7 @@ class TCPClient(tcpCommunications.TCPCommunications):
             print string
 
         # Attempt to connect to host.
+        self.resetConnection()
         self.socket.connectToHost(self.address, self.port)
 
         if not self.socket.waitForConnected(1000):
@@ -78,6 +88,52 @@ class TCPClient(tcpCommunications.TCPCommunications):
     def handleDisconnect(self):
         self.comLostConnection.emit()
 
+    ## isPending
+    #
+    # @param message_id A message ID.
+    #
+    # @return True/False a message with this ID has been sent and the reply has not been received.
+    #
+    def isPending(self, message_id):
+        return (message_id in self.pending)
+
+    ## messageDone
+    #
+    # Record the latency of the message if it is a reply to one of our messages.
+    #
+    # @param message A TCPMessage object.
+    #
+    def messageDone(self, message):
+        if message.getID() in self.pending:
+            [message_type, send_time] = self.pending.pop(message.getID())
+            self.latency.addLatency(message_type, time.time() - send_time)
+
+    ## numberPending
+    #
+    # @return The number of messages that are waiting for a reply.
+    #
+    def numberPending(self):
+        return len(self.pending)
+
+    ## resetConnection
+    #
+    # Also forget about any messages that were waiting for a reply.
+    #
+    def resetConnection(self):
+        tcpCommunications.TCPCommunications.resetConnection(self)
+        self.pending = {}
+
+    ## sendMessage
+    #
+    # Send a TCP message, this does not wait for the reply.
+    #
+    # @param message A TCPMessage object.
+    #
+    def sendMessage(self, message):
+        if self.isConnected():
+            self.pending[message.getID()] = [message.getType(), time.time()]
+        tcpCommunications.TCPCommunications.sendMessage(self, message)
+
     ## startCommunication
     #
     # Start communications with server
@@ -95,6 +151,7 @@ class TCPClient(tcpCommunications.TCPCommunications):
     def stopCommunication(self):
         if self.isConnected():
             self.socket.disconnectFromHost()
+        self.logLatency()
 
 
 ## StandAlone
@@ -10,10 +10,159 @@
 #
 # Hazen 05/14
 #
+# There are two message formats:
+#
+# 1. The original format, the message as JSON followed by a newline.
+#
+# 2. The framed format, frame_magic followed by the size of the JSON
+#    in bytes and the size of the binary payload in bytes (both
+#    little endian unsigned 32 bit integers), then the JSON and then
+#    the payload. This is used for messages that have a binary
+#    payload, for example an image.
+#
+# Both formats can be received at any time. Messages are sent in the
+# original format unless they have a payload or framed is True. framed
+# is set to True once the other side has sent us a framed message, so
+# programs that only know about the original format keep working.
+#
+# Clients can have several requests in flight at once. Replies are
+# matched to requests by the message ID, and may arrive in a different
+# order from the order in which the requests were sent. The time taken
+# by each request is recorded in per message type latency histograms.
+#
+
+import bisect
+import struct
 
 from PyQt4 import QtCore, QtNetwork
+
+import sc_library.hdebug as hdebug
 from sc_library.tcpMessage import TCPMessage
 
+frame_magic = "SCTF"
+frame_header = struct.Struct("<4sII")
+
+## decodeMessages
+#
+# Decodes all the complete messages in a buffer.
+#
+# @param buffer A string containing the data that has been received so far.
+#
+# @return [list of [TCPMessage, True/False framed], the unused part of the buffer]
+#
+def decodeMessages(buffer):
+    messages = []
+    while (len(buffer) > 0):
+
+        # Framed message.
+        if (buffer[:len(frame_magic)] == frame_magic[:len(buffer)]):
+            if (len(buffer) < frame_header.size):
+                break
+            [magic, json_size, payload_size] = frame_header.unpack(buffer[:frame_header.size])
+            end = frame_header.size + json_size + payload_size
+            if (len(buffer) < end):
+                break
+            message = TCPMessage.fromJSON(buffer[frame_header.size:frame_header.size + json_size])
+            if (payload_size > 0):
+                message.payload = buffer[frame_header.size + json_size:end]
+            messages.append([message, True])
+            buffer = buffer[end:]
+
+        # Newline terminated JSON message.
+        else:
+            index = buffer.find("\n")
+            if (index == -1):
+                break
+            if (len(buffer[:index].strip()) > 0):
+                messages.append([TCPMessage.fromJSON(buffer[:index]), False])
+            buffer = buffer[index+1:]
+
+    return [messages, buffer]
+
+## encodeMessage
+#
+# @param message A TCPMessage object.
+# @param framed True/False use the framed format even if the message does not have a payload.
+#
+# @return The message as a string that is ready to send.
+#
+def encodeMessage(message, framed):
+    json_string = message.toJSON()
+    if (not framed) and (not message.hasPayload()):
+        return json_string + "\n"
+    payload = message.getPayload()
+    if payload is None:
+        payload = ""
+    return frame_header.pack(frame_magic, len(json_string), len(payload)) + json_string + payload
+
+## LatencyHistograms
+#
+# Histograms of the message latency (in seconds) for each message type. The
+# bins are spaced logarithmically (1, 2, 5, 10, ..) from 0.1ms to 1000s.
+#
+class LatencyHistograms(object):
+
+    bins = [m * 10.0**e for e in range(-4, 3) for m in [1.0, 2.0, 5.0]] + [1000.0]
+
+    ## __init__
+    #
+    def __init__(self):
+        self.histograms = {}
+
+    ## __str__
+    #
+    # @return The histograms as a string, only the non-empty bins are included.
+    #
+    def __str__(self):
+        string = ""
+        for message_type in sorted(self.histograms):
+            [counts, total, max_latency] = self.histograms[message_type]
+            n = sum(counts)
+            string += "{0:s}: {1:d} messages, mean {2:.2f}ms, max {3:.2f}ms\n".format(message_type,
+                                                                                   n,
+                                                                                   1000.0 * total/n,
+                                                                                   1000.0 * max_latency)
+            for i in range(len(counts)):
+                if (counts[i] > 0):
+                    if (i == 0):
+                        low = 0.0
+                    else:
+                        low = 1000.0 * self.bins[i-1]
+                    if (i < len(self.bins)):
+                        high = "{0:g}ms".format(1000.0 * self.bins[i])
+                    else:
+                        high = ".."
+                    string += "  {0:g}ms - {1:s}: {2:d}\n".format(low, high, counts[i])
+        return string
+
+    ## addLatency
+    #
+    # @param message_type The message type.
+    # @param latency The latency in seconds.
+    #
+    def addLatency(self, message_type, latency):
+        if not message_type in self.histograms:
+            self.histograms[message_type] = [[0] * (len(self.bins) + 1), 0.0, 0.0]
+        histogram = self.histograms[message_type]
+        histogram[0][bisect.bisect_right(self.bins, latency)] += 1
+        histogram[1] += latency
+        histogram[2] = max(histogram[2], latency)
+
+    ## getHistograms
+    #
+    # @return A dictionary of [bin counts, total latency, maximum latency] keyed by message type.
+    #
+    def getHistograms(self):
+        return self.histograms
+
+    ## reset
+    #
+    # Clear all the histograms.
+    #
+    def reset(self):
+        self.histograms = {}
+
+
 ## TCPCommunications
 #
 # An abstract class used to define the basic process of exchanging TCP messages. Client and
@@ -31,18 +180,24 @@ class TCPCommunications(QtCore.QObject):
     # @param server_name A string name for the communication server.
     # @param address An address for the TCP/IP communication. Defaults to the local machine.
     # @param verbose A boolean controlling the verbosity of the class.
+    # @param framed (Optional) True/False always send messages in the framed format.
     #
     def __init__(self,
                  port=9500,
                  server_name = "default",
                  address = QtNetwork.QHostAddress(QtNetwork.QHostAddress.LocalHost),
                  parent = None,
-                 verbose = False):
+                 verbose = False,
+                 framed = False):
         QtCore.QObject.__init__(self)
         
         # Initialize internal attributes
         self.address = address
+        self.default_framed = framed
+        self.framed = framed
+        self.latency = LatencyHistograms()
         self.port = port 
+        self.read_buffer = ""
         self.server_name = server_name
         self.socket = None
         self.verbose = verbose
@@ -56,6 +211,13 @@ class TCPCommunications(QtCore.QObject):
             self.socket.close()
             if self.verbose: print "Closing TCP communications: " + self.server_name
             
+    ## getLatencyHistograms
+    #
+    # @return The LatencyHistograms object.
+    #
+    def getLatencyHistograms(self):
+        return self.latency
+
     ## handleBusy
     #
     # Handle a busy message. Reserved for future use.
@@ -65,22 +227,23 @@ class TCPCommunications(QtCore.QObject):
 
     ## handleReadyRead
     #
-    # Create TCP message class from JSON message and forward as appropriate
+    # Create TCP message classes from the received data and forward as appropriate.
+    # Partial messages are kept until the rest of the message arrives.
     #
     def handleReadyRead(self):
-        message_str = ""
-        while self.socket.canReadLine():
-            # Read data line
-            message_str += str(self.socket.readLine())
+        self.read_buffer += str(self.socket.readAll())
+        [messages, self.read_buffer] = decodeMessages(self.read_buffer)
 
-        # Create message.
-        message = TCPMessage.fromJSON(message_str)
-        if self.verbose: print "Received: \n" + str(message)
+        for [message, framed] in messages:
+            if framed:
+                self.framed = True
+            if self.verbose: print "Received: \n" + str(message)
 
-        if message.getType() == "Busy":
-            self.handleBusy()
-        else:
-            self.messageReceived.emit(message)
+            if message.getType() == "Busy":
+                self.handleBusy()
+            else:
+                self.messageReceived.emit(message)
+                self.messageDone(message)
     
     ## isConnected
     #
@@ -94,16 +257,42 @@ class TCPCommunications(QtCore.QObject):
         else:
             return False
 
+    ## logLatency
+    #
+    # Write the latency histograms to the log file (and print them if verbose).
+    #
+    def logLatency(self):
+        if (len(self.latency.getHistograms()) > 0):
+            hdebug.logText(self.server_name + " message latency:\n" + str(self.latency), to_console = self.verbose)
+
+    ## messageDone
+    #
+    # This is called after a received message has been relayed. Sub-classes
+    # can use this to keep track of the messages that they are waiting for.
+    #
+    # @param message A TCPMessage object.
+    #
+    def messageDone(self, message):
+        pass
+
+    ## resetConnection
+    #
+    # Clear the receive buffer and the message format at the start of a new connection.
+    #
+    def resetConnection(self):
+        self.framed = self.default_framed
+        self.read_buffer = ""
+
     ## sendMessage
     #
-    # Send TCP message as JSON string if the socket is connected.
+    # Send TCP message if the socket is connected.
     #
     # @param message A TCPMessage object.
     #
     def sendMessage(self, message):
         if self.isConnected():
             #message_str = pickle.dumps(message)
-            self.socket.write(message.toJSON() + "\n")
+            self.socket.write(encodeMessage(message, self.framed))
             self.socket.flush()
             if self.verbose: print "Sent: \n" + str(message)
         else:
@@ -13,6 +13,7 @@
 
 import copy
 import json
+import numpy
 
 
 ## TCPMessage
@@ -41,6 +42,8 @@ class TCPMessage(object):
         self.error_message = None
         self.message_data = copy.copy(message_data)
         self.message_type = message_type
+        self.payload = None
+        self.payload_info = None
         self.response = {}
         self.test_mode = test_mode
 
@@ -115,6 +118,23 @@ class TCPMessage(object):
     def getMessageData(self):
         return self.message_data
 
+    ## getPayload
+    #
+    # @return The binary payload of the message (a string), or None.
+    #
+    def getPayload(self):
+        return self.payload
+
+    ## getPayloadArray
+    #
+    # @return The binary payload of the message as a numpy array, or None.
+    #
+    def getPayloadArray(self):
+        if (self.payload is None) or (self.payload_info is None):
+            return None
+        array = numpy.frombuffer(self.payload, dtype = numpy.dtype(str(self.payload_info["dtype"])))
+        return array.reshape(self.payload_info["shape"])
+
     ## getResponse
     #
     # Access elements of the response message by name. If the element is not present, None is returned.
@@ -143,6 +163,13 @@ class TCPMessage(object):
     def hasError(self):
         return self.error
 
+    ## hasPayload
+    #
+    # @return True/False the message has a binary payload.
+    #
+    def hasPayload(self):
+        return (self.payload is not None)
+
     ## isTest
     #
     # Return the test status of the message. If the message is in test mode, then it will not be
@@ -164,6 +191,29 @@ class TCPMessage(object):
         self.error = error_boolean
         self.error_message = error_message
 
+    ## setPayload
+    #
+    # Set the binary payload of the message. The payload is not part of the
+    # JSON serialization, it is sent after it (see tcpCommunications.py).
+    #
+    # @param payload A string (or None to remove the payload).
+    #
+    def setPayload(self, payload):
+        self.payload = payload
+        self.payload_info = None
+
+    ## setPayloadArray
+    #
+    # Set the binary payload of the message to the contents of a numpy array.
+    #
+    # @param array A numpy array.
+    #
+    def setPayloadArray(self, array):
+        array = numpy.ascontiguousarray(array)
+        self.payload = array.tostring()
+        self.payload_info = {"dtype" : array.dtype.str,
+                             "shape" : list(array.shape)}
+
     ## setTestMode
     #
     # Set the test status of the message
@@ -175,12 +225,14 @@ class TCPMessage(object):
 
     ## toJSON
     #
-    # Serialize using JSON.
+    # Serialize using JSON. The binary payload (if any) is not included.
     #
     # @return A string containing the JSON serialization.
     #
     def toJSON(self):
-        return json.dumps(self.__dict__)
+        attributes = dict(self.__dict__)
+        del attributes["payload"]
+        return json.dumps(attributes)
 
     ## markAsComplete
     #
@@ -198,7 +250,10 @@ class TCPMessage(object):
     def __str__(self):
         string_rep = "\tMessage Type: " + str(self.message_type)
         for attribute in sorted(vars(self).keys()):
-            if not (attribute == "message_type"):
+            if (attribute == "payload"):
+                if self.payload is not None:
+                    string_rep += "\n\tpayload: " + str(len(self.payload)) + " bytes"
+            elif not (attribute == "message_type"):
                 string_rep += "\n\t" + attribute + ": " + str(getattr(self, attribute))
         return string_rep
 
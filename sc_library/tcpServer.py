@@ -33,20 +33,23 @@ class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunications):
     # @param server_name A string name for the communication server.
     # @param address An address for the TCP/IP communication.
     # @param verbose A boolean controlling the verbosity of the class
+    # @param framed (Optional) True/False always send messages in the framed format.
     #
     def __init__(self,
                  port = 9500,
                  server_name = "default",
                  address = QtNetwork.QHostAddress(QtNetwork.QHostAddress.LocalHost),
                  parent = None,
-                 verbose = False):
+                 verbose = False,
+                 framed = False):
         QtNetwork.QTcpServer.__init__(self, parent)
         tcpCommunications.TCPCommunications.__init__(self,
                                                      parent=parent,
                                                      port=port,
                                                      server_name=server_name,
                                                      address=address,
-                                                     verbose=verbose)
+                                                     verbose=verbose,
+                                                     framed=framed)
 
         # Connect new connection signal
         self.newConnection.connect(self.handleClientConnection)
@@ -91,6 +94,7 @@ class TCPServer(QtNetwork.QTcpServer, tcpCommunications.TCPCommunications):
 
         if not self.isConnected():
             self.socket = socket
+            self.resetConnection()
             self.socket.readyRead.connect(self.handleReadyRead)
             self.socket.disconnected.connect(self.handleClientDisconnect)
             self.comGotConnection.emit()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+## @file
+#
+# Analyzes a trace file (see htrace.py). This prints a latency
+# histogram for each of the functions in the trace and (optionally)
+# saves the trace in the Chrome trace event (JSON) format, which can
+# be viewed with chrome://tracing.
+#
+# python trace_analysis.py <trace file> [json file]
+#
+
+import json
+import numpy
+import struct
+import sys
+
+import htrace
+
+bins = [m * 10.0**e for e in range(-6, 3) for m in [1.0, 2.0, 5.0]] + [1000.0]
+
+## readTraceFile
+#
+# @param filename The name of the trace file.
+#
+# @return [dictionary of function names, dictionary of thread names, spans (a numpy array with dtype htrace.span_dtype)].
+#
+def readTraceFile(filename):
+    functions = {}
+    threads = {}
+    spans = []
+    with open(filename, "rb") as fp:
+        if (fp.read(len(htrace.magic)) != htrace.magic):
+            raise Exception(filename + " is not a trace file.")
+
+        header = fp.read(8)
+        while (len(header) == 8):
+            [n_names, n_spans] = struct.unpack("<II", header)
+            for i in range(n_names):
+                [kind, index, length] = struct.unpack("<BIH", fp.read(7))
+                name = fp.read(length)
+                if (kind == 0):
+                    functions[index] = name
+                else:
+                    threads[index] = name
+
+            # Ignore a partially written last block.
+            data = fp.read(n_spans * htrace.span_dtype.itemsize)
+            n_spans = len(data)/htrace.span_dtype.itemsize
+            spans.append(numpy.frombuffer(data[:n_spans * htrace.span_dtype.itemsize], dtype = htrace.span_dtype))
+            header = fp.read(8)
+
+    if (len(spans) > 0):
+        spans = numpy.concatenate(spans)
+    else:
+        spans = numpy.zeros(0, dtype = htrace.span_dtype)
+    return [functions, threads, spans]
+
+## histogramText
+#
+# @param functions A dictionary of function names.
+# @param spans A numpy array with dtype htrace.span_dtype.
+#
+# @return The latency histograms of the functions as a string, the functions are sorted by total time.
+#
+def histogramText(functions, spans):
+    durations = spans["end"] - spans["start"]
+    ids = numpy.unique(spans["function"])
+    totals = map(lambda(x): numpy.sum(durations[(spans["function"] == x)]), ids)
+
+    string = ""
+    for i in numpy.argsort(totals)[::-1]:
+        function_durations = durations[(spans["function"] == ids[i])]
+        string += "{0:s}: {1:d} calls, total {2:.2f}ms, mean {3:.3f}ms, max {4:.3f}ms\n".format(functions.get(ids[i], str(ids[i])),
+                                                                                             function_durations.size,
+                                                                                             1000.0 * totals[i],
+                                                                                             1000.0 * numpy.mean(function_durations),
+                                                                                             1000.0 * numpy.max(function_durations))
+        counts = numpy.bincount(numpy.searchsorted(bins, function_durations, side = "right"), minlength = len(bins) + 1)
+        for j in range(counts.size):
+            if (counts[j] > 0):
+                if (j == 0):
+                    low = 0.0
+                else:
+                    low = 1000.0 * bins[j-1]
+                if (j < len(bins)):
+                    high = "{0:g}ms".format(1000.0 * bins[j])
+                else:
+                    high = ".."
+                string += "  {0:g}ms - {1:s}: {2:d}\n".format(low, high, counts[j])
+    return string
+
+## writeChromeTrace
+#
+# Saves the spans in the Chrome trace event format.
+#
+# @param filename The name of the JSON file.
+# @param functions A dictionary of function names.
+# @param threads A dictionary of thread names.
+# @param spans A numpy array with dtype htrace.span_dtype.
+#
+def writeChromeTrace(filename, functions, threads, spans):
+    events = []
+    for index in threads:
+        events.append({"name" : "thread_name",
+                       "ph" : "M",
+                       "pid" : 0,
+                       "tid" : index,
+                       "args" : {"name" : threads[index]}})
+
+    t0 = 0.0
+    if (spans.size > 0):
+        t0 = numpy.min(spans["start"])
+    for span in spans:
+        events.append({"name" : functions.get(int(span["function"]), str(span["function"])),
+                       "ph" : "X",
+                       "pid" : 0,
+                       "tid" : int(span["thread"]),
+                       "ts" : 1.0e6 * (span["start"] - t0),
+                       "dur" : 1.0e6 * (span["end"] - span["start"])})
+
+    with open(filename, "w") as fp:
+        json.dump({"traceEvents" : events}, fp)
+
+
+if __name__ == "__main__":
+
+    if (len(sys.argv) < 2):
+        print "usage: <trace file> [json file]"
+        exit()
+
+    [functions, threads, spans] = readTraceFile(sys.argv[1])
+    print spans.size, "calls in", len(threads), "threads"
+    print histogramText(functions, spans)
+
+    if (len(sys.argv) > 2):
+        writeChromeTrace(sys.argv[2], functions, threads, spans)
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2015 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
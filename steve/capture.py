@@ -6,12 +6,18 @@
 # a picture & converts the captured image into a
 # QPixmap.
 #
+# In the pipelined mode the next picture can be started as soon as
+# HAL has taken the current picture, the current picture is read from
+# the disk by a worker thread.
+#
 # Hazen 03/14
 #
 
 import math
 import numpy
 import os
+import Queue
+import threading
 import time
 
 from PyQt4 import QtCore, QtGui
@@ -93,6 +99,33 @@ def objectiveMessage(is_other = False):
     return tcpMessage.TCPMessage(message_type = "Get Objective",
                                  message_data = {"is_other":is_other})
 
+## readFrame
+#
+# Reads a frame from a movie. HAL only replies to the take movie message
+# when the movie is complete, but the files are not always complete (or
+# visible) yet when we get the reply. So this polls until the movie can
+# be read, the memory mapped readers raise an IOError if the file is too
+# small to contain all of the frames.
+#
+# @param filename The name of the movie.
+# @param frame_num (Optional) The frame to read, defaults to 0.
+# @param timeout (Optional) How long to wait for the file to be complete in seconds, defaults to 2.0.
+#
+# @return [the datareader object, the frame (a numpy array)].
+#
+def readFrame(filename, frame_num = 0, timeout = 2.0):
+    start_time = time.time()
+    while True:
+        try:
+            movie = datareader.reader(filename, use_mmap = True)
+            frame = movie.loadAFrame(frame_num, cast_to_int16 = True)
+            movie.closeFilePtr()
+            return [movie, frame]
+        except Exception as e:
+            if ((time.time() - start_time) > timeout):
+                raise IOError(str(e))
+        time.sleep(0.005)
+
 
 ## Image
 #
@@ -131,6 +164,46 @@ class Image():
         return hdebug.objectToString(self, "capture.Image", ["height", "width", "x_um", "y_um"])
 
 
+## ImageReader
+#
+# Reads the pictures from the disk in a separate thread.
+#
+class ImageReader(QtCore.QObject):
+    imageRead = QtCore.pyqtSignal(object)
+
+    ## __init__
+    #
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, parent = None):
+        QtCore.QObject.__init__(self, parent)
+        self.filenames = Queue.Queue()
+        self.reader_thread = threading.Thread(target = self.run)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+    ## addFile
+    #
+    # @param filename The name of the movie to read the (first) frame of.
+    #
+    def addFile(self, filename):
+        self.filenames.put(filename)
+
+    ## run
+    #
+    # Reads the movies in the order that they were added, emits imageRead
+    # with [movie, frame] or [None, None] if the movie could not be read.
+    #
+    def run(self):
+        while True:
+            filename = self.filenames.get()
+            try:
+                self.imageRead.emit(readFrame(filename))
+            except IOError as e:
+                print "Failed to load:" + filename + " " + str(e)
+                self.imageRead.emit([None, None])
+
+
 ## Capture
 #
 # Handles capturing images from HAL. Instructions to HAL about how
@@ -147,6 +220,7 @@ class Capture(QtCore.QObject):
     captureComplete = QtCore.pyqtSignal(object)
     changeObjective = QtCore.pyqtSignal(object)
     disconnected = QtCore.pyqtSignal()
+    exposureComplete = QtCore.pyqtSignal()
     getPositionComplete = QtCore.pyqtSignal(object)
     newObjectiveData = QtCore.pyqtSignal(object)
     otherComplete = QtCore.pyqtSignal()
@@ -158,6 +232,7 @@ class Capture(QtCore.QObject):
     @hdebug.debug
     def __init__(self, parameters):
         QtCore.QObject.__init__(self)
+        self.capture_number = 0
         self.curr_objective = None
         self.curr_x = 0.0
         self.curr_y = 0.0
@@ -166,8 +241,13 @@ class Capture(QtCore.QObject):
         self.got_settings = False
         self.filename = parameters.image_filename
         self.messages = []
+        self.pending_reads = 0
+        self.pipelined = parameters.get("pipelined_capture", False)
         self.waiting_for_response = False
 
+        self.image_reader = ImageReader(self)
+        self.image_reader.imageRead.connect(self.handleImageRead)
+
         self.tcp_client = tcpClient.TCPClient(parent = self,
                                               port = 9000,
                                               server_name = "hal",
@@ -196,6 +276,10 @@ class Capture(QtCore.QObject):
     # Called to take a image at stagex, stagey. This tells HAL to move,
     # then when HAL returns that the move is complete an image is taken.
     #
+    # In the pipelined mode the pictures alternate between two file names,
+    # so a picture can be taken while the previous picture is being read.
+    # This should not be called if two pictures are still being read.
+    #
     # @param stagex The x position to take the image at.
     # @param stagey The y position to take the image at.
     #
@@ -203,9 +287,14 @@ class Capture(QtCore.QObject):
     def captureStart(self, stagex, stagey):
 
         print stagex, stagey
-        
-        if os.path.exists(self.fullname()):
-            os.remove(self.fullname())
+
+        filename = self.filename
+        if self.pipelined:
+            filename += "_" + str(self.capture_number % 2)
+            self.capture_number += 1
+
+        if os.path.exists(self.directory + filename + ".dax"):
+            os.remove(self.directory + filename + ".dax")
         
         if not self.tcp_client.isConnected():
             hdebug.logText("captureStart: not connected to HAL.")
@@ -215,7 +304,7 @@ class Capture(QtCore.QObject):
             self.messages.append(mosaicSettingsMessage())                                 
         self.messages.append(objectiveMessage())
         self.messages.append(moveStageMessage(stagex, stagey))
-        self.messages.append(movieMessage(self.filename))
+        self.messages.append(movieMessage(filename))
         self.sendFirstMessage()
 
     ## commConnect
@@ -246,6 +335,13 @@ class Capture(QtCore.QObject):
     def fullname(self):
         return self.directory + self.filename + ".dax"
 
+    ## getNumberPendingReads
+    #
+    # @return The number of pictures that have been taken but not read yet.
+    #
+    def getNumberPendingReads(self):
+        return self.pending_reads
+
     ## getObjective
     #
     # Called to query HAL about the current objective.
@@ -324,6 +420,17 @@ class Capture(QtCore.QObject):
         self.messages = []
         self.disconnected.emit()
 
+    ## handleImageRead
+    #
+    # Handles the imageRead signal from the ImageReader.
+    #
+    # @param data [the datareader object, the frame (a numpy array)].
+    #
+    @hdebug.debug
+    def handleImageRead(self, data):
+        self.pending_reads -= 1
+        self.newImage(data[0], data[1])
+
     ## handleMessageReceived
     #
     # Handles the messageReceived signal from the TCPClient.
@@ -366,10 +473,17 @@ class Capture(QtCore.QObject):
             self.getPositionComplete.emit(a_point)
 
         #
-        # self.loadImage() will emit the captureComplete signal.
+        # self.loadImage() (or the image reader in the pipelined mode) will
+        # emit the captureComplete signal.
         #
         if (message.getType() == "Take Movie"):
-            self.loadImage(self.directory + message.getData("name") + ".dax")
+            if self.pipelined:
+                self.pending_reads += 1
+                self.image_reader.addFile(self.directory + message.getData("name") + ".dax")
+                self.exposureComplete.emit()
+            else:
+                self.exposureComplete.emit()
+                self.loadImage(self.directory + message.getData("name") + ".dax")
 
         if (len(self.messages) > 0):
             self.tcp_client.sendMessage(self.messages.pop(0))
@@ -382,27 +496,27 @@ class Capture(QtCore.QObject):
     # load the image. It is also called directly by Steve
     # to load images chosen by the user.
     #
+    # @param filename The name of the movie.
+    # @param frame_num (Optional) The frame to load, defaults to 0.
+    #
     @hdebug.debug
     def loadImage(self, filename, frame_num = 0):
-        success = False
-
-        # Deals with a file system race condition?
-        # Or is it a acquisition software problem?
-        time.sleep(0.05)
-        tries = 0
-        while (not success) and (tries < 4):
-            try:
-                movie = datareader.reader(filename)
-                frame = movie.loadAFrame(frame_num)
-                movie.closeFilePtr()
-                success = True
-
-            except IOError:
-                print "Failed to load:" + filename + " frame " + str(frame_num)
-                frame = None
-                time.sleep(0.05)
-            tries += 1
+        try:
+            [movie, frame] = readFrame(filename, frame_num)
+        except IOError as e:
+            print "Failed to load:" + filename + " frame " + str(frame_num) + " " + str(e)
+            [movie, frame] = [None, None]
+        self.newImage(movie, frame)
 
+    ## newImage
+    #
+    # Creates a Image object from a frame and emits the captureComplete signal.
+    #
+    # @param movie The datareader object of the movie, None if the movie could not be read.
+    # @param frame The frame (a numpy array), None if the movie could not be read.
+    #
+    @hdebug.debug
+    def newImage(self, movie, frame):
         if type(frame) == type(numpy.array([])):
 
             #
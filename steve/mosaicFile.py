@@ -0,0 +1,441 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Reading and writing of single file mosaics (.smc files).
+#
+# The file starts with a header, the magic string followed by the
+# version and the offset of the index chunk ("<IQ"). This is followed
+# by chunks, each chunk starts with the kind ("TILE" or "INDX"), the
+# size of the (JSON) meta data and the size of the data ("<4sIQ").
+#
+# A TILE chunk contains the image data of a viewImageItem, the meta
+# data is the rest of the viewImageItem state and the shape, type and
+# compression of the data. The meta data of the INDX chunk is the list
+# of the tiles (their meta data and offset) and the other elements of
+# the mosaic (the position and section lines of a .msc file).
+#
+# Writing the index for every tile would take time proportional to the
+# number of tiles, so new tiles are added after the index and the index
+# is only written again by writeIndex(), updateIndex() or when the file
+# is closed. The new index is written at the end of the file (or over
+# the old index if that is still the last chunk) before the header is
+# changed to point at it, so the old index stays valid until then. The
+# tiles that were added after the last index are found by reading the
+# chunks that follow it.
+#
+# python mosaicFile.py <mosaic.msc> <mosaic.smc> converts a mosaic in
+# the original format (.msc file and .stv files) to this format.
+#
+
+import json
+import numpy
+import os
+import pickle
+import struct
+import sys
+import threading
+import zlib
+
+magic = "SCMOSAIC"
+version = 1
+
+chunk_format = "<4sIQ"
+chunk_size = struct.calcsize(chunk_format)
+header_format = "<IQ"
+header_size = len(magic) + struct.calcsize(header_format)
+
+# The tile meta data that is not part of the viewImageItem state.
+tile_fields = ["compression", "data_size", "dtype", "offset", "shape"]
+
+
+## MosaicFileException
+#
+# Mosaic file exception.
+#
+class MosaicFileException(Exception):
+
+    ## __init__
+    #
+    # @param message The exception message.
+    #
+    def __init__(self, message):
+        Exception.__init__(self, message)
+
+
+## MosaicFile
+#
+# A single file mosaic. The tile data is only read when it is needed.
+#
+class MosaicFile(object):
+
+    ## __init__
+    #
+    # @param filename The name of the mosaic file.
+    # @param create (Optional) True/False create a new (empty) mosaic file, defaults to False.
+    # @param compress (Optional) True/False compress the data of new tiles, defaults to True.
+    #
+    def __init__(self, filename, create = False, compress = True):
+        self.compress = compress
+        self.elements = []
+        self.end = header_size
+        self.filename = filename
+        self.index_changed = False
+        self.index_end = header_size
+        self.index_offset = header_size
+        self.lock = threading.Lock()
+        self.read_only = False
+        self.tiles = []
+
+        if create:
+            self.fp = open(filename, "w+b")
+            self.fp.write(magic + struct.pack(header_format, version, 0))
+            self.writeIndex()
+        else:
+            try:
+                self.fp = open(filename, "r+b")
+            except IOError:
+                self.fp = open(filename, "rb")
+                self.read_only = True
+            self.readIndex()
+
+    ## addTile
+    #
+    # Adds a tile to the end of the file (after the index). This does not
+    # write the index.
+    #
+    # @param state The state of a viewImageItem (from getState()).
+    #
+    # @return The index of the new tile.
+    #
+    def addTile(self, state):
+        data = numpy.ascontiguousarray(state["data"])
+        tile = {}
+        for key in state:
+            if (key != "data"):
+                tile[key] = state[key]
+        tile["dtype"] = data.dtype.str
+        tile["shape"] = list(data.shape)
+
+        data = data.tostring()
+        if self.compress:
+            tile["compression"] = "zlib"
+            data = zlib.compress(data, 1)
+        else:
+            tile["compression"] = "none"
+        tile["data_size"] = len(data)
+
+        with self.lock:
+            tile["offset"] = self.end
+            self.end = self.writeChunk(self.end, "TILE", tile, data)
+            self.fp.flush()
+            self.tiles.append(tile)
+            self.index_changed = True
+        return len(self.tiles) - 1
+
+    ## close
+    #
+    # Writes the index (if it has changed) and closes the file.
+    #
+    def close(self):
+        self.updateIndex()
+        with self.lock:
+            self.fp.close()
+
+    ## getElements
+    #
+    # @return A list of the (text) elements of the mosaic, e.g. "position,x,y".
+    #
+    def getElements(self):
+        return self.elements
+
+    ## getNumberTiles
+    #
+    # @return The number of tiles in the mosaic.
+    #
+    def getNumberTiles(self):
+        return len(self.tiles)
+
+    ## getTileData
+    #
+    # Reads the data of a tile from the file. This can be called from any thread.
+    #
+    # @param index The index of the tile.
+    #
+    # @return The tile data (a numpy array).
+    #
+    def getTileData(self, index):
+        tile = self.tiles[index]
+        with self.lock:
+            self.fp.seek(tile["offset"])
+            [kind, meta_size, data_size] = struct.unpack(chunk_format, self.fp.read(chunk_size))
+            self.fp.seek(meta_size, 1)
+            data = self.fp.read(data_size)
+        if (tile["compression"] == "zlib"):
+            data = zlib.decompress(data)
+        return numpy.fromstring(data, dtype = numpy.dtype(str(tile["dtype"]))).reshape(tile["shape"])
+
+    ## getTileShape
+    #
+    # @param index The index of the tile.
+    #
+    # @return The shape of the tile data.
+    #
+    def getTileShape(self, index):
+        return tuple(self.tiles[index]["shape"])
+
+    ## getTileState
+    #
+    # @param index The index of the tile.
+    #
+    # @return The state of the viewImageItem of the tile, without the data.
+    #
+    def getTileState(self, index):
+        state = {}
+        for key in self.tiles[index]:
+            if not (key in tile_fields):
+                state[str(key)] = self.tiles[index][key]
+        return state
+
+    ## readChunk
+    #
+    # @param offset The offset of the chunk in the file.
+    #
+    # @return [kind, meta data, offset of the data, offset of the next chunk] or None if there is no (complete) chunk at offset.
+    #
+    def readChunk(self, offset):
+        self.fp.seek(offset)
+        header = self.fp.read(chunk_size)
+        if (len(header) != chunk_size):
+            return None
+        [kind, meta_size, data_size] = struct.unpack(chunk_format, header)
+        try:
+            meta = json.loads(self.fp.read(meta_size))
+        except ValueError:
+            return None
+        data_offset = offset + chunk_size + meta_size
+        if (data_offset + data_size > os.fstat(self.fp.fileno()).st_size):
+            return None
+        return [kind, meta, data_offset, data_offset + data_size]
+
+    ## readIndex
+    #
+    # Reads the index chunk, if the index is not valid the tiles are
+    # found by scanning all the chunks in the file.
+    #
+    def readIndex(self):
+        header = self.fp.read(header_size)
+        if (len(header) != header_size) or (header[:len(magic)] != magic):
+            raise MosaicFileException(self.filename + " is not a mosaic file.")
+        [file_version, index_offset] = struct.unpack(header_format, header[len(magic):])
+        if (file_version != version):
+            raise MosaicFileException("Unknown mosaic file version " + str(file_version))
+
+        chunk = self.readChunk(index_offset)
+        if chunk is not None and (chunk[0] == "INDX"):
+            self.elements = chunk[1]["elements"]
+            self.index_offset = index_offset
+            self.index_end = chunk[3]
+            self.tiles = chunk[1]["tiles"]
+
+            # Find the tiles that were added after the index was written.
+            offset = self.index_end
+            chunk = self.readChunk(offset)
+            while chunk is not None:
+                if (chunk[0] == "TILE"):
+                    chunk[1]["offset"] = offset
+                    self.tiles.append(chunk[1])
+                    self.index_changed = True
+                offset = chunk[3]
+                chunk = self.readChunk(offset)
+            self.end = offset
+        else:
+            self.scanChunks()
+
+    ## removeLastTile
+    #
+    # Removes the last tile from the mosaic.
+    #
+    def removeLastTile(self):
+        if (len(self.tiles) > 0):
+            with self.lock:
+                self.end = self.tiles.pop()["offset"]
+
+                # The index is after the tile, so it is written where the tile was.
+                if (self.index_offset > self.end):
+                    self.index_offset = self.end
+                    self.index_end = self.end
+            self.writeIndex()
+
+    ## scanChunks
+    #
+    # Recovers the tiles (and the elements if possible) by reading all the chunks.
+    #
+    def scanChunks(self):
+        self.tiles = []
+        offset = header_size
+        chunk = self.readChunk(offset)
+        while chunk is not None:
+            [kind, meta, data_offset, next_offset] = chunk
+            if (kind == "TILE"):
+                meta["offset"] = offset
+                self.tiles.append(meta)
+            elif (kind == "INDX"):
+                self.elements = meta["elements"]
+            offset = next_offset
+            chunk = self.readChunk(offset)
+        self.end = offset
+        self.index_changed = True
+        self.index_end = None
+
+    ## setElements
+    #
+    # @param elements A list of the (text) elements of the mosaic, e.g. "position,x,y".
+    #
+    def setElements(self, elements):
+        self.elements = elements
+        self.writeIndex()
+
+    ## updateIndex
+    #
+    # Writes the index if tiles were added since it was last written.
+    #
+    def updateIndex(self):
+        if self.index_changed and not self.read_only:
+            self.writeIndex()
+
+    ## write
+    #
+    # This is so that the positions and the sections can save themselves
+    # into the mosaic file as they would into a .msc file.
+    #
+    # @param text One or more lines of text.
+    #
+    def write(self, text):
+        self.elements += text.splitlines()
+
+    ## writeChunk
+    #
+    # @param offset The offset of the chunk in the file.
+    # @param kind The kind of the chunk, "TILE" or "INDX".
+    # @param meta The chunk meta data, this is saved as JSON.
+    # @param data The chunk data (a string).
+    #
+    # @return The offset of the next chunk.
+    #
+    def writeChunk(self, offset, kind, meta, data):
+        meta = json.dumps(meta, default = jsonDefault)
+        self.fp.seek(offset)
+        self.fp.write(struct.pack(chunk_format, kind, len(meta), len(data)))
+        self.fp.write(meta)
+        self.fp.write(data)
+        return offset + chunk_size + len(meta) + len(data)
+
+    ## writeIndex
+    #
+    # Writes the index, then points the header at the new index. The old
+    # index is only overwritten if it is the last chunk, otherwise the new
+    # index is written at the end of the file.
+    #
+    def writeIndex(self):
+        with self.lock:
+            offset = self.end
+            if (self.index_end == self.end):
+                offset = self.index_offset
+            end = self.writeChunk(offset, "INDX", {"elements" : self.elements, "tiles" : self.tiles}, "")
+            self.fp.truncate(end)
+            self.fp.flush()
+            self.fp.seek(len(magic))
+            self.fp.write(struct.pack(header_format, version, offset))
+            self.fp.flush()
+            self.end = end
+            self.index_changed = False
+            self.index_end = end
+            self.index_offset = offset
+
+
+## convertMosaic
+#
+# Converts a mosaic in the original format (a .msc file and a .stv file
+# for each image) to a single file mosaic.
+#
+# @param msc_filename The name of the .msc file.
+# @param smc_filename The name of the single file mosaic.
+# @param compress (Optional) True/False compress the tile data, defaults to True.
+#
+# @return The number of tiles in the mosaic.
+#
+def convertMosaic(msc_filename, smc_filename, compress = True):
+    directory = os.path.dirname(msc_filename)
+    mosaic_file = MosaicFile(smc_filename, create = True, compress = compress)
+    with open(msc_filename, "r") as fp:
+        for line in fp:
+            line = line.rstrip()
+            if not line:
+                continue
+            data = line.split(",")
+            if (data[0] == "image"):
+                with open(os.path.join(directory, data[1])) as stv_fp:
+                    mosaic_file.addTile(pickle.load(stv_fp))
+            else:
+                mosaic_file.elements.append(line)
+    mosaic_file.writeIndex()
+    mosaic_file.close()
+    return len(mosaic_file.tiles)
+
+## isMosaicFile
+#
+# @param filename The name of a file.
+#
+# @return True/False the file is a single file mosaic.
+#
+def isMosaicFile(filename):
+    with open(filename, "rb") as fp:
+        return (fp.read(len(magic)) == magic)
+
+## jsonDefault
+#
+# Converts the values that the json module does not know about.
+#
+# @param value A value from the viewImageItem state, e.g. a numpy.float64.
+#
+# @return The value as a Python type.
+#
+def jsonDefault(value):
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return str(value)
+
+
+if __name__ == "__main__":
+
+    if (len(sys.argv) != 3):
+        print "usage: <mosaic.msc> <mosaic.smc>"
+        exit()
+
+    print "converted", convertMosaic(sys.argv[1], sys.argv[2]), "tiles"
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2015 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
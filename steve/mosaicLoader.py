@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+## @file
+#
+# Loads the tiles of a mosaic in the background.
+#
+# The tiles are loaded (and their image pyramids created) by a pool
+# of worker threads, in order of priority (usually the distance from
+# the center of the view). The loaded tiles are passed to the GUI
+# thread a few at a time by a timer, so the user can navigate the
+# mosaic while the rest of it is loading.
+#
+
+import heapq
+import Queue
+import threading
+import time
+
+from PyQt4 import QtCore
+
+
+## MosaicLoader
+#
+# Loads tiles with a pool of worker threads.
+#
+class MosaicLoader(QtCore.QObject):
+    loadingDone = QtCore.pyqtSignal(object)
+    tileLoaded = QtCore.pyqtSignal(object, int, object)
+
+    ## __init__
+    #
+    # @param tasks A list of functions (without arguments) that load a tile.
+    # @param priorities A list of the priorities of the tasks, lower values are loaded first.
+    # @param source (Optional) The file the tiles are loaded from, defaults to None.
+    # @param n_workers (Optional) The number of worker threads, defaults to 4.
+    # @param parent (Optional) The PyQt parent of this object.
+    #
+    def __init__(self, tasks, priorities, source = None, n_workers = 4, parent = None):
+        QtCore.QObject.__init__(self, parent)
+
+        self.cancelled = False
+        self.heap = map(lambda x: [priorities[x], x], range(len(tasks)))
+        self.lock = threading.Lock()
+        self.n_done = 0
+        self.n_loaded = 0
+        self.results = Queue.Queue()
+        self.source = source
+        self.tasks = tasks
+
+        heapq.heapify(self.heap)
+
+        self.workers = []
+        for i in range(max(1, n_workers)):
+            worker = threading.Thread(target = self.work)
+            worker.daemon = True
+            self.workers.append(worker)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(50)
+        self.timer.timeout.connect(self.handleTimer)
+
+    ## cancel
+    #
+    # Stops loading, the tiles that have not been passed to the GUI thread yet are discarded.
+    #
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            self.heap = []
+
+    ## getNumberTiles
+    #
+    # @return The number of tiles to load.
+    #
+    def getNumberTiles(self):
+        return len(self.tasks)
+
+    ## handleTimer
+    #
+    # Emits tileLoaded for the tiles that the workers have loaded, for at most
+    # 20ms so that the GUI stays responsive. Emits loadingDone when all the
+    # tiles have been loaded, or if loading was cancelled.
+    #
+    def handleTimer(self):
+        start_time = time.time()
+        while not self.cancelled and ((time.time() - start_time) < 0.02):
+            try:
+                [index, tile] = self.results.get_nowait()
+            except Queue.Empty:
+                break
+            self.n_done += 1
+            if tile is not None:
+                self.n_loaded += 1
+                self.tileLoaded.emit(self, index, tile)
+
+        if self.cancelled or (self.n_done == len(self.tasks)):
+            self.timer.stop()
+            self.loadingDone.emit(self)
+
+    ## isComplete
+    #
+    # @return True/False all of the tiles were loaded.
+    #
+    def isComplete(self):
+        return (self.n_loaded == len(self.tasks))
+
+    ## start
+    #
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.timer.start()
+
+    ## work
+    #
+    # Loads tiles, highest priority first, until there are no more tiles to load.
+    #
+    def work(self):
+        while True:
+            with self.lock:
+                if (len(self.heap) == 0):
+                    return
+                index = heapq.heappop(self.heap)[1]
+            try:
+                tile = self.tasks[index]()
+            except Exception as e:
+                print "Failed to load tile", index, str(e)
+                tile = None
+            self.results.put([index, tile])
+
+
+#
+# The MIT License
+#
+# Copyright (c) 2015 Zhuang Lab, Harvard University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
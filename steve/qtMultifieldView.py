@@ -5,15 +5,193 @@
 # Class for rendering multiple images in taken at different magnifications. This is used
 # by the steve software and others for image display.
 #
+# Each image is stored as a pyramid of levels, each level is half the
+# resolution of the previous level. When an image is drawn the level
+# that matches the current scale is used, and the pixmaps for the levels
+# are kept in a LRU cache with a limited size, so large mosaics only
+# need pixmaps for the images (and at the resolution) that are visible.
+#
 # Hazen 07/13
 #
 
+import collections
+import functools
+import itertools
+import math
 import pickle
 import numpy
 import os
 
 from PyQt4 import QtCore, QtGui
 
+import mosaicFile
+import mosaicLoader
+
+# The smallest level (in pixels) in the image pyramid.
+min_level_size = 32
+
+# The grayscale color table of the 8 bit images.
+gray_table = map(lambda x: QtGui.qRgb(x, x, x), range(256))
+
+# The look up tables for the current (and recent) contrast settings.
+luts = collections.OrderedDict()
+max_luts = 8
+
+
+## PixmapCache
+#
+# A LRU cache of the pixmaps of the levels of the images. Each pixmap
+# is stored with the contrast that it was created with, a pixmap with
+# a different contrast is dirty and is replaced when it is next drawn.
+#
+class PixmapCache(object):
+
+    ## __init__
+    #
+    # @param budget_mb (Optional) The maximum size of the cached pixmaps in MB, defaults to 512.
+    #
+    def __init__(self, budget_mb = 512):
+        self.budget = 0
+        self.pixmaps = collections.OrderedDict()
+        self.size = 0
+        self.setBudget(budget_mb)
+
+    ## add
+    #
+    # Adds a pixmap to the cache, removing the least recently used pixmaps if the cache is too big.
+    #
+    # @param key The key for the pixmap, [image key, level].
+    # @param pixmap A QtGui.QPixmap.
+    # @param contrast (Optional) The contrast of the pixmap, [minimum, maximum].
+    #
+    def add(self, key, pixmap, contrast = None):
+        self.remove(key)
+        nbytes = pixmap.width() * pixmap.height() * pixmap.depth() / 8
+        self.pixmaps[key] = [pixmap, nbytes, contrast]
+        self.size += nbytes
+        self.evict()
+
+    ## evict
+    #
+    # Removes the least recently used pixmaps until the cache is within
+    # the budget. The most recently used pixmap is always kept.
+    #
+    def evict(self):
+        while (self.size > self.budget) and (len(self.pixmaps) > 1):
+            self.size -= self.pixmaps.popitem(last = False)[1][1]
+
+    ## get
+    #
+    # @param key The key for the pixmap, [image key, level].
+    # @param contrast (Optional) The contrast of the pixmap, [minimum, maximum].
+    #
+    # @return The pixmap, or None if the pixmap is not in the cache or is dirty.
+    #
+    def get(self, key, contrast = None):
+        entry = self.pixmaps.pop(key, None)
+        if entry is None:
+            return None
+        if (entry[2] != contrast):
+            self.size -= entry[1]
+            return None
+        self.pixmaps[key] = entry
+        return entry[0]
+
+    ## remove
+    #
+    # @param key The key for the pixmap, [image key, level].
+    #
+    def remove(self, key):
+        entry = self.pixmaps.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    ## setBudget
+    #
+    # @param budget_mb The maximum size of the cached pixmaps in MB.
+    #
+    def setBudget(self, budget_mb):
+        self.budget = budget_mb * 1024 * 1024
+        self.evict()
+
+# The pixmap cache that is shared by all the images.
+pixmap_cache = PixmapCache()
+
+# Unique keys for the images in the pixmap cache.
+image_keys = itertools.count()
+
+
+## createPyramid
+#
+# Creates an image pyramid. Each level is the previous level binned 2x2,
+# until the smaller dimension of the level is less than 2 * min_level_size.
+#
+# @param data The image data (a numpy array).
+#
+# @return A list of the levels, the first level is the image data.
+#
+def createPyramid(data):
+    levels = [data]
+    level = data
+    while (min(level.shape) >= 2 * min_level_size):
+        w = level.shape[0]/2
+        h = level.shape[1]/2
+        binned = level[:2*w,:2*h].astype(numpy.float32).reshape(w, 2, h, 2).mean(axis = 3).mean(axis = 1)
+        level = binned.astype(data.dtype)
+        levels.append(level)
+    return levels
+
+## getLUT
+#
+# Returns the look up table that converts 8 or 16 bit image values
+# to 8 bit values for a contrast. The tables are shared by all the
+# images, so changing the contrast creates (at most) one new table.
+#
+# @param pixmap_min The image value that is 0.
+# @param pixmap_max The image value that is 255.
+#
+# @return The look up table (a numpy uint8 array with 65536 elements).
+#
+def getLUT(pixmap_min, pixmap_max):
+    key = (pixmap_min, pixmap_max)
+    lut = luts.pop(key, None)
+    if lut is None:
+        lut = numpy.arange(65536, dtype = numpy.float32)
+        lut = 255.0 * (lut - float(pixmap_min))/float(max(pixmap_max - pixmap_min, 1))
+        lut = numpy.clip(lut, 0.0, 255.0).astype(numpy.uint8)
+        while (len(luts) >= max_luts):
+            luts.popitem(last = False)
+    luts[key] = lut
+    return lut
+
+## loadMosaicTile
+#
+# Loads a tile from a single file mosaic, this is called by the mosaic loader threads.
+# Only the lower resolution levels are kept, the image data is read again if it is needed.
+#
+# @param mosaic_file A mosaicFile.MosaicFile object.
+# @param index The index of the tile.
+#
+# @return [the viewImageItem state (without the data), the image pyramid].
+#
+def loadMosaicTile(mosaic_file, index):
+    levels = createPyramid(mosaic_file.getTileData(index))
+    levels[0] = False
+    return [mosaic_file.getTileState(index), levels]
+
+## loadStvFile
+#
+# Loads a (pickled) viewImageItem, this is called by the mosaic loader threads.
+#
+# @param filename The name of the .stv file.
+#
+# @return [the viewImageItem state, the image pyramid].
+#
+def loadStvFile(filename):
+    with open(filename) as fp:
+        state = pickle.load(fp)
+    return [state, createPyramid(state["data"])]
+
 
 ## MultifieldView
 #
@@ -39,12 +217,25 @@ class MultifieldView(QtGui.QGraphicsView):
         self.currentz = 0.0
         self.directory = ""
         self.image_items = []
+        self.load_threads = parameters.get("mosaic_load_threads", 4)
+        self.loaders = []
         self.margin = 8000.0
+        self.mosaic_file = None
+        self.mosaic_file_keys = set()
         self.scene_rect = [-self.margin, -self.margin, self.margin, self.margin]
         self.view_scale = 1.0
         self.zoom_in = 1.2
         self.zoom_out = 1.0/self.zoom_in
 
+        pixmap_cache.setBudget(parameters.get("pixmap_cache_mb", 512))
+
+        # The index of the single file mosaic is written when no new
+        # images have been added for a while.
+        self.index_timer = QtCore.QTimer(self)
+        self.index_timer.setInterval(2000)
+        self.index_timer.setSingleShot(True)
+        self.index_timer.timeout.connect(self.handleIndexTimer)
+
         self.setMinimumSize(QtCore.QSize(200, 200))
 
         # background brush
@@ -58,9 +249,21 @@ class MultifieldView(QtGui.QGraphicsView):
         self.setMouseTracking(True)
         self.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
 
+    ## addImageItem
+    #
+    # Adds a viewImageItem to the QGraphicsScene.
+    #
+    # @param image_item A viewImageItem.
+    #
+    def addImageItem(self, image_item):
+        self.image_items.append(image_item)
+        self.scene.addItem(image_item)
+
     ## addViewImageItem
     #
-    # Adds a ViewImageItem to the QGraphicsScene.
+    # Adds a ViewImageItem to the QGraphicsScene, and to the end of the
+    # current single file mosaic (if there is one). Only these (new)
+    # images are added to the file, not the images that are loaded.
     #
     # We don't use the image objects x and y fields for positioning the image as these give the location
     # of the center of the image and the QGraphicsScene uses the upper left corner of the image.
@@ -79,14 +282,19 @@ class MultifieldView(QtGui.QGraphicsView):
         a_image_item.initializeWithImageObject(image)
 
         # add the item
-        self.image_items.append(a_image_item)
-        self.scene.addItem(a_image_item)
+        self.addImageItem(a_image_item)
+        if self.mosaic_file is not None:
+            self.mosaic_file.addTile(a_image_item.getState())
+            self.mosaic_file_keys.add(a_image_item.key)
+            self.index_timer.start()
         self.centerOn(x_pix, y_pix)
         self.updateSceneRect(x_pix, y_pix)
 
     ## changeContrast
     #
-    # Change the contrast of all image items
+    # Change the contrast of all image items. The pixmaps of the images are
+    # only re-created when they are drawn, so this only takes time for the
+    # images that are visible.
     #
     # @param contrast_range The new minimum and maximum contrast values (which will control what is set to 0 and to 255)
     #
@@ -94,7 +302,7 @@ class MultifieldView(QtGui.QGraphicsView):
         for item in self.image_items:
             item.pixmap_min = contrast_range[0]
             item.pixmap_max = contrast_range[1]
-            item.createPixmap()
+        self.scene.update()
 
     ## changeImageMagnifications
     #
@@ -134,14 +342,23 @@ class MultifieldView(QtGui.QGraphicsView):
 
     ## clearMosaic
     #
-    # Removes all the viewImageItems from the QGraphicsScene.
+    # Removes all the viewImageItems from the QGraphicsScene. This also
+    # stops loading mosaics and closes the current single file mosaic (if
+    # there is one).
     #
     def clearMosaic(self):
+        for [loader, progress_bar, use_file] in self.loaders:
+            loader.cancel()
         for image_item in self.image_items:
+            image_item.invalidatePixmaps()
             self.scene.removeItem(image_item)
         #self.initSceneRect()
         self.currentz = 0.0
         self.image_items = []
+        if self.mosaic_file is not None:
+            self.mosaic_file.close()
+            self.mosaic_file = None
+        self.mosaic_file_keys = set()
 
     ## getContrast
     #
@@ -162,16 +379,75 @@ class MultifieldView(QtGui.QGraphicsView):
     def getImageItems(self):
         return self.image_items
 
+    ## handleIndexTimer
+    #
+    # Writes the index of the single file mosaic (if it has changed).
+    #
+    def handleIndexTimer(self):
+        if self.mosaic_file is not None:
+            self.mosaic_file.updateIndex()
+
+    ## handleLoadingDone
+    #
+    # Called when a mosaic loader is done. If a single file mosaic was loaded
+    # completely into an empty scene, the new images that are taken are also
+    # added to this file.
+    #
+    # @param loader A mosaicLoader.MosaicLoader object.
+    #
+    def handleLoadingDone(self, loader):
+        for entry in self.loaders:
+            if (entry[0] == loader):
+                [loader, progress_bar, use_file] = entry
+                self.loaders.remove(entry)
+                progress_bar.close()
+                if use_file and loader.isComplete() and (len(self.image_items) == loader.getNumberTiles()):
+                    self.image_items.sort(key = lambda x: x.mosaic_index)
+                    self.mosaic_file = loader.source
+                    self.mosaic_file_keys = set(item.key for item in self.image_items)
+                break
+
     ## handleRemoveLastItem
     #
-    # Removes the last viewImageItem that was added to the scene.
+    # Removes the last viewImageItem that was added to the scene, and
+    # from the single file mosaic if it is in the file.
     #
     # @param boolean Dummy parameter.
     #
     def handleRemoveLastItem(self, boolean):
         if(len(self.image_items) > 0):
             item = self.image_items.pop()
+            item.invalidatePixmaps()
             self.scene.removeItem(item)
+            if (item.key in self.mosaic_file_keys):
+                self.mosaic_file_keys.remove(item.key)
+                self.mosaic_file.removeLastTile()
+
+    ## handleTileLoaded
+    #
+    # Adds a tile from a mosaic loader to the scene. If the scene was empty
+    # when loading started the view is centered on the first tile.
+    #
+    # @param loader A mosaicLoader.MosaicLoader object.
+    # @param index The index of the tile.
+    # @param tile [the viewImageItem state, the image pyramid].
+    #
+    def handleTileLoaded(self, loader, index, tile):
+        [state, levels] = tile
+        a_image_item = viewImageItem(0, 0, 0, 0, "na", 1.0, 0.0)
+        if loader.source is not None:
+            a_image_item.initializeWithMosaicFile(loader.source, index, levels)
+        else:
+            a_image_item.setState(state, levels)
+        a_image_item.mosaic_index = index
+
+        self.addImageItem(a_image_item)
+        self.updateSceneRect(a_image_item.x_pix, a_image_item.y_pix)
+        for [a_loader, progress_bar, use_file] in self.loaders:
+            if (a_loader == loader):
+                progress_bar.setValue(loader.n_done)
+                if use_file and (loader.n_loaded == 1):
+                    self.centerOn(a_image_item.x_pix, a_image_item.y_pix)
 
 #    def initSceneRect(self):
 #        self.scene_rect = [-self.margin, -self.margin, self.margin, self.margin]
@@ -185,6 +461,26 @@ class MultifieldView(QtGui.QGraphicsView):
         # this allows keyboard scrolling to work
         QtGui.QGraphicsView.keyPressEvent(self, event)
 
+    ## loadFromMosaicFile
+    #
+    # Starts loading the tiles of a single file mosaic in the background, the
+    # tiles closest to the center of the view are loaded first.
+    #
+    # @param mosaic_file A mosaicFile.MosaicFile object.
+    #
+    def loadFromMosaicFile(self, mosaic_file):
+        center = self.mapToScene(self.viewport().rect().center())
+        tasks = []
+        priorities = []
+        for i in range(mosaic_file.getNumberTiles()):
+            state = mosaic_file.getTileState(i)
+            shape = mosaic_file.getTileShape(i)
+            dx = state["x_pix"] + state["x_offset_pix"] + 0.5 * shape[0] / state["magnification"] - center.x()
+            dy = state["y_pix"] + state["y_offset_pix"] + 0.5 * shape[1] / state["magnification"] - center.y()
+            tasks.append(functools.partial(loadMosaicTile, mosaic_file, i))
+            priorities.append(dx * dx + dy * dy)
+        self.loadTiles(tasks, priorities, mosaic_file)
+
     ## loadFromMosaicFileData
     #
     # This is called when we are loading a previously saved mosaic.
@@ -200,8 +496,7 @@ class MultifieldView(QtGui.QGraphicsView):
             a_image_item = viewImageItem(0, 0, 0, 0, "na", 1.0, 0.0)
             a_image_item.setState(image_dict)
 
-            self.image_items.append(a_image_item)
-            self.scene.addItem(a_image_item)
+            self.addImageItem(a_image_item)
             self.centerOn(a_image_item.x_pix, a_image_item.y_pix)
             self.updateSceneRect(a_image_item.x_pix, a_image_item.y_pix)        
 
@@ -209,6 +504,46 @@ class MultifieldView(QtGui.QGraphicsView):
         else:
             return False
 
+    ## loadFromStvFiles
+    #
+    # Starts loading (pickled) viewImageItems in the background. The position
+    # of the images is not known until they are loaded, so they are loaded in order.
+    #
+    # @param filenames A list of .stv file names.
+    #
+    def loadFromStvFiles(self, filenames):
+        self.loadTiles(map(lambda x: functools.partial(loadStvFile, x), filenames), range(len(filenames)))
+
+    ## loadTiles
+    #
+    # Starts a mosaic loader. The tiles are added to the scene as they are loaded.
+    #
+    # @param tasks A list of functions that load a tile.
+    # @param priorities A list of the priorities of the tasks, lower values are loaded first.
+    # @param mosaic_file (Optional) The mosaicFile.MosaicFile object the tiles are loaded from, defaults to None.
+    #
+    def loadTiles(self, tasks, priorities, mosaic_file = None):
+        if (len(tasks) == 0):
+            return
+        use_file = (len(self.image_items) == 0) and (self.mosaic_file is None)
+        if mosaic_file is not None:
+            use_file = use_file and not mosaic_file.read_only
+
+        loader = mosaicLoader.MosaicLoader(tasks, priorities, mosaic_file, self.load_threads, self)
+        loader.loadingDone.connect(self.handleLoadingDone)
+        loader.tileLoaded.connect(self.handleTileLoaded)
+
+        progress_bar = QtGui.QProgressDialog("Loading Mosaic...",
+                                             "Abort Load",
+                                             0,
+                                             len(tasks),
+                                             self)
+        progress_bar.setWindowModality(QtCore.Qt.NonModal)
+        progress_bar.canceled.connect(loader.cancel)
+
+        self.loaders.append([loader, progress_bar, use_file])
+        loader.start()
+
     ## mousePressEvent
     #
     # If the left mouse button was pressed, center the scene on the location where the button
@@ -252,6 +587,45 @@ class MultifieldView(QtGui.QGraphicsView):
 
         progress_bar.close()
 
+    ## saveToMosaicContainer
+    #
+    # Saves all the viewImageItems in the scene into a (new) single file mosaic.
+    # The caller is responsible for adding the other elements of the mosaic and
+    # writing the index. If the save completes new images are also added to
+    # this file.
+    #
+    # @param filename The name of the single file mosaic.
+    #
+    # @return A mosaicFile.MosaicFile object.
+    #
+    def saveToMosaicContainer(self, filename):
+        progress_bar = QtGui.QProgressDialog("Saving Files...",
+                                             "Abort Save",
+                                             0,
+                                             len(self.image_items),
+                                             self)
+        progress_bar.setWindowModality(QtCore.Qt.WindowModal)
+
+        # The images could still be using the file that we are about to overwrite.
+        for item in self.image_items:
+            item.getData()
+        if self.mosaic_file is not None:
+            self.mosaic_file.close()
+            self.mosaic_file = None
+        self.mosaic_file_keys = set()
+
+        mosaic_file = mosaicFile.MosaicFile(filename, create = True)
+        for i, item in enumerate(self.image_items):
+            progress_bar.setValue(i)
+            if progress_bar.wasCanceled(): break
+            mosaic_file.addTile(item.getState())
+
+        if (mosaic_file.getNumberTiles() == len(self.image_items)):
+            self.mosaic_file = mosaic_file
+            self.mosaic_file_keys = set(item.key for item in self.image_items)
+        progress_bar.close()
+        return mosaic_file
+
     ## setScale
     #
     # Sets the current scale of the view.
@@ -338,10 +712,13 @@ class viewImageItem(QtGui.QGraphicsItem):
 
         self.data = False
         self.height = 0
+        self.key = next(image_keys)
+        self.levels = []
         self.magnification = magnification
+        self.mosaic_file = None
+        self.mosaic_index = 0
         self.objective_name = str(objective_name)
         self.parameters_file = ""
-        self.pixmap = False
         self.pixmap_min = 0
         self.pixmap_max = 0
         self.version = "0.0"
@@ -359,33 +736,77 @@ class viewImageItem(QtGui.QGraphicsItem):
     # @return QtCore.QRectF containing the size of the image.
     #
     def boundingRect(self):
-        return QtCore.QRectF(0, 0, self.pixmap.width(), self.pixmap.height())
+        shape = self.getShape()
+        return QtCore.QRectF(0, 0, shape[0], shape[1])
+
+    ## createLevels
+    #
+    # Creates the image pyramid.
+    #
+    def createLevels(self):
+        self.levels = createPyramid(self.getData())
 
     ## createPixmap
     #
-    # Converts the numpy image from HAL to a QtGui.QPixmap.
+    # Converts a level of the numpy image from HAL to a QtGui.QPixmap.
+    #
+    # @param level (Optional) The level in the image pyramid, defaults to 0 (full resolution).
+    #
+    # @return A QtGui.QPixmap.
     #
-    def createPixmap(self):
+    def createPixmap(self, level = 0):
         
         # This just undoes the transpose that we applied when the image was loaded. It might
         # make more sense not to transpose the image in the first place, but this is the standard
         # for the storm-analysis project so we maintain that here.
-        frame = numpy.transpose(self.data.copy())
+        data = self.levels[level]
+        if data is False:
+            data = self.getData()
+        frame = numpy.transpose(data)
 
-        # Rescale & convert to 8bit
-        frame = numpy.ascontiguousarray(frame, dtype = numpy.float32)
-        frame = 255.0 * (frame - float(self.pixmap_min))/float(self.pixmap_max - self.pixmap_min)
-        frame[(frame > 255.0)] = 255.0
-        frame[(frame < 0.0)] = 0.0
-        frame = frame.astype(numpy.uint8)
+        # Rescale & convert to 8bit, using the shared look up table for 8 and 16 bit images.
+        # The camera images are unsigned 16 bit values that were cast to int16 when they
+        # were loaded (see capture.py), viewing them as uint16 undoes this.
+        if (data.dtype == numpy.int16):
+            frame = frame.view(numpy.uint16)
+        if (frame.dtype == numpy.uint8) or (frame.dtype == numpy.uint16):
+            frame = numpy.ascontiguousarray(getLUT(self.pixmap_min, self.pixmap_max)[frame])
+        else:
+            frame = numpy.ascontiguousarray(frame, dtype = numpy.float32)
+            frame = 255.0 * (frame - float(self.pixmap_min))/float(self.pixmap_max - self.pixmap_min)
+            frame[(frame > 255.0)] = 255.0
+            frame[(frame < 0.0)] = 0.0
+            frame = frame.astype(numpy.uint8)
 
-        # Create the pixmap
+        # Create the pixmap, the lines of the smaller levels are not always 32 bit aligned.
         w, h = frame.shape
-        image = QtGui.QImage(frame.data, h, w, QtGui.QImage.Format_Indexed8)
+        image = QtGui.QImage(frame.data, h, w, frame.strides[0], QtGui.QImage.Format_Indexed8)
         image.ndarray = frame
-        for i in range(256):
-            image.setColor(i, QtGui.QColor(i,i,i).rgb())
-        self.pixmap = QtGui.QPixmap.fromImage(image)
+        image.setColorTable(gray_table)
+        return QtGui.QPixmap.fromImage(image)
+
+    ## getData
+    #
+    # Images from a single file mosaic only read their data when it is first needed.
+    #
+    # @return The image data (a numpy array).
+    #
+    def getData(self):
+        if self.data is False and self.mosaic_file is not None:
+            self.data = self.mosaic_file.getTileData(self.mosaic_index)
+            self.mosaic_file = None
+        return self.data
+
+    ## getLevel
+    #
+    # @param level_of_detail The scale at which the image is drawn, 1.0 is one screen pixel per image pixel.
+    #
+    # @return The lowest resolution level of the image pyramid that has at least this much detail.
+    #
+    def getLevel(self, level_of_detail):
+        if (level_of_detail >= 1.0) or (level_of_detail <= 0.0):
+            return 0
+        return min(int(math.floor(-math.log(level_of_detail, 2))), len(self.levels) - 1)
 
     ## getMagnification
     #
@@ -412,10 +833,19 @@ class viewImageItem(QtGui.QGraphicsItem):
 
     ## getPixmap
     #
-    # @return The image as a QtGui.QPixmap.
+    # @param level (Optional) The level in the image pyramid, defaults to 0 (full resolution).
+    #
+    # @return The level of the image as a QtGui.QPixmap, from the pixmap cache if possible.
     #
-    def getPixmap(self):
-        return self.pixmap
+    def getPixmap(self, level = 0):
+        contrast = [self.pixmap_min, self.pixmap_max]
+        pixmap = pixmap_cache.get((self.key, level), contrast)
+        if pixmap is None:
+            if (len(self.levels) == 0):
+                self.createLevels()
+            pixmap = self.createPixmap(level)
+            pixmap_cache.add((self.key, level), pixmap, contrast)
+        return pixmap
 
     ## getPositionUm
     #
@@ -424,15 +854,26 @@ class viewImageItem(QtGui.QGraphicsItem):
     def getPositionUm(self):
         return [self.x_um, self.y_um]
 
+    ## getShape
+    #
+    # @return The shape of the image data, without reading the data.
+    #
+    def getShape(self):
+        if self.data is False and self.mosaic_file is not None:
+            return self.mosaic_file.getTileShape(self.mosaic_index)
+        return self.data.shape
+
     ## getState
     #
     # This is used to pickle objects of this class.
     #
-    # @return The dictionary for this object, with 'pixmap' element removed.
+    # @return The dictionary for this object, without the elements that are not saved.
     #
     def getState(self):
+        self.getData()
         odict = self.__dict__.copy()
-        del odict['pixmap']
+        for name in ['key', 'levels', 'mosaic_file', 'mosaic_index']:
+            del odict[name]
         return odict
 
     ## initializeWithImageObject
@@ -450,7 +891,7 @@ class viewImageItem(QtGui.QGraphicsItem):
         self.width = image.width
         self.x_um = image.x_um
         self.y_um = image.y_um
-        self.createPixmap()
+        self.createLevels()
 
         self.setPixmapGeometry()
 
@@ -463,16 +904,51 @@ class viewImageItem(QtGui.QGraphicsItem):
     def initializeWithLegacyMosaicFormat(self, legacy_text):
         pass
 
+    ## initializeWithMosaicFile
+    #
+    # Set member variables from a tile of a single file mosaic. The data
+    # is read from the file when it is needed.
+    #
+    # @param mosaic_file A mosaicFile.MosaicFile object.
+    # @param index The index of the tile.
+    # @param levels (Optional) The image pyramid, the first level can be False as the data is not loaded.
+    #
+    def initializeWithMosaicFile(self, mosaic_file, index, levels = None):
+        self.__dict__.update(mosaic_file.getTileState(index))
+        self.data = False
+        self.mosaic_file = mosaic_file
+        self.mosaic_index = index
+        if levels is not None:
+            self.levels = levels
+        self.setPixmapGeometry()
+
+    ## invalidatePixmaps
+    #
+    # Removes the pixmaps of this image from the pixmap cache, this is used
+    # when the image is removed from the scene.
+    #
+    def invalidatePixmaps(self):
+        for level in range(len(self.levels)):
+            pixmap_cache.remove((self.key, level))
+        self.update()
+
     ## paint
     #
-    # Called by PyQt to render the image.
+    # Called by PyQt to render the image. This draws the level of the image
+    # pyramid that matches the current scale (including the magnification),
+    # scaled up to the size of the full resolution image.
     #
     # @param painter A QPainter object.
     # @param option A QStyleOptionGraphicsItem object.
     # @param widget A QWidget object.
     #
     def paint(self, painter, option, widget):
-        painter.drawPixmap(0, 0, self.pixmap)
+        level = self.getLevel(option.levelOfDetailFromTransform(painter.worldTransform()))
+        pixmap = self.getPixmap(level)
+        scale = 2**level
+        painter.drawPixmap(QtCore.QRectF(0, 0, scale * pixmap.width(), scale * pixmap.height()),
+                           pixmap,
+                           QtCore.QRectF(0, 0, pixmap.width(), pixmap.height()))
 
     ## setPixmapGeometry
     #
@@ -510,10 +986,14 @@ class viewImageItem(QtGui.QGraphicsItem):
     # This is used to unpickle objects of this class.
     #
     # @param image_dict A dictionary that defines the object members.
+    # @param levels (Optional) The image pyramid, if this is not specified it is created.
     #
-    def setState(self, image_dict):
+    def setState(self, image_dict, levels = None):
         self.__dict__.update(image_dict)
-        self.createPixmap()
+        if levels is None:
+            self.createLevels()
+        else:
+            self.levels = levels
         self.setPixmapGeometry()
 
     ## setXOffset
@@ -14,6 +14,7 @@
 import os
 import sys
 import re
+import time
 from PyQt4 import QtCore, QtGui
 
 # Debugging
@@ -35,6 +36,7 @@ import capture
 
 # Misc
 import coord
+import mosaicFile
 import sc_library.parameters as params
 
 class AdjustContrastDialog(QtGui.QDialog, AdjustContrastDialog_Ui):
@@ -170,16 +172,20 @@ class Window(QtGui.QMainWindow):
         coord.Point.pixels_to_um = 1.0
 
         # variables
+        self.capture_in_flight = False
+        self.capture_start_time = 0.0
         self.current_center = coord.Point(0.0, 0.0, "um")
         self.current_offset = coord.Point(0.0, 0.0, "um")
         self.debug = parameters.debug
         self.file_filter = "\S+.dax"
+        self.last_tile = None
         self.parameters = parameters
         self.picture_queue = []
         self.regexp_str = ""
         self.requested_stage_pos = False
         self.stage_tracking_timer = QtCore.QTimer(self)
         self.taking_pictures = False
+        self.tiles_taken = 0
         self.snapshot_directory = self.parameters.directory
         self.spin_boxes = []
         self.stage_tracking_timer.setInterval(500)
@@ -270,6 +276,7 @@ class Window(QtGui.QMainWindow):
         self.comm.captureComplete.connect(self.addImage)
         self.comm.changeObjective.connect(self.handleChangeObjective)
         self.comm.disconnected.connect(self.handleDisconnected)
+        self.comm.exposureComplete.connect(self.handleExposureComplete)
         self.comm.getPositionComplete.connect(self.handleGetPositionComplete)
         self.comm.newObjectiveData.connect(self.handleNewObjectiveData)
         self.comm.otherComplete.connect(self.handleOtherComplete)
@@ -292,6 +299,8 @@ class Window(QtGui.QMainWindow):
 
         # If image is not an object then we are done.
         if not image:
+            self.capture_in_flight = False
+            self.picture_queue = []
             self.toggleTakingPicturesStatus(False)
             self.comm.commDisconnect()
             return
@@ -302,22 +311,10 @@ class Window(QtGui.QMainWindow):
         self.current_offset = coord.Point(x_offset, y_offset, "um")
         self.view.addImage(image, objective, magnification, self.current_offset)
         self.view.setCrosshairPosition(image.x_pix, image.y_pix)
-        if (len(self.picture_queue) > 0):
-            next_item = self.picture_queue[0]
-            if (type(next_item) == type(coord.Point(0,0,"um"))):
-                self.setCenter(next_item)
-                next_x_um = self.current_center.x_um
-                next_y_um = self.current_center.y_um
-            else:
-                [tx, ty] = next_item
-                next_x_um = self.current_center.x_um + 0.95 * float(image.width) * coord.Point.pixels_to_um * tx / magnification
-                next_y_um = self.current_center.y_um + 0.95 * float(image.height) * coord.Point.pixels_to_um * ty / magnification
-            self.picture_queue = self.picture_queue[1:]
-            self.comm.captureStart(next_x_um, next_y_um)
-        else:
-            if self.taking_pictures:
-                self.toggleTakingPicturesStatus(False)
-                self.comm.commDisconnect()
+        self.last_tile = [image.width, image.height, magnification]
+        if self.taking_pictures:
+            self.tiles_taken += 1
+        self.takeNextPicture()
 
     ## addPositions
     #
@@ -338,11 +335,11 @@ class Window(QtGui.QMainWindow):
 
     ## cleanUp
     #
-    # Called at closing, currently does nothing.
+    # Called at closing, this writes the index of the single file mosaic (if any).
     #
     @hdebug.debug
     def cleanUp(self):
-        pass
+        self.view.handleIndexTimer()
 
     ## closeEvent
     #
@@ -408,7 +405,7 @@ class Window(QtGui.QMainWindow):
             for filename in filenames:
                 filenameList.append(filename)
             self.loadDax(filenameList)
-        elif (firstType == '.msc'): # Load mosaics
+        elif (firstType in ['.msc', '.smc']): # Load mosaics
             for filename in sorted(filenames):
                 self.loadMosaic(filename)
         else:
@@ -490,8 +487,21 @@ class Window(QtGui.QMainWindow):
     #
     @hdebug.debug
     def handleDisconnected(self):
+        self.capture_in_flight = False
         self.toggleTakingPicturesStatus(False)
 
+    ## handleExposureComplete
+    #
+    # Handles the exposureComplete signal from the capture.Capture object. In
+    # the pipelined mode this starts taking the next image while the current
+    # image is read.
+    #
+    @hdebug.debug
+    def handleExposureComplete(self):
+        self.capture_in_flight = False
+        if self.comm.pipelined:
+            self.takeNextPicture()
+
     ## handleGetObjective
     #
     @hdebug.debug
@@ -575,7 +585,7 @@ class Window(QtGui.QMainWindow):
         mosaic_filename = str(QtGui.QFileDialog.getOpenFileName(self,
                                                                 "Load Mosaic",
                                                                 self.parameters.directory,
-                                                                "*.msc"))    
+                                                                "*.smc *.msc"))    
         self.loadMosaic(mosaic_filename)
 
     ## handleLoadMovie
@@ -675,7 +685,8 @@ class Window(QtGui.QMainWindow):
 
     ## handleSaveMosaic
     #
-    # Handles the save mosaic action.
+    # Handles the save mosaic action. Mosaics are saved as a single file
+    # (.smc) unless the file name ends with .msc.
     #
     # @param boolean Dummy parameter.
     #
@@ -684,8 +695,15 @@ class Window(QtGui.QMainWindow):
         mosaic_filename = str(QtGui.QFileDialog.getSaveFileName(self,
                                                                 "Save Mosaic", 
                                                                 self.parameters.directory,
-                                                                "*.msc"))
-        if mosaic_filename:
+                                                                "*.smc;;*.msc"))
+        if mosaic_filename and (os.path.splitext(mosaic_filename)[1] != ".msc"):
+            if (os.path.splitext(mosaic_filename)[1] != ".smc"):
+                mosaic_filename += ".smc"
+            mosaic_file = self.view.saveToMosaicContainer(mosaic_filename)
+            self.positions.saveToMosaicFile(mosaic_file, mosaic_filename)
+            self.sections.saveToMosaicFile(mosaic_file, mosaic_filename)
+            mosaic_file.writeIndex()
+        elif mosaic_filename:
             mosaic_fileptr = open(mosaic_filename, "w")
             self.view.saveToMosaicFile(mosaic_fileptr, mosaic_filename)
             self.positions.saveToMosaicFile(mosaic_fileptr, mosaic_filename)
@@ -821,56 +839,46 @@ class Window(QtGui.QMainWindow):
         
     ## loadMosaic
     #
-    # Handles the load mosaic action.
+    # Handles the load mosaic action. This loads both single file mosaics
+    # (.smc) and mosaics in the original format (.msc). The images are
+    # loaded in the background, the positions and sections are loaded
+    # immediately.
     #
-    # @param boolean Dummy parameter.
+    # @param mosaic_filename The name of the mosaic file.
     #
     @hdebug.debug
     def loadMosaic(self, mosaic_filename):
-        if mosaic_filename:
-            legacy_format = True
-            dirname = os.path.dirname(mosaic_filename)
-
-            mosaic_fp = open(mosaic_filename, "r")
-
-            # First, figure out file size
-            mosaic_fp.readline()
-            number_lines = 0
-            while 1:
-                line = mosaic_fp.readline()
-                if not line: break
-                number_lines += 1
-            mosaic_fp.seek(0)
-
-            # Create progress bar
-            progress_bar = QtGui.QProgressDialog("Load Files...",
-                                                 "Abort Load",
-                                                 0,
-                                                 number_lines,
-                                                 self)
-            progress_bar.setWindowModality(QtCore.Qt.WindowModal)
-
+        if mosaic_filename and mosaicFile.isMosaicFile(mosaic_filename):
+            mosaic_file = mosaicFile.MosaicFile(mosaic_filename)
+            self.view.loadFromMosaicFile(mosaic_file)
             mosaic_dirname = os.path.dirname(mosaic_filename)
-            file_number = 1
-            while 1:
-                if progress_bar.wasCanceled(): break
-                line = mosaic_fp.readline().rstrip()
-                if not line: break
+            for line in mosaic_file.getElements():
                 data = line.split(",")
-                if (self.view.loadFromMosaicFileData(data, mosaic_dirname)):
-                    legacy_format = False
-                elif (self.positions.loadFromMosaicFileData(data, mosaic_dirname)):
-                    legacy_format = False
-                elif (self.sections.loadFromMosaicFileData(data, mosaic_dirname)):
-                    legacy_format = False
-                else:
+                if not (self.positions.loadFromMosaicFileData(data, mosaic_dirname) or
+                        self.sections.loadFromMosaicFileData(data, mosaic_dirname)):
                     print "Unrecognized scene element:", data[0]
-                
-                progress_bar.setValue(file_number)
-                file_number += 1
 
-            progress_bar.close()
-            mosaic_fp.close()
+        elif mosaic_filename:
+            legacy_format = True
+            mosaic_dirname = os.path.dirname(mosaic_filename)
+
+            stv_filenames = []
+            with open(mosaic_filename, "r") as mosaic_fp:
+                for line in mosaic_fp:
+                    line = line.rstrip()
+                    if not line: break
+                    data = line.split(",")
+                    if (data[0] == "image"):
+                        stv_filenames.append(mosaic_dirname + "/" + data[1])
+                        legacy_format = False
+                    elif (self.positions.loadFromMosaicFileData(data, mosaic_dirname)):
+                        legacy_format = False
+                    elif (self.sections.loadFromMosaicFileData(data, mosaic_dirname)):
+                        legacy_format = False
+                    else:
+                        print "Unrecognized scene element:", data[0]
+
+            self.view.loadFromStvFiles(stv_filenames)
 
             if legacy_format:
                 # load older data formats here..
@@ -912,24 +920,78 @@ class Window(QtGui.QMainWindow):
             self.ui.yStartPosSpinBox.setValue(pointInUm[1])
             
             # Set picture queue and start imaging
+            self.last_tile = None
             self.picture_queue = picture_list[1:]
             self.toggleTakingPicturesStatus(True)
             
             self.comm.commConnect()
             if self.comm.setDirectory(self.parameters.directory):
+                self.capture_in_flight = True
                 self.comm.captureStart(self.current_center.x_um, self.current_center.y_um)
             else:
                 self.toggleTakingPicturesStatus(False)
                 self.picture_queue = []
 
+    ## takeNextPicture
+    #
+    # Starts taking the next picture in self.picture_queue (if any), or finishes
+    # taking pictures when the queue is empty and all the pictures have been read.
+    #
+    # Pictures at relative positions need the size of the previous picture, so in
+    # the pipelined mode these have to wait until the first picture has been read.
+    #
+    @hdebug.debug
+    def takeNextPicture(self):
+        if self.capture_in_flight or (self.comm.getNumberPendingReads() > 1):
+            return
+
+        if (len(self.picture_queue) > 0):
+            next_item = self.picture_queue[0]
+            if (type(next_item) == type(coord.Point(0,0,"um"))):
+                self.setCenter(next_item)
+                next_x_um = self.current_center.x_um
+                next_y_um = self.current_center.y_um
+            else:
+                if self.last_tile is None:
+                    return
+                [width, height, magnification] = self.last_tile
+                [tx, ty] = next_item
+                next_x_um = self.current_center.x_um + 0.95 * float(width) * coord.Point.pixels_to_um * tx / magnification
+                next_y_um = self.current_center.y_um + 0.95 * float(height) * coord.Point.pixels_to_um * ty / magnification
+            self.picture_queue = self.picture_queue[1:]
+            self.capture_in_flight = True
+            self.comm.captureStart(next_x_um, next_y_um)
+        else:
+            if self.taking_pictures and (self.comm.getNumberPendingReads() == 0):
+                self.toggleTakingPicturesStatus(False)
+                self.comm.commDisconnect()
+
     ## toggleTakingPicturesStatus
     #
     # Takes pictures at the specified absolute or relative positions.
     #
+    # When taking pictures stops this reports how many pictures were taken per minute.
+    #
     # @param status A boolean determining the imaging status.
     #
     @hdebug.debug
     def toggleTakingPicturesStatus(self, status):
+        if status:
+            self.capture_start_time = time.time()
+            self.tiles_taken = 0
+        elif self.taking_pictures and (self.tiles_taken > 0):
+            elapsed = time.time() - self.capture_start_time
+            if self.comm.pipelined:
+                mode = "pipelined"
+            else:
+                mode = "serial"
+            message = "{0:d} tiles in {1:.1f}s, {2:.1f} tiles/minute ({3:s})".format(self.tiles_taken,
+                                                                                    elapsed,
+                                                                                    60.0 * self.tiles_taken / max(elapsed, 1.0e-3),
+                                                                                    mode)
+            print message
+            hdebug.logText(message)
+            self.ui.statusbar.showMessage(message)
         self.taking_pictures = status
         self.ui.xSpinBox.setEnabled(not status)
         self.ui.ySpinBox.setEnabled(not status)
@@ -981,7 +1043,7 @@ if __name__ == "__main__":
         parameters = params.parameters("settings_default.xml")
 
     # Start logger.
-    hdebug.startLogging(parameters.directory + "logs/", "steve")
+    hdebug.startLogging(parameters.directory + "logs/", "steve", trace = parameters.get("want_trace", False))
 
     # Load app.
     window = Window(parameters)
@@ -16,6 +16,8 @@ import scipy
 import scipy.optimize
 import struct
 
+import sc_library.offsetFile as offsetFile
+
 #
 # different power z calibration functions
 #
@@ -587,7 +589,7 @@ class ZCalibration():
     # to in nm. As a side effect this also figures out what the "good"
     # range of the data is, i.e. where the stage was moving.
     #
-    # @param filename The name of the offset file.
+    # @param filename The name of the offset file (text or binary).
     #
     # @return True/False If everything worked (or not).
     #
@@ -595,18 +597,18 @@ class ZCalibration():
 
         # load offset information
         try:
-            if os.path.exists(filename[:-9] + ".off"):
-                self.offsets = numpy.loadtxt(filename[:-9] + ".off",
-                                             skiprows = 1)
-            elif os.path.exists(filename[:-10] + ".off"):
-                self.offsets = numpy.loadtxt(filename[:-10] + ".off",
-                                             skiprows = 1)
+            if offsetFile.findOffsetFile(filename[:-9]):
+                data = offsetFile.readOffsetFile(offsetFile.findOffsetFile(filename[:-9]))
+            elif offsetFile.findOffsetFile(filename[:-10]):
+                data = offsetFile.readOffsetFile(offsetFile.findOffsetFile(filename[:-10]))
             else:
-                self.offsets = numpy.loadtxt(filename, skiprows = 1)
+                data = offsetFile.readOffsetFile(filename)
         except:
             return False
 
-        self.offsets = self.offsets[:,1:]
+        self.offsets = numpy.column_stack((data["offset"],
+                                           data["power"],
+                                           data["stage_z"])).astype(numpy.float64)
         self.frames = self.offsets.shape[0]
         self.stage_zero = self.offsets[0,2]
 